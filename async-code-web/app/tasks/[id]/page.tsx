@@ -13,8 +13,8 @@ import { Separator } from "@/components/ui/separator";
 import { ProtectedRoute } from "@/components/protected-route";
 import { useAuth } from "@/contexts/auth-context";
 import { ApiService } from "@/lib/api-service";
-import { Task, Project, ChatMessage } from "@/types";
-import { formatDiff, parseDiffStats } from "@/lib/utils";
+import { Task, Project, ChatMessage, TaskFileEntry, TaskFilePart } from "@/types";
+import { formatDiff } from "@/lib/utils";
 import { DiffViewer } from "@/components/diff-viewer";
 import { toast } from "sonner";
 
@@ -29,7 +29,7 @@ export default function TaskDetailPage() {
     
     const [task, setTask] = useState<TaskWithProject | null>(null);
     const [loading, setLoading] = useState(true);
-    const [gitDiff, setGitDiff] = useState("");
+    const [taskFiles, setTaskFiles] = useState<TaskFileEntry[] | null>(null);
     const [diffStats, setDiffStats] = useState({ additions: 0, deletions: 0, files: 0 });
     const [newMessage, setNewMessage] = useState("");
     const [githubToken, setGithubToken] = useState("");
@@ -59,16 +59,9 @@ export default function TaskDetailPage() {
                 const updatedTask = await ApiService.getTaskStatus(user.id, taskId);
                 setTask(prev => ({ ...prev, ...updatedTask }));
 
-                // Fetch git diff if task completed
-                if (updatedTask.status === "completed" && !gitDiff) {
-                    try {
-                        const diff = await ApiService.getGitDiff(user.id, taskId);
-                        setGitDiff(diff);
-                        const stats = parseDiffStats(diff);
-                        setDiffStats(stats);
-                    } catch (error) {
-                        console.error('Error fetching git diff:', error);
-                    }
+                // Fetch the changed-file index if task completed
+                if (updatedTask.status === "completed" && !taskFiles) {
+                    await loadTaskFiles();
                 }
             } catch (error) {
                 console.error('Error polling task status:', error);
@@ -76,26 +69,20 @@ export default function TaskDetailPage() {
         }, 2000);
 
         return () => clearInterval(interval);
-    }, [task, user?.id, taskId, gitDiff]);
+    }, [task, user?.id, taskId, taskFiles]);
 
     const loadTask = async () => {
         if (!user?.id) return;
         
         try {
             setLoading(true);
-            const taskData = await ApiService.getTask(user.id, taskId);
+            // File contents are loaded per file by the diff viewer
+            const taskData = await ApiService.getTask(user.id, taskId, 'summary');
             setTask(taskData);
 
-            // Load git diff if task is completed
+            // Load the changed-file index if task is completed
             if (taskData?.status === "completed") {
-                try {
-                    const diff = await ApiService.getGitDiff(user.id, taskId);
-                    setGitDiff(diff);
-                    const stats = parseDiffStats(diff);
-                    setDiffStats(stats);
-                } catch (error) {
-                    console.error('Error fetching git diff:', error);
-                }
+                await loadTaskFiles();
             }
         } catch (error) {
             console.error('Error loading task:', error);
@@ -104,6 +91,21 @@ export default function TaskDetailPage() {
         }
     };
 
+    const loadTaskFiles = async () => {
+        if (!user?.id) return;
+
+        try {
+            const index = await ApiService.getTaskFiles(user.id, taskId);
+            setTaskFiles(index.files);
+            setDiffStats(index.stats);
+        } catch (error) {
+            console.error('Error fetching task files:', error);
+        }
+    };
+
+    const loadFile = (path: string, part: TaskFilePart) => ApiService.getTaskFile(user!.id, taskId, path, part);
+    const loadHunks = (path: string) => ApiService.getTaskFileHunks(user!.id, taskId, path);
+
     const handleAddMessage = async () => {
         if (!newMessage.trim() || !user?.id) return;
 
@@ -351,7 +353,7 @@ export default function TaskDetailPage() {
                             </Card>
 
                             {/* Git Diff */}
-                            {gitDiff && (
+                            {taskFiles && taskFiles.length > 0 && (
                                 <Card>
                                     <CardHeader>
                                         <CardTitle className="flex items-center gap-2">
@@ -364,8 +366,9 @@ export default function TaskDetailPage() {
                                     </CardHeader>
                                     <CardContent>
                                         <DiffViewer 
-                                            diff={gitDiff} 
-                                            fileChanges={(task.execution_metadata as any)?.file_changes}
+                                            files={taskFiles}
+                                            loadFile={loadFile}
+                                            loadHunks={loadHunks}
                                             stats={diffStats}
                                         />
                                     </CardContent>
@@ -10,11 +10,14 @@ import { python } from "@codemirror/lang-python";
 import { githubLight } from "@uiw/codemirror-theme-github";
 import { Copy, FileText, ChevronDown, ChevronRight, RotateCcw } from "lucide-react";
 import { Button } from "@/components/ui/button";
-import { FileChange } from "@/types";
+import { DiffHunk, DiffLine, FileChange, TaskFileEntry, TaskFilePart } from "@/types";
 
 interface DiffViewerProps {
     diff?: string; // Legacy git diff for fallback
     fileChanges?: FileChange[];
+    files?: TaskFileEntry[]; // File index; contents are fetched with loadFile when a file is expanded
+    loadFile?: (path: string, part: TaskFilePart) => Promise<string>;
+    loadHunks?: (path: string) => Promise<DiffHunk[] | null>;
     stats?: {
         additions: number;
         deletions: number;
@@ -193,8 +196,177 @@ function FileMergeView({ fileChange }: { fileChange: FileChange }) {
     );
 }
 
+// Files expanded (and loaded) on first render; the others load when the user expands them
+const EAGER_FILES = 3;
+
+const formatBytes = (bytes: number): string => {
+    if (bytes < 1024) return `${bytes} B`;
+    if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+    return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+};
+
+// Line of a precomputed hunk, with its changed words highlighted
+function HunkLine({ line }: { line: DiffLine }) {
+    const [tag, oldNumber, newNumber, text, spans] = line;
+    const rowClass = tag === '+' ? 'bg-green-50' : tag === '-' ? 'bg-red-50' : '';
+    const markClass = tag === '+' ? 'bg-green-200' : 'bg-red-200';
+
+    const pieces: React.ReactNode[] = [];
+    if (spans) {
+        let at = 0;
+        for (let i = 0; i < spans.length; i += 2) {
+            pieces.push(text.slice(at, spans[i]));
+            pieces.push(<mark key={i} className={markClass}>{text.slice(spans[i], spans[i + 1])}</mark>);
+            at = spans[i + 1];
+        }
+        pieces.push(text.slice(at));
+    } else {
+        pieces.push(text);
+    }
+
+    return (
+        <tr className={rowClass}>
+            <td className="select-none text-right text-slate-400 px-2 w-12">{oldNumber ?? ''}</td>
+            <td className="select-none text-right text-slate-400 px-2 w-12">{newNumber ?? ''}</td>
+            <td className="select-none text-slate-500 px-1 w-4">{tag}</td>
+            <td className="whitespace-pre pr-4">{pieces}</td>
+        </tr>
+    );
+}
+
+// Hunks computed by the server: rendering needs no diffing in the browser, however large the file
+function HunkView({ path, hunks, entry }: { path: string; hunks: DiffHunk[]; entry: TaskFileEntry }) {
+    const [isExpanded, setIsExpanded] = useState(true);
+
+    return (
+        <div className="border rounded-lg bg-white shadow-sm">
+            <div className={`px-6 py-4 pb-3 ${isExpanded ? 'border-b' : ''}`}>
+                <div className="flex items-center justify-between">
+                    <div className="flex items-center gap-2 cursor-pointer" onClick={() => setIsExpanded(!isExpanded)}>
+                        {isExpanded ? <ChevronDown className="w-4 h-4" /> : <ChevronRight className="w-4 h-4" />}
+                        <span className="font-mono text-sm">{path}</span>
+                        {entry.status === 'added' && (
+                            <span className="text-xs bg-green-100 text-green-800 px-2 py-1 rounded">NEW</span>
+                        )}
+                        {entry.status === 'deleted' && (
+                            <span className="text-xs bg-red-100 text-red-800 px-2 py-1 rounded">DELETED</span>
+                        )}
+                    </div>
+                    <div className="flex items-center gap-2 text-sm">
+                        <span className="text-green-600 font-mono">+{entry.additions}</span>
+                        <span className="text-red-600 font-mono">-{entry.deletions}</span>
+                    </div>
+                </div>
+            </div>
+            {isExpanded && (
+                <div className="max-h-[500px] overflow-auto">
+                    <table className="w-full font-mono text-[13px] border-collapse">
+                        {hunks.map((hunk, index) => (
+                            <tbody key={index}>
+                                <tr className="bg-slate-50 text-slate-500">
+                                    <td colSpan={4} className="px-2 py-1">{hunk.header}</td>
+                                </tr>
+                                {hunk.lines.map((line, lineIndex) => (
+                                    <HunkLine key={lineIndex} line={line} />
+                                ))}
+                            </tbody>
+                        ))}
+                    </table>
+                </div>
+            )}
+        </div>
+    );
+}
+
+// File from the index whose contents are fetched the first time it is expanded
+function LazyFileView({ entry, loadFile, loadHunks, initiallyExpanded }: {
+    entry: TaskFileEntry;
+    loadFile: (path: string, part: TaskFilePart) => Promise<string>;
+    loadHunks?: (path: string) => Promise<DiffHunk[] | null>;
+    initiallyExpanded: boolean;
+}) {
+    const [isExpanded, setIsExpanded] = useState(initiallyExpanded);
+    const [hunks, setHunks] = useState<DiffHunk[] | null>(null);
+    const [diff, setDiff] = useState<string | null>(null);
+    const [error, setError] = useState<string | null>(null);
+
+    useEffect(() => {
+        if (!isExpanded || hunks || diff !== null) return;
+        let cancelled = false;
+
+        // Precomputed hunks when the task captured the file's contents, otherwise the file's diff
+        const loadDiff = () => loadFile(entry.path, 'diff').then(text => {
+            if (!cancelled) setDiff(text);
+        });
+        const load = entry.has_contents && !entry.binary && loadHunks
+            ? loadHunks(entry.path).then(result => {
+                if (cancelled) return;
+                if (result) {
+                    setHunks(result);
+                } else {
+                    return loadDiff();
+                }
+            })
+            : loadDiff();
+        load.catch(err => {
+            if (!cancelled) setError(err.message);
+        });
+
+        return () => {
+            cancelled = true;
+        };
+    }, [isExpanded, entry.path]);
+
+    if (hunks) {
+        return <HunkView path={entry.path} hunks={hunks} entry={entry} />;
+    }
+    if (diff !== null) {
+        return <LegacyDiffViewer diff={diff} title={entry.path} stats={{ additions: entry.additions, deletions: entry.deletions, files: 1 }} />;
+    }
+
+    const size = entry.has_contents ? entry.before_bytes + entry.after_bytes : entry.diff_bytes;
+    const fileSize = entry.status === 'deleted' ? entry.before_bytes : entry.after_bytes;
+    return (
+        <div className="border rounded-lg bg-white shadow-sm">
+            <div className="px-6 py-4 pb-3">
+                <div className="flex items-center justify-between">
+                    <div className="flex items-center gap-2 cursor-pointer" onClick={() => setIsExpanded(true)}>
+                        {isExpanded ? <ChevronDown className="w-4 h-4" /> : <ChevronRight className="w-4 h-4" />}
+                        <span className="font-mono text-sm">{entry.path}</span>
+                        {entry.status === 'added' && (
+                            <span className="text-xs bg-green-100 text-green-800 px-2 py-1 rounded">NEW</span>
+                        )}
+                        {entry.status === 'deleted' && (
+                            <span className="text-xs bg-red-100 text-red-800 px-2 py-1 rounded">DELETED</span>
+                        )}
+                        {entry.status === 'renamed' && (
+                            <span className="text-xs bg-slate-100 text-slate-700 px-2 py-1 rounded">RENAMED</span>
+                        )}
+                        {entry.binary && (
+                            <span className="text-xs bg-slate-100 text-slate-700 px-2 py-1 rounded">BINARY</span>
+                        )}
+                        {entry.oversized && (
+                            <span className="text-xs bg-amber-100 text-amber-800 px-2 py-1 rounded" title="Too large to show side by side; only its diff is available">{formatBytes(fileSize)}</span>
+                        )}
+                    </div>
+                    <div className="flex items-center gap-2 text-sm">
+                        <span className="text-green-600 font-mono">+{entry.additions}</span>
+                        <span className="text-red-600 font-mono">-{entry.deletions}</span>
+                        <span className="text-slate-500">{formatBytes(size)}</span>
+                    </div>
+                </div>
+                {isExpanded && (
+                    <div className="mt-2 text-sm text-slate-500">
+                        {error ? `Failed to load file: ${error}` : 'Loading…'}
+                    </div>
+                )}
+            </div>
+        </div>
+    );
+}
+
 // Legacy diff viewer for when file changes aren't available
-function LegacyDiffViewer({ diff, stats }: { diff: string; stats?: DiffViewerProps['stats'] }) {
+function LegacyDiffViewer({ diff, stats, title = "Git Diff" }: { diff: string; stats?: DiffViewerProps['stats']; title?: string }) {
     const containerRef = useRef<HTMLDivElement>(null);
     const viewRef = useRef<EditorView | null>(null);
 
@@ -243,7 +415,7 @@ function LegacyDiffViewer({ diff, stats }: { diff: string; stats?: DiffViewerPro
                 {/* Header */}
                 <div className="bg-slate-50 border-b px-4 py-3 flex items-center justify-between">
                     <div className="flex items-center gap-4">
-                        <span className="text-slate-700 text-sm font-medium">Git Diff</span>
+                        <span className="text-slate-700 text-sm font-medium">{title}</span>
                         {stats && (
                             <div className="flex items-center gap-4 text-sm">
                                 <div className="flex items-center gap-1">
@@ -278,7 +450,7 @@ function LegacyDiffViewer({ diff, stats }: { diff: string; stats?: DiffViewerPro
         );
 }
 
-export function DiffViewer({ diff, fileChanges, stats, className = "" }: DiffViewerProps) {
+export function DiffViewer({ diff, fileChanges, files, loadFile, loadHunks, stats, className = "" }: DiffViewerProps) {
     const [expandAll, setExpandAll] = useState(false);
 
     const handleCopyAll = () => {
@@ -298,6 +470,41 @@ export function DiffViewer({ diff, fileChanges, stats, className = "" }: DiffVie
         // to actually control the expand/collapse state of individual files
     };
 
+    // File index: render the list right away and fetch each file's contents when it is expanded
+    if (files && files.length > 0 && loadFile) {
+        return (
+            <div className={className}>
+                <div className="mb-4 flex items-center gap-4">
+                    <h3 className="text-lg font-semibold">File Changes</h3>
+                    {stats && (
+                        <div className="flex items-center gap-4 text-sm text-slate-600">
+                            <div className="flex items-center gap-1">
+                                <FileText className="w-3 h-3" />
+                                <span>{stats.files} files</span>
+                            </div>
+                            <div className="flex items-center gap-2">
+                                <span className="text-green-600 font-mono">+{stats.additions}</span>
+                                <span className="text-red-600 font-mono">-{stats.deletions}</span>
+                            </div>
+                        </div>
+                    )}
+                </div>
+
+                <div className="space-y-4">
+                    {files.map((entry, index) => (
+                        <LazyFileView
+                            key={entry.path}
+                            entry={entry}
+                            loadFile={loadFile}
+                            loadHunks={loadHunks}
+                            initiallyExpanded={index < EAGER_FILES}
+                        />
+                    ))}
+                </div>
+            </div>
+        );
+    }
+
     // Use unified merge view if file changes are available, otherwise fall back to legacy diff
     if (fileChanges && fileChanges.length > 0) {
         return (
@@ -1,4 +1,4 @@
-import { Project, Task, ProjectWithStats, ChatMessage } from '@/types'
+import { Project, Task, ProjectWithStats, ChatMessage, TaskFilesResponse, TaskFilePart, DiffHunk } from '@/types'
 
 const API_BASE = typeof window !== 'undefined' && window.location.hostname === 'localhost' 
     ? 'http://localhost:5000' 
@@ -110,8 +110,9 @@ export class ApiService {
         return Object.values(data.tasks || {})
     }
 
-    static async getTask(userId: string, id: number): Promise<Task | null> {
-        const response = await fetch(`${API_BASE}/tasks/${id}`, {
+    // view 'summary' leaves out the diff, patch and file contents (load them with getTaskFiles)
+    static async getTask(userId: string, id: number, view: 'full' | 'summary' = 'full'): Promise<Task | null> {
+        const response = await fetch(`${API_BASE}/tasks/${id}?view=${view}`, {
             headers: getUserIdHeader(userId)
         })
         
@@ -186,6 +187,33 @@ export class ApiService {
         return data.task
     }
 
+    static async getProjectTimeline(userId: string, projectId: number, limit = 50): Promise<any> {
+        const response = await fetch(`${API_BASE}/projects/${projectId}/timeline?limit=${limit}`, {
+            headers: getUserIdHeader(userId)
+        })
+        
+        if (!response.ok) {
+            throw new Error('Failed to fetch project timeline')
+        }
+        
+        const data = await response.json()
+        return data.timeline
+    }
+
+    static async cancelTask(userId: string, taskId: number): Promise<string> {
+        const response = await fetch(`${API_BASE}/tasks/${taskId}/cancel`, {
+            method: 'POST',
+            headers: getUserIdHeader(userId)
+        })
+        
+        if (!response.ok) {
+            throw new Error('Failed to cancel task')
+        }
+        
+        const data = await response.json()
+        return data.cancelled
+    }
+
     static async createPullRequest(userId: string, taskId: number, prData: {
         title?: string
         body?: string
@@ -244,6 +272,46 @@ export class ApiService {
         return data.git_diff || ''
     }
 
+    static async getTaskFiles(userId: string, taskId: number): Promise<TaskFilesResponse> {
+        const response = await fetch(`${API_BASE}/tasks/${taskId}/files`, {
+            headers: getUserIdHeader(userId)
+        })
+        
+        if (!response.ok) {
+            throw new Error('Failed to fetch task files')
+        }
+        
+        return response.json()
+    }
+
+    static async getTaskFile(userId: string, taskId: number, path: string, part: TaskFilePart = 'diff'): Promise<string> {
+        const encodedPath = path.split('/').map(encodeURIComponent).join('/')
+        const response = await fetch(`${API_BASE}/tasks/${taskId}/files/${encodedPath}?part=${part}`, {
+            headers: getUserIdHeader(userId)
+        })
+        
+        if (!response.ok) {
+            throw new Error(`Failed to fetch ${part} of ${path}`)
+        }
+        
+        return response.text()
+    }
+
+    // Null when the file's contents were not captured (use the 'diff' part instead)
+    static async getTaskFileHunks(userId: string, taskId: number, path: string): Promise<DiffHunk[] | null> {
+        const encodedPath = path.split('/').map(encodeURIComponent).join('/')
+        const response = await fetch(`${API_BASE}/tasks/${taskId}/files/${encodedPath}?part=hunks`, {
+            headers: getUserIdHeader(userId)
+        })
+        
+        if (!response.ok) {
+            throw new Error(`Failed to fetch hunks of ${path}`)
+        }
+        
+        const data = await response.json()
+        return data.hunks
+    }
+
     // Utility functions
     static parseGitHubUrl(url: string): { owner: string, repo: string } {
         const match = url.match(/github\.com\/([^\/]+)\/([^\/]+?)(?:\.git)?(?:\/|$)/)
@@ -19,6 +19,46 @@ export interface FileChange {
     after: string
 }
 
+// Entry of a task's changed-file index (GET /tasks/<id>/files); contents load per file
+export type TaskFilePart = 'diff' | 'before' | 'after'
+
+export interface TaskFileEntry {
+    path: string
+    old_path: string | null
+    status: 'added' | 'modified' | 'deleted' | 'renamed'
+    binary: boolean
+    oversized: boolean // larger than the server's snapshot limit; only its diff is served
+    additions: number
+    deletions: number
+    has_contents: boolean // before/after bodies are available, otherwise only the diff
+    diff_bytes: number
+    before_bytes: number // size of the file itself, also when its contents are not served
+    after_bytes: number
+    diff_lines: number
+    before_lines: number | null // null when the contents were not captured
+    after_lines: number | null
+}
+
+// Precomputed hunk of a file (GET /tasks/<id>/files/<path>?part=hunks). Each line is
+// [tag, old line number, new line number, text, changed [start, end, ...] character spans or null]
+export type DiffLine = [' ' | '-' | '+', number | null, number | null, string, number[] | null]
+
+export interface DiffHunk {
+    header: string
+    lines: DiffLine[]
+}
+
+export interface TaskFilesResponse {
+    status: 'success'
+    task_id: number
+    stats: {
+        files: number
+        additions: number
+        deletions: number
+    }
+    files: TaskFileEntry[]
+}
+
 // Frontend-specific interfaces
 export interface TaskWithProject extends Task {
     project?: Project
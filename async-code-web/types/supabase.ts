@@ -92,6 +92,7 @@ export type Database = {
           commit_hash: string | null
           completed_at: string | null
           container_id: string | null
+          docker_host: string | null
           created_at: string | null
           error: string | null
           execution_metadata: Json | null
@@ -116,6 +117,7 @@ export type Database = {
           commit_hash?: string | null
           completed_at?: string | null
           container_id?: string | null
+          docker_host?: string | null
           created_at?: string | null
           error?: string | null
           execution_metadata?: Json | null
@@ -140,6 +142,7 @@ export type Database = {
           commit_hash?: string | null
           completed_at?: string | null
           container_id?: string | null
+          docker_host?: string | null
           created_at?: string | null
           error?: string | null
           execution_metadata?: Json | null
@@ -139,6 +139,7 @@ CREATE TABLE public.tasks (
   -- Task information
   status task_status DEFAULT 'pending',
   agent TEXT DEFAULT 'claude',
+  priority TEXT DEFAULT 'interactive', -- 'interactive' or 'batch'
   
   -- GitHub/Repository information
   repo_url TEXT,
@@ -147,6 +148,9 @@ CREATE TABLE public.tasks (
   
   -- Container and execution details
   container_id TEXT,
+  docker_host TEXT, -- Executor Docker host the container runs on
+  executor_id TEXT, -- Server process that owns the task while it is pending or running
+  lease_expires_at TIMESTAMP WITH TIME ZONE, -- Ownership ends here unless the owner renews it
   
   -- Git workflow tracking
   commit_hash TEXT, -- Final commit hash
@@ -196,6 +200,59 @@ CREATE TRIGGER update_tasks_updated_at
   FOR EACH ROW
   EXECUTE FUNCTION update_updated_at_column();
 
+-- ====================
+-- TASK QUEUE
+-- ====================
+
+-- Tasks handed from API processes to worker processes (EXECUTION_MODE=queue).
+-- Workers read the GitHub token from the user's row. Only the service role
+-- may read the queue: RLS is enabled without any policy.
+CREATE TABLE public.task_queue (
+  task_id BIGINT PRIMARY KEY REFERENCES public.tasks(id) ON DELETE CASCADE,
+  user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+  repo_url TEXT,
+  project_id BIGINT,
+  priority TEXT NOT NULL DEFAULT 'interactive',
+  trace_context JSONB DEFAULT '{}',
+  enqueued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE public.task_queue ENABLE ROW LEVEL SECURITY;
+
+-- ====================
+-- FILE BLOBS
+-- ====================
+
+-- Old versions of files changed by tasks, once per git blob id; a task's
+-- execution_metadata.file_changes references them and its git_diff turns them
+-- into the new versions. Shared across users, so only the service role may
+-- read them: RLS is enabled without any policy.
+CREATE TABLE public.file_blobs (
+  sha TEXT PRIMARY KEY,
+  content TEXT NOT NULL,
+  size BIGINT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE public.file_blobs ENABLE ROW LEVEL SECURITY;
+
+-- ====================
+-- QUOTA BUCKETS
+-- ====================
+
+-- Token buckets of the per-user and per-project quotas, merged periodically by
+-- every server process; a row is only replaced at the version that was read.
+-- Service role only: RLS is enabled without any policy.
+CREATE TABLE public.quota_buckets (
+  key TEXT PRIMARY KEY,
+  level DOUBLE PRECISION NOT NULL,
+  refreshed_at DOUBLE PRECISION NOT NULL,
+  version BIGINT NOT NULL DEFAULT 1,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE public.quota_buckets ENABLE ROW LEVEL SECURITY;
+
 -- ====================
 -- INDEXES
 -- ====================
@@ -205,5 +262,7 @@ CREATE INDEX idx_projects_user_id ON public.projects(user_id);
 CREATE INDEX idx_tasks_user_id ON public.tasks(user_id);
 CREATE INDEX idx_tasks_project_id ON public.tasks(project_id);
 CREATE INDEX idx_tasks_status ON public.tasks(status);
+CREATE INDEX idx_tasks_executor_id ON public.tasks(executor_id);
+CREATE INDEX idx_task_queue_priority_enqueued_at ON public.task_queue(priority, enqueued_at);
 
 -- Database setup complete!
@@ -0,0 +1,215 @@
+"""Synthetic task-container output with known expected parse results.
+
+``render_task_output`` prints a set of file changes the way the task script
+does (timing and phase markers, OUTPUT FORMAT marker, patch, diff, changed
+files and per-file snapshots with prefixed old contents) and returns the result
+``parse_container_output`` must produce for it.
+"""
+import difflib
+import hashlib
+import random
+
+from utils.output_parser import CONTENT_PREFIX, NULL_BLOB, OUTPUT_FORMAT_MARKER, SNAPSHOT_HEADER
+from utils.hunks import compute_hunks
+from utils.snapshots import blob_sha
+
+# Lines that look like the script's own output; pathological when they appear in files
+MARKER_LIKE_LINES = [
+    '=== PATCH START ===', '=== PATCH END ===', '=== GIT DIFF START ===', '=== GIT DIFF END ===',
+    '=== CHANGED FILES START ===', '=== CHANGED FILES END ===', '=== FILE CHANGES START ===',
+    '=== FILE CHANGES END ===', '=== BEFORE START ===', '=== BEFORE END ===', '=== AFTER START ===',
+    '=== AFTER END ===', '=== FILE END ===', 'FILE: src/injected.py', 'COMMIT_HASH=0000000000000000000000000000000000000000',
+    '=== TIMING: agent 1 2 ===', '=== PHASE: extraction ===', OUTPUT_FORMAT_MARKER, 'FILE_NOT_EXISTS', 'FILE_DELETED',
+    CONTENT_PREFIX + 'already prefixed', '', ' ', '\t=== PATCH END ===', SNAPSHOT_HEADER + 'M ' + NULL_BLOB + ' ' + NULL_BLOB + ' 1 1 0',
+]
+
+_WORDS = ['def', 'return', 'value', 'self', 'import', 'for', 'in', 'if', 'else', 'None', 'True', '=', '+', '(', ')', ':', 'data', 'result']
+
+
+def random_lines(rng: random.Random, count: int, collision_rate: float = 0.0) -> list:
+    lines = []
+    for _ in range(count):
+        if collision_rate and rng.random() < collision_rate:
+            lines.append(rng.choice(MARKER_LIKE_LINES))
+        else:
+            lines.append('    ' * rng.randint(0, 3) + ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, 12))))
+    return lines
+
+
+def _file_diff(change: dict) -> list:
+    path, before, after = change['filename'], change['before_lines'], change['after_lines']
+    header = [f'diff --git a/{path} b/{path}']
+    if before is None:
+        header += ['new file mode 100644', 'index 0000000..1111111', '--- /dev/null', f'+++ b/{path}']
+    elif after is None:
+        header += ['deleted file mode 100644', 'index 1111111..0000000', f'--- a/{path}', '+++ /dev/null']
+    else:
+        header += ['index 1111111..2222222 100644', f'--- a/{path}', f'+++ b/{path}']
+    removed, added = before or [], after or []
+    hunk = [f'@@ -{1 if removed else 0},{len(removed)} +{1 if added else 0},{len(added)} @@']
+    return header + hunk + ['-' + line for line in removed] + ['+' + line for line in added]
+
+
+def render_task_output(changes: list, agent_output: list = None, started_ms: int = 1_700_000_000_000) -> tuple:
+    """``(logs, expected)`` for file ``changes`` of ``{filename, before_lines, after_lines}``.
+
+    ``before_lines`` is None for a new file and ``after_lines`` None for a deleted one.
+    An empty ``changes`` list renders the script's "no changes" branch.
+    """
+    out = [
+        '=== TIMING: env 0 0 ===',
+        '=== PHASE: clone ===', 'Setting up repository...',
+        '=== PHASE: agent ===', 'Starting Claude Code with prompt...',
+    ]
+    out += agent_output or []
+    out += [
+        f'=== TIMING: agent {started_ms} {started_ms + 60_000} ===',
+        '=== PHASE: extraction ===',
+        OUTPUT_FORMAT_MARKER,
+    ]
+
+    if not changes:
+        out += [
+            '=== PATCH START ===', 'No changes were made', '=== PATCH END ===',
+            '=== GIT DIFF START ===', 'No changes were made', '=== GIT DIFF END ===',
+            '=== CHANGED FILES START ===', 'No files were changed', '=== CHANGED FILES END ===',
+            '=== FILE CHANGES START ===', 'No file changes to display', '=== FILE CHANGES END ===',
+            'COMMIT_HASH=', 'Container work completed successfully',
+        ]
+        expected = {
+            'commit_hash': '', 'git_patch': 'No changes were made', 'git_diff': 'No changes were made',
+            'changed_files': ['No files were changed'],
+            'file_changes': [], 'diff_lines': 1,
+        }
+        return '\n'.join(out) + '\n', expected
+
+    commit_hash = hashlib.sha1(repr([c['filename'] for c in changes]).encode()).hexdigest()
+    diff = [line for change in changes for line in _file_diff(change)]
+    patch = [f'From {commit_hash} Mon Sep 17 00:00:00 2001', 'From: Claude Code Automation <claude-code@automation.com>',
+             'Subject: [PATCH] Claude: synthetic change', '', '---'] + diff + ['--', '2.39.0']
+    filenames = [change['filename'] for change in changes]
+
+    out += [f'COMMIT_HASH={commit_hash}', f'=== TIMING: commit {started_ms + 60_000} {started_ms + 60_100} ===']
+    out += ['=== PATCH START ==='] + patch + ['=== PATCH END ===']
+    out += ['=== GIT DIFF START ==='] + diff + ['=== GIT DIFF END ===']
+    out += ['=== CHANGED FILES START ==='] + filenames + ['=== CHANGED FILES END ===']
+    out += ['=== FILE CHANGES START ===']
+    file_changes = []
+    for change in changes:
+        before = None if change['before_lines'] is None else ''.join(line + '\n' for line in change['before_lines'])
+        after = None if change['after_lines'] is None else ''.join(line + '\n' for line in change['after_lines'])
+        expected_change = {
+            'filename': change['filename'],
+            'status': 'added' if before is None else 'deleted' if after is None else 'modified',
+            'base_blob': None if before is None else blob_sha(before),
+            'blob': None if after is None else blob_sha(after),
+            'base_size': len((before or '').encode()),
+            'size': len((after or '').encode()),
+            'binary': False,
+            'before': before,
+        }
+        out += [f"FILE: {change['filename']}", SNAPSHOT_HEADER + ' '.join([
+            expected_change['status'][0].upper(), expected_change['base_blob'] or NULL_BLOB, expected_change['blob'] or NULL_BLOB,
+            str(expected_change['base_size']), str(expected_change['size']), '0'])]
+        if before is not None:
+            out += ['=== BEFORE START ==='] + [CONTENT_PREFIX + line for line in change['before_lines']] + ['=== BEFORE END ===']
+        out += ['=== FILE END ===']
+        file_changes.append(expected_change)
+    out += ['=== FILE CHANGES END ===', f'=== TIMING: file_changes {started_ms + 60_100} {started_ms + 60_200} ===',
+            'Container work completed successfully']
+
+    expected = {
+        'commit_hash': commit_hash,
+        'git_patch': '\n'.join(patch),
+        'git_diff': '\n'.join(diff),
+        'changed_files': filenames,
+        'file_changes': file_changes,
+        'diff_lines': len(diff),
+    }
+    return '\n'.join(out) + '\n', expected
+
+
+def synthetic_changes(rng: random.Random, files: int, lines_per_file: int, collision_rate: float = 0.0) -> list:
+    """Mixed new, modified and deleted files with ``lines_per_file`` lines on average"""
+    changes = []
+    for index in range(files):
+        kind = rng.random()
+        size = max(0, int(rng.gauss(lines_per_file, lines_per_file / 4)))
+        before = None if kind < 0.3 else random_lines(rng, size, collision_rate)
+        after = None if 0.3 <= kind < 0.4 else random_lines(rng, size, collision_rate)
+        changes.append({'filename': f'src/pkg_{index % 50}/module_{index}.py', 'before_lines': before, 'after_lines': after})
+    return changes
+
+
+def corpus_of_size(target_bytes: int, files: int, collision_rate: float = 0.001, seed: int = 0) -> tuple:
+    """Output of roughly ``target_bytes`` spread over ``files`` changed files"""
+    rng = random.Random(seed)
+    # Each content line appears in the patch, the diff and (old lines) a BEFORE block (~55 bytes per line with headers)
+    lines_per_file = max(1, target_bytes // (files * 3 * 55))
+    return render_task_output(synthetic_changes(rng, files, lines_per_file, collision_rate))
+
+
+def fuzz_case(seed: int) -> tuple:
+    """Small random output with dense marker collisions in files and in the agent's own output"""
+    rng = random.Random(seed)
+    changes = synthetic_changes(rng, rng.randint(0, 12), rng.randint(0, 30), collision_rate=rng.choice([0.05, 0.3, 0.9]))
+    agent_output = random_lines(rng, rng.randint(0, 20), collision_rate=0.5)
+    return render_task_output(changes, agent_output=agent_output)
+
+
+def edited_file_pair(lines: int, edit_rate: float, seed: int = 0) -> tuple:
+    """``(before, after)`` texts of ``lines`` lines where about ``edit_rate`` of the lines were edited.
+
+    Edits mix changed words within a line (the common case for reviews),
+    inserted and deleted lines, and moved blocks.
+    """
+    rng = random.Random(seed)
+    before = random_lines(rng, lines)
+    after = []
+    for line in before:
+        if rng.random() >= edit_rate:
+            after.append(line)
+            continue
+        kind = rng.random()
+        if kind < 0.5:
+            words = line.split(' ')
+            words[rng.randrange(len(words))] = rng.choice(_WORDS)
+            after.append(' '.join(words))
+        elif kind < 0.7:
+            after += [line] + random_lines(rng, rng.randint(1, 5))
+        elif kind < 0.9:
+            continue
+        else:
+            after.insert(rng.randint(0, len(after)), line)
+    return '\n'.join(before) + '\n', '\n'.join(after) + '\n'
+
+
+def synthetic_task(seed: int, chat_messages: int = 40, files: int = 20, lines_per_file: int = 500) -> dict:
+    """A completed task row as ``GET /tasks/<id>`` returns it: chat history, diff and file snapshots with hunks"""
+    rng = random.Random(seed)
+    file_changes, diff = [], []
+    for index in range(files):
+        before, after = edited_file_pair(lines_per_file, 0.02, seed * 1000 + index)
+        path = f'src/pkg_{index % 7}/module_{index}.py'
+        diff += [f'diff --git a/{path} b/{path}', 'index 1111111..2222222 100644']
+        diff += difflib.unified_diff(before.splitlines(), after.splitlines(), f'a/{path}', f'b/{path}', lineterm='')
+        file_changes.append({
+            'filename': path, 'status': 'modified', 'base_blob': blob_sha(before), 'blob': blob_sha(after),
+            'base_size': len(before.encode()), 'size': len(after.encode()),
+            'base_lines': before.count('\n'), 'lines': after.count('\n'),
+            'binary': False, 'oversized': False, 'has_contents': True, 'hunks': compute_hunks(before, after),
+        })
+    messages = [{
+        'role': 'user' if index % 2 == 0 else 'assistant',
+        'content': ' '.join(random_lines(rng, rng.randint(2, 40))),
+        'timestamp': f'2024-05-01T12:{index % 60:02d}:00Z',
+    } for index in range(chat_messages)]
+    return {
+        'id': seed + 1, 'user_id': '00000000-0000-0000-0000-000000000001', 'project_id': 1, 'status': 'completed',
+        'agent': 'claude', 'repo_url': 'https://github.com/example/repo', 'target_branch': 'main',
+        'commit_hash': hashlib.sha1(str(seed).encode()).hexdigest(), 'pr_number': None, 'pr_url': None,
+        'created_at': '2024-05-01T12:00:00Z', 'updated_at': '2024-05-01T12:30:00Z',
+        'chat_messages': messages, 'git_diff': '\n'.join(diff), 'git_patch': '\n'.join(diff),
+        'changed_files': [change['filename'] for change in file_changes],
+        'execution_metadata': {'file_changes': file_changes, 'completed_at': '2024-05-01T12:30:00Z'},
+    }
@@ -0,0 +1,578 @@
+"""In-process stand-ins for the Docker, Supabase and GitHub clients used by the server.
+
+They implement only the calls the task pipeline makes, with configurable
+latencies, so the real ``tasks.py`` / ``code_task_v2.py`` code paths can be
+driven at load without any external service.
+"""
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+from utils.agent_stream import AGENT_EVENT_MARKER
+from utils.output_parser import NULL_BLOB, OUTPUT_FORMAT_MARKER, SNAPSHOT_HEADER
+from utils.snapshots import blob_sha
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f') + '000Z'
+
+
+def build_task_output(log_bytes: int = 50_000, changed_files: int = 5, runtime: float = 2.0) -> str:
+    """Container output shaped like the task runner's: timing/phase markers, agent events, patch, diff and file snapshots.
+
+    Every changed file is a new file, so its content appears in the patch and the
+    diff only; ``log_bytes`` is split across those two copies.
+    """
+    changed_files = max(1, changed_files)
+    file_bytes = max(64, log_bytes // (2 * changed_files))
+    line = 'value = "' + 'x' * 60 + '"  # generated by the load-test fake\n'
+    content = (line * (file_bytes // len(line) + 1))[:file_bytes].rstrip('\n').split('\n')
+    files = [f'src/module_{index}.py' for index in range(changed_files)]
+
+    diff = []
+    for path in files:
+        diff += [
+            f'diff --git a/{path} b/{path}',
+            'new file mode 100644',
+            'index 0000000..1111111',
+            '--- /dev/null',
+            f'+++ b/{path}',
+            f'@@ -0,0 +1,{len(content)} @@',
+        ]
+        diff += ['+' + text for text in content]
+
+    started_ms = int(time.time() * 1000)
+    phases = [('env', 0.01), ('clone', 0.2), ('credentials', 0.01), ('agent', 0.65),
+              ('commit', 0.02), ('format_patch', 0.02), ('diff', 0.04), ('file_changes', 0.05)]
+    timing, offset = [], 0
+    for phase, share in phases:
+        duration = int(runtime * 1000 * share)
+        timing.append(f'=== TIMING: {phase} {started_ms + offset} {started_ms + offset + duration} ===')
+        offset += duration
+
+    # One agent turn per changed file, each writing it with a tool call
+    agent_ms = started_ms + int(runtime * 1000 * 0.22)
+    events = [{'type': 'system', 'subtype': 'init', 'model': 'claude-fake'}]
+    for index, path in enumerate(files):
+        usage = {'input_tokens': 1000, 'output_tokens': 200, 'cache_read_input_tokens': 5000 * index}
+        events.append({'type': 'assistant', 'message': {'id': f'msg_{index}', 'content': [{'type': 'tool_use', 'id': f'tool_{index}', 'name': 'Edit', 'input': {'file_path': path}}], 'usage': usage}})
+        events.append({'type': 'user', 'message': {'content': [{'type': 'tool_result', 'tool_use_id': f'tool_{index}', 'content': 'ok'}]}})
+    events.append({'type': 'result', 'subtype': 'success', 'duration_ms': int(runtime * 650), 'total_cost_usd': 0.01 * len(files)})
+    step = int(runtime * 650) // len(events)
+    agent = [f'{AGENT_EVENT_MARKER}{agent_ms + index * step} {json.dumps(event)}' for index, event in enumerate(events)]
+
+    out = ['Setting up repository...', '=== PHASE: clone ===', '=== PHASE: agent ===']
+    out += agent + ['Claude Code finished with exit code: 0', '=== PHASE: extraction ===', OUTPUT_FORMAT_MARKER,
+           'COMMIT_HASH=' + hashlib.sha1(str(log_bytes).encode()).hexdigest()]
+    out += ['=== PATCH START ===', 'From 1111111 Mon Sep 17 00:00:00 2001', 'Subject: [PATCH] Claude: load test', '---']
+    out += diff + ['=== PATCH END ===', '=== GIT DIFF START ===']
+    out += diff + ['=== GIT DIFF END ===', '=== CHANGED FILES START ===']
+    out += files + ['=== CHANGED FILES END ===', '=== FILE CHANGES START ===']
+    text = '\n'.join(content) + '\n'
+    snapshot = f'{SNAPSHOT_HEADER}A {NULL_BLOB} {blob_sha(text)} 0 {len(text.encode())} 0'
+    for path in files:
+        out += [f'FILE: {path}', snapshot, '=== FILE END ===']
+    out += ['=== FILE CHANGES END ===', 'Container work completed successfully']
+    split = out.index(OUTPUT_FORMAT_MARKER)
+    return '\n'.join(out[:split] + timing + out[split:]) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# Docker
+
+
+class FakeEventStream:
+    """Blocking iterator over container events, closable like docker-py's stream"""
+
+    _CLOSED = object()
+
+    def __init__(self, filters: dict = None):
+        self.filters = filters or {}
+        self._queue = queue.Queue()
+
+    def push(self, event: dict):
+        self._queue.put(event)
+
+    def close(self):
+        self._queue.put(self._CLOSED)
+
+    def __iter__(self):
+        while True:
+            event = self._queue.get()
+            if event is self._CLOSED:
+                return
+            yield event
+
+
+class FakeContainer:
+    def __init__(self, client, **kwargs):
+        self.client = client
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.name = kwargs.get('name') or self.id[:12]
+        self.labels = kwargs.get('labels') or {}
+        self.status = 'created'
+        self.exit_code = None
+        self.started_at = None
+        self.finished_at = None
+        self.oom_killed = False
+        self.kwargs = kwargs
+        self._output = None
+        self._stamped = None
+        self._exited = threading.Event()
+        self._stats_reads = 0
+
+    @property
+    def attrs(self):
+        return {
+            'Created': _iso(time.time()),
+            'State': {
+                'Status': self.status,
+                'ExitCode': self.exit_code if self.exit_code is not None else 0,
+                'OOMKilled': self.oom_killed,
+                'StartedAt': _iso(self.started_at) if self.started_at else '0001-01-01T00:00:00Z',
+            },
+            'HostConfig': {
+                'Memory': self.kwargs.get('mem_limit') or 0,
+                'NanoCpus': self.kwargs.get('nano_cpus') or 0,
+                'CpusetCpus': self.kwargs.get('cpuset_cpus') or '',
+            },
+        }
+
+    def start(self):
+        time.sleep(self.client.start_latency)
+        self.status = 'running'
+        self.started_at = time.time()
+        self.client._schedule_exit(self, self.client.runtime, self.client.exit_code)
+
+    def reload(self):
+        pass
+
+    def wait(self, timeout=None):
+        self._exited.wait(timeout)
+        return {'StatusCode': self.exit_code}
+
+    def kill(self):
+        self.client._exit(self, 137)
+
+    def remove(self, force=False):
+        self.client._containers.pop(self.id, None)
+
+    def _lines(self):
+        if self._stamped is None:
+            text = self.client.output() if self.exit_code == 0 else 'Claude Code failed\n'
+            lines = text.split('\n')[:-1]
+            # Spread the lines over the run so `since` filtering behaves like the daemon's
+            step = max(self.client.runtime, 0.001) / max(len(lines), 1)
+            self._stamped = ([self.started_at + index * step for index in range(len(lines))], lines)
+        return self._stamped
+
+    def logs(self, stdout=True, stderr=True, timestamps=False, since=None, **kwargs):
+        if self.status != 'exited':
+            return b''
+        if not timestamps and since is None:
+            if self._output is None:
+                self._output = (self.client.output() if self.exit_code == 0 else 'Claude Code failed\n').encode()
+            return self._output
+        times, lines = self._lines()
+        start = bisect_left(times, since) if since else 0
+        if timestamps:
+            return ''.join(f'{_iso(times[index])} {lines[index]}\n' for index in range(start, len(lines))).encode()
+        return ''.join(line + '\n' for line in lines[start:]).encode()
+
+    def stats(self, stream=True, decode=True):
+        if not stream:
+            self._stats_reads += 1
+            return self._stats_snapshot(self._stats_reads * 50_000_000)
+        return self._stats_stream()
+
+    def _stats_stream(self):
+        usage = 0
+        while self.status != 'exited':
+            usage += 50_000_000
+            yield self._stats_snapshot(usage)
+            self._exited.wait(1.0)
+
+    def _stats_snapshot(self, usage):
+        return {
+            'memory_stats': {'usage': 256 * 1024 * 1024, 'stats': {'inactive_file': 0}},
+            'cpu_stats': {'cpu_usage': {'total_usage': usage}, 'system_cpu_usage': usage * 4, 'online_cpus': 4},
+            'precpu_stats': {'cpu_usage': {'total_usage': usage - 50_000_000}, 'system_cpu_usage': (usage - 50_000_000) * 4},
+        }
+
+
+class _FakeContainers:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, **kwargs):
+        time.sleep(self.client.create_latency)
+        container = FakeContainer(self.client, **kwargs)
+        self.client._containers[container.id] = container
+        return container
+
+    def run(self, **kwargs):
+        container = self.create(**{key: value for key, value in kwargs.items() if key not in ['detach', 'remove']})
+        container.start()
+        return container
+
+    def get(self, container_id):
+        import docker.errors
+        container = self.client._containers.get(container_id)
+        if container is None:
+            raise docker.errors.NotFound(f'No such container: {container_id}')
+        return container
+
+    def list(self, all=False, filters=None):
+        name = (filters or {}).get('name')
+        return [
+            container for container in list(self.client._containers.values())
+            if (all or container.status == 'running') and (not name or name in container.name)
+        ]
+
+
+class _FakeVolumes:
+    def list(self, filters=None):
+        return []
+
+
+class FakeDockerClient:
+    """docker.DockerClient replacement; containers exit ``runtime`` seconds after start"""
+
+    def __init__(self, create_latency: float = 0.05, start_latency: float = 0.1, runtime: float = 2.0,
+                 log_bytes: int = 50_000, changed_files: int = 5, exit_code: int = 0,
+                 memory_total: int = 64 * 1024 ** 3, cpu_total: int = 32):
+        self.create_latency = create_latency
+        self.start_latency = start_latency
+        self.runtime = runtime
+        self.log_bytes = log_bytes
+        self.changed_files = changed_files
+        self.exit_code = exit_code
+        self.memory_total = memory_total
+        self.cpu_total = cpu_total
+        self.containers = _FakeContainers(self)
+        self.volumes = _FakeVolumes()
+        self._containers = {}
+        self._streams = []
+        self._output = None
+        self._timers = []
+        self._timer_cond = threading.Condition()
+        self._sequence = itertools.count()
+        threading.Thread(target=self._timer_loop, name='fake-docker-clock', daemon=True).start()
+
+    def output(self) -> str:
+        if self._output is None:
+            self._output = build_task_output(self.log_bytes, self.changed_files, self.runtime)
+        return self._output
+
+    def ping(self):
+        return True
+
+    def info(self):
+        return {'MemTotal': self.memory_total, 'NCPU': self.cpu_total}
+
+    def events(self, decode=True, since=None, filters=None):
+        stream = FakeEventStream(filters)
+        self._streams.append(stream)
+        return stream
+
+    def _schedule_exit(self, container, delay: float, exit_code: int):
+        with self._timer_cond:
+            heapq.heappush(self._timers, (time.time() + delay, next(self._sequence), container, exit_code))
+            self._timer_cond.notify()
+
+    def _timer_loop(self):
+        while True:
+            with self._timer_cond:
+                while not self._timers or self._timers[0][0] > time.time():
+                    self._timer_cond.wait(self._timers[0][0] - time.time() if self._timers else None)
+                _, _, container, exit_code = heapq.heappop(self._timers)
+            self._exit(container, exit_code)
+
+    def _exit(self, container, exit_code: int):
+        if container.status == 'exited':
+            return
+        container.exit_code = exit_code
+        container.finished_at = time.time()
+        container.status = 'exited'
+        container._exited.set()
+        event = {
+            'Type': 'container', 'Action': 'die', 'id': container.id, 'time': int(container.finished_at),
+            'Actor': {'ID': container.id, 'Attributes': dict(container.labels, exitCode=str(exit_code))},
+        }
+        for stream in list(self._streams):
+            stream.push(event)
+
+
+# ---------------------------------------------------------------------------
+# Supabase
+
+
+class _Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _FakeQuery:
+    def __init__(self, db, table: str):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.payload = None
+        self.filters = []
+        self.ordering = None
+        self.row_limit = None
+        self.single_row = False
+        self.count = None
+        self.head = False
+
+    def select(self, columns='*', count=None, head=False):
+        self.action = 'select'
+        self.count, self.head = count, head
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = 'insert', payload
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = 'update', payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = 'id', ignore_duplicates: bool = False):
+        self.action, self.payload = 'upsert', (payload, on_conflict, ignore_duplicates)
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def is_(self, column, value):
+        expected = None if value in (None, 'null') else value
+        self.filters.append(lambda row: row.get(column) == expected)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        with self.db.lock:
+            data = self.db.run(self)
+        if self.count:
+            return _Result(None if self.head else copy.deepcopy(data), count=len(data))
+        # Rows cross a JSON boundary with the real client; never share them
+        return _Result(copy.deepcopy(data))
+
+
+class FakeSupabase:
+    """Supabase client replacement: in-memory tables behind the query-builder calls ``database.py`` makes"""
+
+    TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables = {'tasks': [], 'projects': [], 'users': []}
+        self._ids = itertools.count(1)
+        self.finished_at = {}  # task id -> perf_counter() when it reached a terminal status
+
+    def table(self, name: str):
+        self.tables.setdefault(name, [])
+        return _FakeQuery(self, name)
+
+    def run(self, query: _FakeQuery):
+        rows = self.tables[query.table]
+        now = datetime.now(timezone.utc).isoformat()
+        if query.action == 'insert':
+            payload = query.payload if isinstance(query.payload, list) else [query.payload]
+            inserted = []
+            for item in payload:
+                row = {'id': next(self._ids), 'created_at': now, 'updated_at': now}
+                row.update(copy.deepcopy(item))
+                rows.append(row)
+                inserted.append(row)
+            return inserted
+
+        if query.action == 'upsert':
+            payload, key, ignore_duplicates = query.payload
+            written = []
+            for item in payload if isinstance(payload, list) else [payload]:
+                row = next((row for row in rows if row.get(key) == item.get(key)), None)
+                if row is None:
+                    row = {'created_at': now}
+                    rows.append(row)
+                elif ignore_duplicates:
+                    continue
+                row.update(copy.deepcopy(item))
+                written.append(row)
+            return written
+
+        matched = [row for row in rows if all(check(row) for check in query.filters)]
+        if query.action == 'update':
+            for row in matched:
+                row.update(copy.deepcopy(query.payload))
+                if query.table == 'tasks' and row.get('status') in self.TERMINAL_STATUSES:
+                    self.finished_at.setdefault(row['id'], time.perf_counter())
+            return matched
+        if query.action == 'delete':
+            self.tables[query.table] = [row for row in rows if row not in matched]
+            return matched
+
+        if query.ordering:
+            column, desc = query.ordering
+            matched = sorted(matched, key=lambda row: row.get(column) or '', reverse=desc)
+        if query.row_limit is not None:
+            matched = matched[:query.row_limit]
+        if query.single_row:
+            return matched[0] if matched else None
+        return matched
+
+
+# ---------------------------------------------------------------------------
+# GitHub
+
+
+class _Obj:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeGithubError(Exception):
+    pass
+
+
+class FakeRepo:
+    def __init__(self, github, full_name: str):
+        self.github = github
+        self.full_name = full_name
+        self.permissions = _Obj(admin=False, push=True, pull=True)
+
+    def _call(self):
+        time.sleep(self.github.latency)
+
+    def _sha(self):
+        return uuid.uuid4().hex + uuid.uuid4().hex[:8]
+
+    def get_branch(self, name):
+        self._call()
+        if name.startswith('claude-code-'):
+            raise FakeGithubError('Branch not found')
+        return _Obj(name=name, commit=_Obj(sha=self._sha()))
+
+    def get_branches(self):
+        self._call()
+        return [_Obj(name='main')]
+
+    def get_git_ref(self, ref):
+        self._call()
+        return _Obj(ref=ref, edit=lambda sha: self._call(), delete=lambda: self._call())
+
+    def create_git_ref(self, ref, sha):
+        self._call()
+        return _Obj(ref=ref, object=_Obj(sha=sha))
+
+    def get_contents(self, path, ref=None):
+        self._call()
+        raise FakeGithubError(f'{path} not found')  # Every fake change is a new file
+
+    def get_commit(self, sha):
+        self._call()
+        return _Obj(sha=self._sha(), commit=_Obj(tree=_Obj(sha=self._sha())))
+
+    def create_git_blob(self, content, encoding):
+        self._call()
+        return _Obj(sha=self._sha())
+
+    def create_git_tree(self, elements, base_tree=None):
+        self._call()
+        return _Obj(sha=self._sha())
+
+    def create_git_commit(self, message, tree, parents):
+        self._call()
+        return _Obj(sha=self._sha())
+
+    def update_file(self, **kwargs):
+        self._call()
+
+    def create_file(self, **kwargs):
+        self._call()
+
+    def create_pull(self, title, body, head, base):
+        self._call()
+        number = next(self.github.pull_numbers)
+        return _Obj(number=number, html_url=f'https://github.com/{self.full_name}/pull/{number}')
+
+
+class FakeGithub:
+    """PyGithub ``Github`` replacement; construct with ``FakeGithub.factory(latency)``"""
+
+    pull_numbers = itertools.count(1)
+
+    def __init__(self, token: str = None, latency: float = 0.05):
+        self.token = token
+        self.latency = latency
+
+    @classmethod
+    def factory(cls, latency: float = 0.05):
+        return lambda token=None, *args, **kwargs: cls(token, latency)
+
+    def get_user(self):
+        time.sleep(self.latency)
+        return _Obj(login='load-test')
+
+    def get_rate_limit(self):
+        time.sleep(self.latency)
+        return _Obj(core=_Obj(limit=5000, remaining=5000))
+
+    def get_repo(self, full_name):
+        time.sleep(self.latency)
+        return FakeRepo(self, full_name)
+
+
+# ---------------------------------------------------------------------------
+
+
+def install(docker_options: dict = None, supabase_latency: float = 0.01, github_latency: float = 0.05) -> dict:
+    """Point the server's clients at the fakes; call before the first request.
+
+    Returns the installed fakes: ``{'supabase', 'docker': {host name: client}}``.
+    """
+    import database
+    import github_client
+    from utils import code_task_v2
+
+    fake_db = FakeSupabase(supabase_latency)
+    database.set_supabase(fake_db)
+    github_client.set_github_factory(FakeGithub.factory(github_latency))
+
+    fake_docker = {}
+    for host in code_task_v2.get_docker_pool().hosts.values():
+        host.client = fake_docker[host.name] = FakeDockerClient(**(docker_options or {}))
+    return {'supabase': fake_db, 'docker': fake_docker}
@@ -0,0 +1,142 @@
+"""Speed, size and correctness of the diff viewer's precomputed hunks.
+
+    cd server
+    python -m bench.hunks_bench                       # 1k/10k/100k-line files, compared with bench/hunks_baseline.json
+    python -m bench.hunks_bench --lines 1000000 --edit-rates 0.01
+    python -m bench.hunks_bench --write-baseline      # refresh the committed baseline
+
+Every case is a synthetic file pair (bench/corpus.py) with ``edit_rate`` of its
+lines edited. Each run checks that the hunks describe exactly the edit from
+before to after (applying them to before yields after) and reports how many
+lines per second are diffed, rendered, and how large the stored hunks are
+compared to the two file versions. ``difflib_seconds`` is the standard
+library's SequenceMatcher on the same lines, for reference.
+"""
+import argparse
+import difflib
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from utils.hunks import DELETE, INSERT, compute_hunks, render_hunks, split_lines
+
+from . import corpus
+from .loadtest import DEFAULT_TOLERANCE, compare
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'hunks_baseline.json')
+
+DEFAULT_LINES = '1000,10000,100000'
+DEFAULT_EDIT_RATES = '0.001,0.01,0.1'
+# SequenceMatcher is quadratic on dissimilar input; it is skipped above this many lines
+DIFFLIB_MAX_LINES = 20000
+
+
+def apply_hunks(before: str, after: str, hunks: list) -> list:
+    """Lines of ``after`` rebuilt from ``before`` and the hunks' rendered insertions"""
+    old_lines = split_lines(before)
+    rebuilt, old_at = [], 0
+    for hunk in render_hunks(before, after, hunks):
+        for tag, old_no, _, text, _ in hunk['lines']:
+            if old_no is not None:
+                rebuilt += old_lines[old_at:old_no - 1]
+                old_at = old_no
+            if tag != DELETE:
+                rebuilt.append(text)
+    return rebuilt + old_lines[old_at:]
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def run_case(lines: int, edit_rate: float, seed: int = 0) -> dict:
+    before, after = corpus.edited_file_pair(lines, edit_rate, seed)
+    hunks, compute_seconds = _timed(compute_hunks, before, after)
+    rendered, render_seconds = _timed(render_hunks, before, after, hunks)
+
+    tracemalloc.start()
+    try:
+        compute_hunks(before, after)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total_lines = len(split_lines(before)) + len(split_lines(after))
+    stored = len(json.dumps(hunks, separators=(',', ':')))
+    results = {
+        'diff_lines_per_sec': round(total_lines / compute_seconds),
+        'render_lines_per_sec': round(sum(len(hunk['lines']) for hunk in rendered) / max(render_seconds, 1e-9)),
+        'compute_peak_memory_mb': round(peak / 1e6, 2),
+        'stored_bytes': stored,
+        'stored_ratio': round(stored / (len(before) + len(after)), 4),
+        'mismatches': int(apply_hunks(before, after, hunks) != split_lines(after)),
+    }
+    if lines <= DIFFLIB_MAX_LINES:
+        _, difflib_seconds = _timed(lambda: difflib.SequenceMatcher(None, split_lines(before), split_lines(after), autojunk=False).get_opcodes())
+        results['difflib_seconds'] = round(difflib_seconds, 4)
+    return {
+        'config': {'lines': lines, 'edit_rate': edit_rate, 'hunks': len(hunks),
+                   'changed_lines': sum(count for hunk in hunks for tag, count in hunk['ops'] if tag in (DELETE, INSERT))},
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', default=DEFAULT_LINES, help='Comma-separated file sizes in lines')
+    parser.add_argument('--edit-rates', default=DEFAULT_EDIT_RATES, help='Comma-separated fractions of edited lines')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the report as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--write-baseline', action='store_true', help='Store the report as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+
+    report = {}
+    for lines in (int(value) for value in args.lines.split(',') if value):
+        for edit_rate in (float(value) for value in args.edit_rates.split(',') if value):
+            name = f'{lines}_lines_{edit_rate:g}_edited'
+            print(f"🏃 Diffing {lines} lines with {edit_rate:.1%} edited...", file=sys.stderr)
+            report[name] = run_case(lines, edit_rate, args.seed)
+            print(json.dumps({name: report[name]['results']}, indent=2))
+            if report[name]['results']['mismatches']:
+                print(f"❌ Hunks for {name} do not turn before into after", file=sys.stderr)
+                return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.write_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(report)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"💾 Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️  {len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {regression}", file=sys.stderr)
+            return 2
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Encode speed and memory of the API's JSON providers on large task payloads.
+
+    cd server
+    python -m bench.json_bench                         # task detail and task list, compared with bench/json_baseline.json
+    python -m bench.json_bench --tasks 10000 --files 500
+    python -m bench.json_bench --write-baseline        # refresh the committed baseline
+
+``task_detail`` is one completed task as ``GET /tasks/<id>`` returns it (chat
+history, diff and file snapshots with hunks, bench/corpus.py);
+``task_list`` is ``GET /tasks`` for a user with many tasks. Each payload is
+encoded by Flask's default provider (what the API used before), the stdlib
+provider and the orjson provider (when installed), and every output is decoded
+and checked against the payload. For the list, ``streamed_peak_memory_mb`` is
+the peak while the streamed response is consumed chunk by chunk.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from json_provider import OrjsonProvider, StdlibJSONProvider
+
+from . import corpus
+from .loadtest import DEFAULT_TOLERANCE, compare
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'json_baseline.json')
+
+DEFAULT_FILES = 100
+DEFAULT_LINES_PER_FILE = 2000
+DEFAULT_CHAT_MESSAGES = 200
+DEFAULT_TASKS = 2000
+
+
+def _best_time(func, payload, min_seconds: float = 1.0, max_runs: int = 10) -> float:
+    times = []
+    while len(times) < max_runs and (len(times) < 3 or sum(times) < min_seconds):
+        started = time.perf_counter()
+        func(payload)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def _peak_memory_mb(func, payload) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(payload)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return round(peak / 1e6, 2)
+
+
+def _encoders(app) -> dict:
+    return {
+        'flask_default': lambda payload: DefaultJSONProvider(app).dumps(payload).encode(),
+        'stdlib': StdlibJSONProvider(app).dumps_bytes,
+        'orjson': OrjsonProvider(app).dumps_bytes,
+    }
+
+
+def task_list_payload(tasks: int, chat_messages: int) -> dict:
+    """``GET /tasks`` body for ``tasks`` tasks, shaped as tasks.py formats them"""
+    template = corpus.synthetic_task(0, chat_messages=chat_messages, files=1, lines_per_file=10)
+    formatted = {}
+    for task_id in range(1, tasks + 1):
+        formatted[str(task_id)] = {
+            'id': task_id, 'status': 'completed', 'created_at': template['created_at'],
+            'prompt': template['chat_messages'][0]['content'][:50] + '...', 'has_patch': True,
+            'project_id': 1, 'repo_url': template['repo_url'], 'agent': 'claude',
+            'chat_messages': [dict(message, content=f"{task_id}: {message['content']}") for message in template['chat_messages']],
+        }
+    return {'status': 'success', 'tasks': formatted, 'total_tasks': tasks}
+
+
+def _streamed_peak_memory_mb(app, payload: dict, key: str) -> float:
+    with app.test_request_context():
+        gc.collect()
+        tracemalloc.start()
+        try:
+            response = json_provider.streamed_json_response(payload, key)
+            chunks = 0
+            for chunk in response.response:
+                chunks += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return round(peak / 1e6, 2)
+
+
+def run_case(app, payload: dict, stream_key: str = None) -> dict:
+    results, mismatches = {}, 0
+    megabytes = None
+    for name, encode in _encoders(app).items():
+        body = encode(payload)
+        megabytes = megabytes or len(body) / 1e6
+        mismatches += json.loads(body) != payload
+        del body
+        results[f'{name}_mb_per_sec'] = round(megabytes / _best_time(encode, payload), 1)
+        results[f'{name}_peak_memory_mb'] = _peak_memory_mb(encode, payload)
+    if stream_key:
+        results['streamed_peak_memory_mb'] = _streamed_peak_memory_mb(app, payload, stream_key)
+    results['mismatches'] = mismatches
+    return {'config': {'megabytes': round(megabytes, 2)}, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=DEFAULT_FILES, help='Changed files in the task detail payload')
+    parser.add_argument('--lines-per-file', type=int, default=DEFAULT_LINES_PER_FILE)
+    parser.add_argument('--chat-messages', type=int, default=DEFAULT_CHAT_MESSAGES, help='Chat messages per task')
+    parser.add_argument('--tasks', type=int, default=DEFAULT_TASKS, help='Tasks in the task list payload')
+    parser.add_argument('--output', help='Write the report as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--write-baseline', action='store_true', help='Store the report as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+
+    app = Flask(__name__)
+    json_provider.init_app(app)
+    cases = {
+        'task_detail': lambda: (corpus.synthetic_task(0, args.chat_messages, args.files, args.lines_per_file), None),
+        'task_list': lambda: (task_list_payload(args.tasks, args.chat_messages // 10), 'tasks'),
+    }
+
+    report = {}
+    for name, build in cases.items():
+        print(f"🏃 Encoding {name}...", file=sys.stderr)
+        payload, stream_key = build()
+        report[name] = run_case(app, payload, stream_key)
+        print(json.dumps({name: report[name]}, indent=2))
+        if report[name]['results']['mismatches']:
+            print(f"❌ {name} did not round-trip", file=sys.stderr)
+            return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.write_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(report)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"💾 Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️  {len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {regression}", file=sys.stderr)
+            return 2
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+"""Offline load test of the task API and execution pipeline against in-process fakes.
+
+    cd server
+    python -m bench.loadtest                       # every scenario, compared with bench/baseline.json
+    python -m bench.loadtest --scenario burst --tasks 500
+    python -m bench.loadtest --write-baseline      # refresh the committed baseline
+
+Each scenario runs in a fresh interpreter so thread counts and peak RSS are its own.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+SCENARIOS = {
+    # Many clients hitting /start-task at once; tasks are short
+    'burst': {
+        'tasks': 200, 'concurrency': 50, 'runtime': 0.5, 'log_bytes': 20_000, 'changed_files': 3,
+    },
+    # A steady set of running tasks while the UI polls /task-status
+    'polling': {
+        'tasks': 40, 'concurrency': 10, 'runtime': 5.0, 'log_bytes': 20_000, 'changed_files': 3,
+        'pollers': 50, 'duration': 5.0,
+    },
+    # Few tasks with huge outputs, then a PR for each (patch applied through the GitHub API)
+    'large_diff': {
+        'tasks': 10, 'concurrency': 5, 'runtime': 1.0, 'log_bytes': 20_000_000, 'changed_files': 200,
+    },
+}
+
+DEFAULT_LATENCIES = {
+    'supabase_latency': 0.01,
+    'github_latency': 0.02,
+    'create_latency': 0.05,
+    'start_latency': 0.1,
+}
+
+# Share of change that counts as a regression when comparing with the baseline
+DEFAULT_TOLERANCE = 0.25
+
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1] * 1000, 2)}
+
+
+class _ThreadSampler:
+    """Track the peak number of live threads while a scenario runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+
+def _timed(func, *args, **kwargs):
+    started_at = time.perf_counter()
+    response = func(*args, **kwargs)
+    return time.perf_counter() - started_at, response
+
+
+class Harness:
+    """The Flask app wired to fakes, plus helpers to drive it"""
+
+    def __init__(self, config: dict):
+        # The pool reads DOCKER_HOSTS at import; base URLs are never dialed
+        os.environ['DOCKER_HOSTS'] = ','.join(f'bench{index}=tcp://fake-{index}:2375*{config["host_capacity"]}' for index in range(config['hosts']))
+        os.environ['DOCKER_HOST_CAPACITY'] = str(config['host_capacity'])
+        os.environ.pop('EXECUTION_ENGINE', None)
+        # One user submits every task: quotas are checked but never bind
+        os.environ['QUOTAS_ENABLED'] = 'true'
+        for quota in ('CONCURRENT_TASKS', 'TASKS_PER_HOUR', 'CONTAINER_MINUTES_PER_DAY', 'AGENT_TOKENS_PER_DAY'):
+            os.environ[f'QUOTA_USER_{quota}'] = '0'
+
+        from bench import fakes
+        import main
+
+        self.config = config
+        self.app = main.app
+        self.fakes = fakes.install(
+            docker_options={
+                'create_latency': config['create_latency'],
+                'start_latency': config['start_latency'],
+                'runtime': config['runtime'],
+                'log_bytes': config['log_bytes'],
+                'changed_files': config['changed_files'],
+            },
+            supabase_latency=config['supabase_latency'],
+            github_latency=config['github_latency'],
+        )
+        self.db = self.fakes['supabase']
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        # Flask test clients are not shared between threads
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def start_task(self, index: int):
+        """POST /start-task; returns (latency, response, perf_counter() at submission)"""
+        return _timed(self.client.post, '/start-task', headers={'X-User-ID': 'load-test'}, json={
+            'prompt': f'Load test task {index}',
+            'repo_url': f'https://github.com/load-test/repo-{index % 8}',
+            'github_token': 'fake-token',
+        }) + (time.perf_counter(),)
+
+    def task_status(self, task_id: int):
+        return _timed(self.client.get, f'/task-status/{task_id}', headers={'X-User-ID': 'load-test'})
+
+    def create_pr(self, task_id: int):
+        return _timed(self.client.post, f'/create-pr/{task_id}', headers={'X-User-ID': 'load-test'}, json={'github_token': 'fake-token'})
+
+    def submit_all(self) -> tuple:
+        """Start ``tasks`` tasks from ``concurrency`` clients; returns (latencies, {task_id: submitted_at})"""
+        latencies, submitted, errors = [], {}, 0
+        with ThreadPoolExecutor(self.config['concurrency']) as executor:
+            for elapsed, response, returned_at in executor.map(self.start_task, range(self.config['tasks'])):
+                latencies.append(elapsed)
+                if response.status_code == 200:
+                    submitted[response.get_json()['task_id']] = returned_at - elapsed
+                else:
+                    errors += 1
+        return latencies, submitted, errors
+
+    def wait_finished(self, task_ids, timeout: float) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if all(task_id in self.db.finished_at for task_id in task_ids):
+                return True
+            time.sleep(0.02)
+        return False
+
+    def task_rows(self, task_ids) -> list:
+        with self.db.lock:
+            return [row for row in self.db.tables['tasks'] if row['id'] in task_ids]
+
+
+def _completion_results(harness: Harness, submitted: dict, started_at: float, timeout: float) -> dict:
+    finished = harness.wait_finished(submitted, timeout)
+    rows = harness.task_rows(submitted)
+    done = [task_id for task_id in submitted if task_id in harness.db.finished_at]
+    last_finished = max((harness.db.finished_at[task_id] for task_id in done), default=time.perf_counter())
+    return {
+        'tasks_completed': sum(1 for row in rows if row['status'] == 'completed'),
+        'tasks_failed': sum(1 for row in rows if row['status'] != 'completed'),
+        'tasks_unfinished': 0 if finished else len(submitted) - len(done),
+        'tasks_per_sec': round(len(done) / (last_finished - started_at), 2) if done else 0.0,
+        'task_latency_ms': _percentiles([harness.db.finished_at[task_id] - submitted[task_id] for task_id in done]),
+    }
+
+
+def scenario_burst(harness: Harness, config: dict) -> dict:
+    started_at = time.perf_counter()
+    latencies, submitted, errors = harness.submit_all()
+    submit_seconds = time.perf_counter() - started_at
+    results = {
+        'start_task_errors': errors,
+        'start_task_per_sec': round(len(latencies) / submit_seconds, 2),
+        'start_task_latency_ms': _percentiles(latencies),
+    }
+    results.update(_completion_results(harness, submitted, started_at, config['timeout']))
+    return results
+
+
+def scenario_polling(harness: Harness, config: dict) -> dict:
+    _, submitted, _ = harness.submit_all()
+    task_ids = list(submitted)
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + config['duration']
+
+    def poll(worker: int):
+        nonlocal errors
+        local, failed, index = [], 0, worker
+        while time.perf_counter() < deadline:
+            elapsed, response = harness.task_status(task_ids[index % len(task_ids)])
+            local.append(elapsed)
+            failed += response.status_code != 200
+            index += 1
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(config['pollers']) as executor:
+        list(executor.map(poll, range(config['pollers'])))
+    elapsed = time.perf_counter() - started_at
+    harness.wait_finished(task_ids, config['timeout'])
+    return {
+        'poll_errors': errors,
+        'poll_requests': len(latencies),
+        'poll_per_sec': round(len(latencies) / elapsed, 2),
+        'poll_latency_ms': _percentiles(latencies),
+    }
+
+
+def scenario_large_diff(harness: Harness, config: dict) -> dict:
+    started_at = time.perf_counter()
+    _, submitted, errors = harness.submit_all()
+    results = {'start_task_errors': errors}
+    results.update(_completion_results(harness, submitted, started_at, config['timeout']))
+
+    completed = [row['id'] for row in harness.task_rows(submitted) if row['status'] == 'completed']
+    latencies, pr_errors = [], 0
+    with ThreadPoolExecutor(config['concurrency']) as executor:
+        for elapsed, response in executor.map(harness.create_pr, completed):
+            latencies.append(elapsed)
+            pr_errors += response.status_code != 200
+    results.update({'create_pr_errors': pr_errors, 'create_pr_latency_ms': _percentiles(latencies)})
+    return results
+
+
+SCENARIO_RUNNERS = {
+    'burst': scenario_burst,
+    'polling': scenario_polling,
+    'large_diff': scenario_large_diff,
+}
+
+
+def run_scenario(name: str, overrides: dict) -> dict:
+    """Run one scenario in this process and return its report"""
+    config = dict(DEFAULT_LATENCIES, hosts=2, host_capacity=10, timeout=120.0)
+    config.update(SCENARIOS[name])
+    config.update({key: value for key, value in overrides.items() if value is not None})
+
+    harness = Harness(config)
+    with _ThreadSampler() as threads:
+        started_at = time.perf_counter()
+        results = SCENARIO_RUNNERS[name](harness, config)
+        results['wall_seconds'] = round(time.perf_counter() - started_at, 2)
+    results['peak_threads'] = threads.peak
+    # ru_maxrss is in KiB on Linux
+    results['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return {'scenario': name, 'config': config, 'results': results}
+
+
+def _flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and value is not None:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that moved the wrong way by more than ``tolerance`` relative to the baseline"""
+    regressions = []
+    for name, entry in report.items():
+        if name not in baseline:
+            continue
+        current, previous = _flatten(entry['results']), _flatten(baseline[name]['results'])
+        for metric, value in current.items():
+            before = previous.get(metric)
+            if not before or 'errors' in metric or metric in ['wall_seconds', 'poll_requests']:
+                continue
+            higher_is_better = metric.endswith('_per_sec') or metric == 'tasks_completed'
+            change = (value - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}.{metric}: {before} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['all'], default='all')
+    parser.add_argument('--tasks', type=int)
+    parser.add_argument('--concurrency', type=int)
+    parser.add_argument('--runtime', type=float, help='Seconds each fake container runs')
+    parser.add_argument('--log-bytes', type=int, help='Size of each task\'s container output')
+    parser.add_argument('--changed-files', type=int)
+    parser.add_argument('--supabase-latency', type=float)
+    parser.add_argument('--github-latency', type=float)
+    parser.add_argument('--start-latency', type=float, help='Fake container start latency in seconds')
+    parser.add_argument('--hosts', type=int)
+    parser.add_argument('--host-capacity', type=int)
+    parser.add_argument('--output', help='Write the report as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--write-baseline', action='store_true', help='Store the report as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--verbose', action='store_true', help='Keep the server\'s INFO logging')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    overrides = {
+        'tasks': args.tasks, 'concurrency': args.concurrency, 'runtime': args.runtime,
+        'log_bytes': args.log_bytes, 'changed_files': args.changed_files,
+        'supabase_latency': args.supabase_latency, 'github_latency': args.github_latency,
+        'start_latency': args.start_latency, 'hosts': args.hosts, 'host_capacity': args.host_capacity,
+    }
+
+    if args.child:
+        if not args.verbose:
+            # Request and pipeline logging would otherwise dominate the profile
+            logging.disable(logging.INFO)
+        print(json.dumps(run_scenario(args.scenario, overrides)))
+        return 0
+
+    names = sorted(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    report = {}
+    for name in names:
+        command = [sys.executable, '-m', 'bench.loadtest', '--child', '--scenario', name]
+        for flag, value in overrides.items():
+            if value is not None:
+                command += [f"--{flag.replace('_', '-')}", str(value)]
+        if args.verbose:
+            command.append('--verbose')
+        print(f"🏃 Running scenario '{name}'...", file=sys.stderr)
+        completed = subprocess.run(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            print(f"❌ Scenario '{name}' failed (exit code {completed.returncode})", file=sys.stderr)
+            return 1
+        report[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(json.dumps({name: report[name]['results']}, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.write_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(report)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"💾 Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️  {len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {regression}", file=sys.stderr)
+            return 2
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
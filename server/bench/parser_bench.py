@@ -0,0 +1,185 @@
+"""Throughput, memory and correctness of container output parsing.
+
+    cd server
+    python -m bench.parser_bench                         # samples, fuzz and 1MB/10MB/100MB, compared with bench/parser_baseline.json
+    python -m bench.parser_bench --sizes 1GB --files 5000
+    python -m bench.parser_bench --fuzz 20000 --sizes ""  # correctness only
+    python -m bench.parser_bench --write-baseline        # refresh the committed baseline
+
+Every size is a synthetic task output (bench/corpus.py) of new, modified and
+deleted files whose contents include lines identical to the script's markers.
+Throughput is measured without tracemalloc; peak memory is what the parser
+allocates on top of the log it is given.
+"""
+import argparse
+import gc
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from utils.output_parser import parse_container_output
+from utils.timeline import parse_timeline
+
+from . import corpus
+from .loadtest import DEFAULT_TOLERANCE, compare
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'parser_baseline.json')
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), 'samples')
+
+DEFAULT_SIZES = '1MB,10MB,100MB'
+DEFAULT_FUZZ_CASES = 2000
+DEFAULT_COLLISION_RATE = 0.001
+_UNITS = {'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3}
+
+
+def _parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for unit, factor in _UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def _default_files(size: int) -> int:
+    # Roughly 50KB of output per file, from a handful of files up to thousands
+    return min(5000, max(10, size // 50_000))
+
+
+def _mismatches(results: dict, expected: dict) -> list:
+    return [key for key in expected if results.get(key) != expected[key]]
+
+
+def check_samples() -> list:
+    """Recorded outputs in bench/samples whose parse differs from the stored result"""
+    failures = []
+    for log_path in sorted(glob.glob(os.path.join(SAMPLES_DIR, '*.log'))):
+        with open(log_path) as f:
+            logs = f.read()
+        with open(log_path[:-len('.log')] + '.json') as f:
+            expected = json.load(f)
+        mismatched = _mismatches(parse_container_output(logs), expected)
+        if mismatched:
+            failures.append(f"{os.path.basename(log_path)}: {', '.join(mismatched)}")
+    return failures
+
+
+def fuzz(cases: int, first_seed: int = 0) -> list:
+    """Seeds of random collision-heavy outputs that parse differently from what was printed"""
+    failures = []
+    for seed in range(first_seed, first_seed + cases):
+        logs, expected = corpus.fuzz_case(seed)
+        mismatched = _mismatches(parse_container_output(logs), expected)
+        if mismatched:
+            failures.append(f"seed {seed}: {', '.join(mismatched)}")
+    return failures
+
+
+def _best_time(func, logs: str, min_seconds: float = 1.0, max_runs: int = 10) -> float:
+    times = []
+    while len(times) < max_runs and (len(times) < 3 or sum(times) < min_seconds):
+        started = time.perf_counter()
+        func(logs)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def _peak_memory_mb(func, logs: str) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        results = func(logs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del results
+    return round(peak / 1e6, 2)
+
+
+def run_size(size: int, files: int, collision_rate: float) -> dict:
+    logs, expected = corpus.corpus_of_size(size, files, collision_rate)
+    mismatched = _mismatches(parse_container_output(logs), expected)
+    megabytes = len(logs.encode()) / 1e6
+
+    parse_seconds = _best_time(parse_container_output, logs)
+    timeline_seconds = _best_time(parse_timeline, logs)
+    return {
+        'config': {'bytes': len(logs), 'files': files, 'collision_rate': collision_rate},
+        'results': {
+            'parse_mb_per_sec': round(megabytes / parse_seconds, 1),
+            'timeline_mb_per_sec': round(megabytes / timeline_seconds, 1),
+            'parse_peak_memory_mb': _peak_memory_mb(parse_container_output, logs),
+            'mismatches': len(mismatched),
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated output sizes, e.g. 1MB,1GB')
+    parser.add_argument('--files', type=int, help='Changed files per output (default scales with size)')
+    parser.add_argument('--collision-rate', type=float, default=DEFAULT_COLLISION_RATE,
+                        help='Fraction of file lines that look like script markers')
+    parser.add_argument('--fuzz', type=int, default=DEFAULT_FUZZ_CASES, help='Random outputs to check for exact parses')
+    parser.add_argument('--seed', type=int, default=0, help='First fuzz seed')
+    parser.add_argument('--output', help='Write the report as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--write-baseline', action='store_true', help='Store the report as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+
+    failures = check_samples()
+    print(f"🔍 Checking {args.fuzz} fuzz cases...", file=sys.stderr)
+    failures += fuzz(args.fuzz, args.seed)
+    if failures:
+        print(f"❌ {len(failures)} output(s) parsed incorrectly:", file=sys.stderr)
+        for failure in failures[:20]:
+            print(f"   {failure}", file=sys.stderr)
+        return 1
+    print("✅ Samples and fuzz cases parsed exactly", file=sys.stderr)
+
+    report = {}
+    for text in filter(None, args.sizes.split(',')):
+        size = _parse_size(text)
+        print(f"🏃 Parsing a {text.strip()} output...", file=sys.stderr)
+        report[text.strip()] = run_size(size, args.files or _default_files(size), args.collision_rate)
+        print(json.dumps({text.strip(): report[text.strip()]['results']}, indent=2))
+        if report[text.strip()]['results']['mismatches']:
+            print(f"❌ The {text.strip()} output parsed incorrectly", file=sys.stderr)
+            return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.write_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(report)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"💾 Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️  {len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {regression}", file=sys.stderr)
+            return 2
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Import time of the API and worker entry points, in fresh interpreters.
+
+    cd server
+    python -m bench.startup_bench                      # compared with bench/startup_baseline.json
+    python -m bench.startup_bench --runs 10
+    python -m bench.startup_bench --write-baseline     # refresh the committed baseline
+
+Each entry point is imported ``--runs`` times in a new process and the median
+is reported as ``import_seconds``; one more run with ``-X importtime`` lists
+the slowest imports. Supabase is configured with an unreachable URL, so a
+client built at import time would show up in ``clients_created`` (the
+Supabase, GitHub and Docker clients must all wait for their first use).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from .loadtest import DEFAULT_TOLERANCE, compare
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'startup_baseline.json')
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ['main', 'worker']
+DEFAULT_RUNS = 5
+SLOWEST_IMPORTS = 10
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+import database, github_client
+from utils import code_task_v2
+created = {{
+    'supabase': database._supabase is not None or 'supabase' in sys.modules,
+    'github': github_client._github_factory is not None or 'github' in sys.modules,
+    'docker': 'docker_pool' in code_task_v2._executor and any(host._client is not None for host in code_task_v2._executor['docker_pool'].hosts.values()),
+}}
+print(json.dumps({{'seconds': seconds, 'clients': sorted(name for name, made in created.items() if made)}}))
+'''
+
+
+def _run(module: str, importtime: bool = False) -> tuple:
+    """(child report, stderr) of one import of ``module`` in a fresh interpreter"""
+    env = dict(os.environ, SUPABASE_URL='http://127.0.0.1:9', SUPABASE_SERVICE_ROLE_KEY='startup-bench', PYTHONDONTWRITEBYTECODE='1')
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD.format(module=module)]
+    finished = subprocess.run(command, cwd=SERVER_DIR, env=env, capture_output=True, text=True, timeout=120)
+    if finished.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{finished.stderr[-2000:]}")
+    return json.loads(finished.stdout.strip().splitlines()[-1]), finished.stderr
+
+
+def slowest_imports(importtime_output: str, module: str, limit: int = SLOWEST_IMPORTS) -> list:
+    """Modules imported by ``module`` with the largest cumulative import time, from ``-X importtime`` output"""
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() != module:
+            imports.append((int(cumulative), name.strip()))
+    return [f"{name}: {microseconds / 1e3:.0f}ms" for microseconds, name in sorted(imports, reverse=True)[:limit]]
+
+
+def run_entry_point(module: str, runs: int) -> dict:
+    times, clients = [], set()
+    for _ in range(runs):
+        report, _ = _run(module)
+        times.append(report['seconds'])
+        clients.update(report['clients'])
+    _, importtime = _run(module, importtime=True)
+    return {
+        'config': {'runs': runs, 'slowest_imports': slowest_imports(importtime, module), 'clients': sorted(clients)},
+        'results': {'import_seconds': round(statistics.median(times), 3), 'clients_created': len(clients)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Imports per entry point')
+    parser.add_argument('--output', help='Write the report as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--write-baseline', action='store_true', help='Store the report as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = {}
+    for module in ENTRY_POINTS:
+        print(f"🏃 Importing {module}...", file=sys.stderr)
+        report[module] = run_entry_point(module, args.runs)
+        print(json.dumps({module: report[module]}, indent=2))
+        if report[module]['results']['clients_created']:
+            print(f"❌ import {module} created clients: {', '.join(report[module]['config']['clients'])}", file=sys.stderr)
+            return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.write_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"💾 Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️  {len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {regression}", file=sys.stderr)
+            return 2
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,38 +1,57 @@
 import os
 import logging
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from supabase import create_client, Client
+from metrics import SUPABASE_LATENCY, track_latency
 import json
 
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase client (optional)
+# Supabase client (optional), created on first use so importing this module never
+# loads the supabase package or touches the network
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')  # Use service role key for server operations
 
-supabase: Client = None
+_supabase = None
+_supabase_attempted = False
+_supabase_lock = threading.Lock()
 
-if supabase_url and supabase_key:
-    try:
-        supabase = create_client(supabase_url, supabase_key)
-        logger.info("Supabase client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase client: {e}")
-        supabase = None
-else:
+if not (supabase_url and supabase_key):
     logger.warning("Supabase configuration not provided - database features will be disabled")
     logger.info("To enable database features, set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables")
 
+def get_supabase():
+    """Supabase client, created on first call; None when it is not configured or could not be created"""
+    global _supabase, _supabase_attempted
+    if not _supabase_attempted and supabase_url and supabase_key:
+        with _supabase_lock:
+            if not _supabase_attempted:
+                try:
+                    from supabase import create_client
+                    _supabase = create_client(supabase_url, supabase_key)
+                    logger.info("Supabase client initialized successfully")
+                except Exception as e:
+                    logger.error(f"Failed to initialize Supabase client: {e}")
+                _supabase_attempted = True
+    return _supabase
+
+def set_supabase(client):
+    """Use ``client`` (for example an in-memory fake) instead of creating one from the environment"""
+    global _supabase, _supabase_attempted
+    with _supabase_lock:
+        _supabase, _supabase_attempted = client, True
+
 class DatabaseOperations:
     
     @staticmethod
     def _check_database_available():
         """Check if database is available and raise appropriate error if not"""
-        if supabase is None:
+        if get_supabase() is None:
             raise ValueError("Database not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables")
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def create_project(user_id: str, name: str, description: str, repo_url: str, 
                       repo_name: str, repo_owner: str, settings: Dict = None) -> Dict:
         """Create a new project"""
@@ -49,57 +68,62 @@ class DatabaseOperations:
                 'is_active': True
             }
             
-            result = supabase.table('projects').insert(project_data).execute()
+            result = get_supabase().table('projects').insert(project_data).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error creating project: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def get_user_projects(user_id: str) -> List[Dict]:
         """Get all projects for a user"""
         try:
-            result = supabase.table('projects').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
+            result = get_supabase().table('projects').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
             return result.data or []
         except Exception as e:
             logger.error(f"Error fetching user projects: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def get_project_by_id(project_id: int, user_id: str) -> Optional[Dict]:
         """Get a specific project by ID for a user"""
         try:
-            result = supabase.table('projects').select('*').eq('id', project_id).eq('user_id', user_id).execute()
+            result = get_supabase().table('projects').select('*').eq('id', project_id).eq('user_id', user_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error fetching project {project_id}: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def update_project(project_id: int, user_id: str, updates: Dict) -> Optional[Dict]:
         """Update a project"""
         try:
             updates['updated_at'] = datetime.utcnow().isoformat()
-            result = supabase.table('projects').update(updates).eq('id', project_id).eq('user_id', user_id).execute()
+            result = get_supabase().table('projects').update(updates).eq('id', project_id).eq('user_id', user_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error updating project {project_id}: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def delete_project(project_id: int, user_id: str) -> bool:
         """Delete a project"""
         try:
-            result = supabase.table('projects').delete().eq('id', project_id).eq('user_id', user_id).execute()
+            result = get_supabase().table('projects').delete().eq('id', project_id).eq('user_id', user_id).execute()
             return len(result.data) > 0
         except Exception as e:
             logger.error(f"Error deleting project {project_id}: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def create_task(user_id: str, project_id: int = None, repo_url: str = None, 
                    target_branch: str = 'main', agent: str = 'claude', 
-                   chat_messages: List[Dict] = None) -> Dict:
+                   chat_messages: List[Dict] = None, priority: str = 'interactive') -> Dict:
         """Create a new task"""
         try:
             task_data = {
@@ -108,22 +132,24 @@ class DatabaseOperations:
                 'repo_url': repo_url,
                 'target_branch': target_branch,
                 'agent': agent,
+                'priority': priority,
                 'status': 'pending',
                 'chat_messages': chat_messages or [],
                 'execution_metadata': {}
             }
             
-            result = supabase.table('tasks').insert(task_data).execute()
+            result = get_supabase().table('tasks').insert(task_data).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error creating task: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def get_user_tasks(user_id: str, project_id: int = None) -> List[Dict]:
         """Get all tasks for a user, optionally filtered by project"""
         try:
-            query = supabase.table('tasks').select('*').eq('user_id', user_id)
+            query = get_supabase().table('tasks').select('*').eq('user_id', user_id)
             if project_id:
                 query = query.eq('project_id', project_id)
             result = query.order('created_at', desc=True).execute()
@@ -133,34 +159,285 @@ class DatabaseOperations:
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def get_task_by_id(task_id: int, user_id: str) -> Optional[Dict]:
         """Get a specific task by ID for a user"""
         try:
-            result = supabase.table('tasks').select('*').eq('id', task_id).eq('user_id', user_id).execute()
+            result = get_supabase().table('tasks').select('*').eq('id', task_id).eq('user_id', user_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error fetching task {task_id}: {e}")
             raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_task_version(task_id: int, user_id: str) -> Optional[Dict]:
+        """Get just enough of a task (id, status, updated_at) to tell whether it changed"""
+        try:
+            result = get_supabase().table('tasks').select('id, status, updated_at').eq('id', task_id).eq('user_id', user_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error fetching version of task {task_id}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_tasks_by_status(statuses: List[str]) -> List[Dict]:
+        """Get tasks of all users in the given statuses, oldest first"""
+        try:
+            result = get_supabase().table('tasks').select('*').in_('status', statuses).order('created_at').execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error fetching tasks by status: {e}")
+            raise
     
     @staticmethod
+    def stamp_task_updates(updates: Dict) -> Dict:
+        """Add the status transition and updated_at timestamps to a task update"""
+        if 'status' in updates:
+            if updates['status'] == 'running' and 'started_at' not in updates:
+                updates['started_at'] = datetime.utcnow().isoformat()
+            elif updates['status'] in ['completed', 'failed', 'cancelled'] and 'completed_at' not in updates:
+                updates['completed_at'] = datetime.utcnow().isoformat()
+        
+        updates['updated_at'] = datetime.utcnow().isoformat()
+        return updates
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def update_task(task_id: int, user_id: str, updates: Dict) -> Optional[Dict]:
         """Update a task"""
         try:
-            # Handle timestamps
-            if 'status' in updates:
-                if updates['status'] == 'running' and 'started_at' not in updates:
-                    updates['started_at'] = datetime.utcnow().isoformat()
-                elif updates['status'] in ['completed', 'failed', 'cancelled'] and 'completed_at' not in updates:
-                    updates['completed_at'] = datetime.utcnow().isoformat()
-            
-            updates['updated_at'] = datetime.utcnow().isoformat()
-            result = supabase.table('tasks').update(updates).eq('id', task_id).eq('user_id', user_id).execute()
+            updates = DatabaseOperations.stamp_task_updates(updates)
+            result = get_supabase().table('tasks').update(updates).eq('id', task_id).eq('user_id', user_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error updating task {task_id}: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def mark_task_running(task_id: int, user_id: str) -> Optional[Dict]:
+        """Move a pending task to running; None if it is no longer pending (e.g. cancelled meanwhile)"""
+        try:
+            updates = DatabaseOperations.stamp_task_updates({'status': 'running'})
+            result = get_supabase().table('tasks').update(updates).eq('id', task_id).eq('user_id', user_id).eq('status', 'pending').execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error marking task {task_id} running: {e}")
+            raise
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def claim_task(task_id: int, executor_id: str, lease_expires_at: str, previous_lease: str = None) -> bool:
+        """Set a task's owner and lease if its lease is still ``previous_lease`` (None: never leased)"""
+        try:
+            query = get_supabase().table('tasks').update({
+                'executor_id': executor_id,
+                'lease_expires_at': lease_expires_at
+            }).eq('id', task_id)
+            if previous_lease:
+                query = query.eq('lease_expires_at', previous_lease)
+            else:
+                query = query.is_('lease_expires_at', 'null')
+            result = query.execute()
+            return bool(result.data)
+        except Exception as e:
+            logger.error(f"Error claiming task {task_id}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def renew_task_leases(executor_id: str, lease_expires_at: str, task_id: int = None) -> int:
+        """Move the lease of every unfinished task (or just ``task_id``) owned by an executor; returns the number of tasks"""
+        try:
+            query = get_supabase().table('tasks').update({
+                'lease_expires_at': lease_expires_at
+            }).eq('executor_id', executor_id).in_('status', ['pending', 'running'])
+            if task_id is not None:
+                query = query.eq('id', task_id)
+            result = query.execute()
+            return len(result.data or [])
+        except Exception as e:
+            logger.error(f"Error renewing leases of executor {executor_id}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def unclaim_task(task_id: int, executor_id: str) -> bool:
+        """Clear a task's owner and lease, if ``executor_id`` still owns it"""
+        try:
+            result = get_supabase().table('tasks').update({
+                'executor_id': None,
+                'lease_expires_at': None
+            }).eq('id', task_id).eq('executor_id', executor_id).execute()
+            return bool(result.data)
+        except Exception as e:
+            logger.error(f"Error unclaiming task {task_id}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def enqueue_task(task_id: int, user_id: str, repo_url: str = None,
+                     project_id: int = None, trace_context: Dict = None, priority: str = 'interactive') -> Optional[Dict]:
+        """Hand a task to the worker processes; they read the GitHub token from the user's row"""
+        try:
+            result = get_supabase().table('task_queue').insert({
+                'task_id': task_id,
+                'user_id': user_id,
+                'repo_url': repo_url,
+                'project_id': project_id,
+                'priority': priority,
+                'trace_context': trace_context or {}
+            }).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error enqueueing task {task_id}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_task_queue(limit: int = None, priority: str = None) -> List[Dict]:
+        """Queued tasks (of one priority class), oldest first"""
+        try:
+            query = get_supabase().table('task_queue').select('task_id, user_id, project_id, priority, enqueued_at')
+            if priority is not None:
+                query = query.eq('priority', priority)
+            query = query.order('enqueued_at')
+            if limit is not None:
+                query = query.limit(limit)
+            return query.execute().data or []
+        except Exception as e:
+            logger.error(f"Error fetching the task queue: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def count_queued_tasks() -> int:
+        """Number of tasks waiting in the queue for a worker"""
+        try:
+            result = get_supabase().table('task_queue').select('task_id', count='exact', head=True).execute()
+            return result.count or 0
+        except Exception as e:
+            logger.error(f"Error counting the task queue: {e}")
+            raise
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def take_queued_task(task_id: int) -> Optional[Dict]:
+        """Remove a task from the queue and return its entry; None if another worker took it first"""
+        try:
+            result = get_supabase().table('task_queue').delete().eq('task_id', task_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error taking queued task {task_id}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_running_tasks() -> List[Dict]:
+        """Owners of every running task, in any process"""
+        try:
+            result = get_supabase().table('tasks').select('id, user_id, project_id').eq('status', 'running').execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error fetching running tasks: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_quota_buckets(keys: List[str]) -> List[Dict]:
+        """Stored quota buckets (level, refreshed_at, version) by key"""
+        try:
+            result = get_supabase().table('quota_buckets').select('key, level, refreshed_at, version').in_('key', keys).execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error fetching quota buckets: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def save_quota_bucket(key: str, level: float, refreshed_at: float, version: int = None) -> bool:
+        """Store a quota bucket if it is still at ``version`` (None: not stored yet); False if another process changed it first"""
+        try:
+            row = {'level': level, 'refreshed_at': refreshed_at, 'updated_at': datetime.utcnow().isoformat()}
+            if version is None:
+                result = get_supabase().table('quota_buckets').upsert(
+                    dict(row, key=key, version=1), on_conflict='key', ignore_duplicates=True
+                ).execute()
+            else:
+                result = get_supabase().table('quota_buckets').update(dict(row, version=version + 1)).eq('key', key).eq('version', version).execute()
+            return bool(result.data)
+        except Exception as e:
+            logger.error(f"Error saving quota bucket {key}: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def save_file_blobs(blobs: Dict[str, str]) -> None:
+        """Store file contents by git blob id; blobs that are already stored are left as they are"""
+        DatabaseOperations._check_database_available()
+        try:
+            rows = [{'sha': sha, 'content': content, 'size': len(content.encode())} for sha, content in blobs.items()]
+            get_supabase().table('file_blobs').upsert(rows, on_conflict='sha', ignore_duplicates=True).execute()
+        except Exception as e:
+            logger.error(f"Error saving file blobs: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_file_blobs(shas: List[str]) -> Dict[str, str]:
+        """File contents by git blob id, for the ids that are stored"""
+        DatabaseOperations._check_database_available()
+        try:
+            result = get_supabase().table('file_blobs').select('sha, content').in_('sha', shas).execute()
+            return {row['sha']: row['content'] for row in result.data or []}
+        except Exception as e:
+            logger.error(f"Error fetching file blobs: {e}")
+            raise
+
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_resource_history(project_id: int = None, repo_url: str = None, limit: int = 20) -> List[Dict]:
+        """Get execution metadata of a project's (or repository's) most recent finished tasks"""
+        try:
+            query = get_supabase().table('tasks').select('execution_metadata').in_('status', ['completed', 'failed'])
+            if project_id:
+                query = query.eq('project_id', project_id)
+            else:
+                query = query.eq('repo_url', repo_url)
+            result = query.order('completed_at', desc=True).limit(limit).execute()
+            return [row.get('execution_metadata') or {} for row in result.data or []]
+        except Exception as e:
+            logger.error(f"Error fetching resource history: {e}")
+            raise
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_project_timelines(project_id: int, user_id: str, limit: int = 50) -> List[List[Dict]]:
+        """Get the phase timelines of a project's most recent finished tasks"""
+        try:
+            result = get_supabase().table('tasks').select('execution_metadata').eq('project_id', project_id).eq('user_id', user_id).in_('status', ['completed', 'failed']).order('completed_at', desc=True).limit(limit).execute()
+            timelines = [(row.get('execution_metadata') or {}).get('timeline') for row in result.data or []]
+            return [timeline for timeline in timelines if timeline]
+        except Exception as e:
+            logger.error(f"Error fetching timelines for project {project_id}: {e}")
+            raise
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def get_project_agent_usage(project_id: int, user_id: str, limit: int = 50) -> List[Dict]:
+        """Get the agent accounting (turns, tools, tokens) of a project's most recent finished tasks"""
+        try:
+            result = get_supabase().table('tasks').select('id, execution_metadata').eq('project_id', project_id).eq('user_id', user_id).in_('status', ['completed', 'failed']).order('completed_at', desc=True).limit(limit).execute()
+            runs = [{'task_id': row['id'], 'agent': (row.get('execution_metadata') or {}).get('agent')} for row in result.data or []]
+            return [run for run in runs if run['agent']]
+        except Exception as e:
+            logger.error(f"Error fetching agent usage for project {project_id}: {e}")
+            raise
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def add_chat_message(task_id: int, user_id: str, role: str, content: str) -> Optional[Dict]:
         """Add a chat message to a task"""
         try:
@@ -185,16 +462,18 @@ class DatabaseOperations:
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def get_task_by_legacy_id(legacy_id: str) -> Optional[Dict]:
         """Get a task by its legacy UUID (for migration purposes)"""
         try:
-            result = supabase.table('tasks').select('*').eq('execution_metadata->>legacy_id', legacy_id).execute()
+            result = get_supabase().table('tasks').select('*').eq('execution_metadata->>legacy_id', legacy_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error fetching task by legacy ID {legacy_id}: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def migrate_legacy_task(legacy_task: Dict, user_id: str) -> Optional[Dict]:
         """Migrate a legacy task from the JSON storage to Supabase"""
         try:
@@ -226,17 +505,29 @@ class DatabaseOperations:
             if legacy_task.get('created_at'):
                 task_data['created_at'] = datetime.fromtimestamp(legacy_task['created_at']).isoformat()
             
-            result = supabase.table('tasks').insert(task_data).execute()
+            result = get_supabase().table('tasks').insert(task_data).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error migrating legacy task: {e}")
             raise
     
     @staticmethod
+    @track_latency(SUPABASE_LATENCY)
+    def save_github_token(user_id: str, github_token: str) -> Optional[Dict]:
+        """Store the GitHub token in the user's settings, where workers and recovery read it"""
+        try:
+            result = get_supabase().table('users').update({'github_token': github_token}).eq('id', user_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error saving GitHub token of user {user_id}: {e}")
+            raise
+    
+    @staticmethod
+    @track_latency(SUPABASE_LATENCY)
     def get_user_by_id(user_id: str) -> Optional[Dict]:
         """Get user by ID"""
         try:
-            result = supabase.table('users').select('*').eq('id', user_id).single().execute()
+            result = get_supabase().table('users').select('*').eq('id', user_id).single().execute()
             return result.data
         except Exception as e:
             logger.error(f"Error getting user: {e}")
@@ -0,0 +1,27 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Builds a GitHub client from a token; PyGithub's Github unless replaced with set_github_factory.
+# PyGithub is imported on first use so it stays out of server startup.
+_github_factory = None
+_github_lock = threading.Lock()
+
+
+def get_github(token: str):
+    """GitHub client authenticated with ``token``"""
+    global _github_factory
+    if _github_factory is None:
+        with _github_lock:
+            if _github_factory is None:
+                from github import Github
+                _github_factory = Github
+    return _github_factory(token)
+
+
+def set_github_factory(factory):
+    """Build clients with ``factory(token)`` (for example a fake) instead of PyGithub's Github"""
+    global _github_factory
+    with _github_lock:
+        _github_factory = factory
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
 import time
 import logging
-from github import Github
+from github_client import get_github
 from models import TaskStatus
 from utils import tasks
 
@@ -21,7 +21,7 @@ def validate_github_token():
             return jsonify({'error': 'github_token is required'}), 400
         
         # Create GitHub client
-        g = Github(github_token)
+        g = get_github(github_token)
         
         # Test basic authentication
         user = g.get_user()
@@ -139,7 +139,7 @@ def create_pull_request(task_id):
         repo_parts = task['repo_url'].replace('https://github.com/', '').replace('.git', '')
         
         # Create GitHub client
-        g = Github(task['github_token'])
+        g = get_github(task['github_token'])
         repo = g.get_repo(repo_parts)
         
         # Determine branch strategy
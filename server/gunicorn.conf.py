@@ -0,0 +1,69 @@
+"""Production server settings: ``gunicorn -c gunicorn.conf.py main:app``.
+
+Every setting can be overridden with the GUNICORN_* variables below (or
+gunicorn's own command-line flags). ``kill -HUP <master pid>`` reloads the
+code gracefully: new workers start, old ones finish their in-flight requests
+within ``graceful_timeout`` and hand their tasks on (see worker_exit).
+"""
+import multiprocessing
+import os
+import shutil
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# Requests mostly wait on Supabase, GitHub and Docker, so each process runs a pool of threads
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count())))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# /create-pr pushes whole patches through the GitHub API and can take a while
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+
+# Recycle workers after this many requests (0 disables); their tasks are taken over by the others
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+# Restart workers when the code changes (development with a mounted source tree)
+reload = os.getenv('GUNICORN_RELOAD', 'false').lower() == 'true'
+
+# Heartbeat files on tmpfs, so a slow disk cannot get workers killed
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# In the default inline mode every worker runs the tasks it accepts and books its share of
+# the Docker hosts; with EXECUTION_MODE=queue tasks are run by worker.py processes instead
+inline = os.getenv('EXECUTION_MODE', 'inline') == 'inline'
+if inline:
+    os.environ.setdefault('EXECUTOR_PROCESSES', str(workers))
+
+# Counters and histograms are aggregated over all workers (see metrics.py)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/async-code-metrics')
+
+
+def on_starting(server):
+    # Files of a previous run would be added to this one's totals
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Take over tasks of workers (or servers) that went away; every worker takes part,
+    # task leases make sure only one of them acts on each task
+    if inline and os.getenv('RECOVER_TASKS_ON_STARTUP', 'true').lower() == 'true':
+        from utils.recovery import start_task_recovery
+        start_task_recovery()
+
+
+def worker_exit(server, worker):
+    # Running containers outlive the worker; let another worker pick them up right away
+    from utils.leases import release_leases
+    release_leases()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,7 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify
 import time
+from metrics import metrics_response
+from utils import execution_status
 
 health_bp = Blueprint('health', __name__)
 
@@ -12,11 +14,25 @@ def ping():
         'timestamp': time.time()
     })
 
+@health_bp.route('/health', methods=['GET'])
+def health():
+    """Role of this process (API or worker) and the state of the tasks it runs"""
+    return jsonify({
+        'status': 'success',
+        'timestamp': time.time(),
+        **execution_status(current_app.config.get('PROCESS_ROLE', 'api'))
+    })
+
 @health_bp.route('/', methods=['GET'])
 def home():
     """Root endpoint"""
     return jsonify({
         'status': 'success',
         'message': 'Claude Code Automation API',
-        'endpoints': ['/ping', '/start-task', '/task-status', '/git-diff', '/create-pr']
-    })
\ No newline at end of file
+        'endpoints': ['/ping', '/health', '/metrics', '/start-task', '/task-status', '/git-diff', '/create-pr']
+    })
+
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for the API and the execution pipeline"""
+    return metrics_response()
\ No newline at end of file
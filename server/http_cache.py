@@ -0,0 +1,200 @@
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import brotli
+from flask import Response, current_app, request
+
+from metrics import RESPONSE_CACHE
+
+# Responses smaller than this are sent as they are; compressing them saves less than it costs
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+# Memory for encoded task payloads, across all tasks (least recently used are evicted first)
+RESPONSE_CACHE_BYTES = int(os.getenv('RESPONSE_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def task_etag(task: dict) -> str:
+    """Strong ETag of a task row: every update bumps updated_at, so it identifies the content"""
+    if task.get('updated_at'):
+        version = f"{task['id']}:{task['updated_at']}:{task.get('status')}"
+    else:
+        version = current_app.json.dumps(task, sort_keys=True)
+    return hashlib.sha1(version.encode()).hexdigest()
+
+
+def representation_etag(etag: str, encoding: str = None) -> str:
+    """ETag of one encoding of the content tagged ``etag``: each compressed body gets its own"""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def preferred_encoding() -> str:
+    """Best encoding the client accepts: 'br', 'gzip' or None"""
+    accepted = request.accept_encodings
+    if accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encode_stream(chunks, encoding: str):
+    """Compress a streamed body chunk by chunk, flushing after each so clients can decode as it arrives"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class EncodedCache:
+    """Serialized (and compressed) payloads per key, for the single latest version of each key"""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> {'etag': str, 'bodies': {encoding: bytes}}
+        self._lock = threading.Lock()
+
+    def get(self, key, etag: str, encoding: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['etag'] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry['bodies'].get(encoding)
+
+    def put(self, key, etag: str, encoding: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['etag'] != etag:
+                if entry is not None:
+                    self.size -= sum(len(b) for b in entry['bodies'].values())
+                entry = self._entries[key] = {'etag': etag, 'bodies': {}}
+            previous = entry['bodies'].get(encoding)
+            if previous is not None:
+                self.size -= len(previous)
+            entry['bodies'][encoding] = body
+            self.size += len(body)
+            self._entries.move_to_end(key)
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sum(len(b) for b in evicted['bodies'].values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+payload_cache = EncodedCache()
+
+
+def _matching_etag(etag: str) -> str:
+    """The representation of content ``etag`` the client holds, per If-None-Match; None if it holds none"""
+    for encoding in (None, 'br', 'gzip'):
+        tag = representation_etag(etag, encoding)
+        if request.if_none_match.contains(tag):
+            return tag
+    return None
+
+
+def not_modified(etag: str) -> bool:
+    return _matching_etag(etag) is not None
+
+
+def not_modified_response(etag: str) -> Response:
+    RESPONSE_CACHE.labels('not_modified').inc()
+    response = Response(status=304)
+    _set_caching_headers(response, _matching_etag(etag) or etag)
+    return response
+
+
+def cached_json_response(key, etag: str, payload_factory) -> Response:
+    """JSON response for version ``etag`` of ``key``; ``payload_factory`` is only called on a cache miss"""
+    return cached_response(key, etag, lambda: current_app.json.dumps_bytes(payload_factory()))
+
+
+def cached_response(key, etag: str, body_factory, mimetype: str = 'application/json') -> Response:
+    """Response for version ``etag`` of ``key``, built and compressed once per encoding"""
+    encoding = preferred_encoding()
+    body = payload_cache.get(key, etag, encoding)
+    if body is None:
+        RESPONSE_CACHE.labels('miss').inc()
+        body = body_factory()
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            body = encode(body, encoding)
+        else:
+            encoding = None
+        payload_cache.put(key, etag, encoding, body)
+    else:
+        RESPONSE_CACHE.labels('hit').inc()
+
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    _set_caching_headers(response, representation_etag(etag, encoding))
+    return response
+
+
+def _set_caching_headers(response: Response, etag: str):
+    response.set_etag(etag)
+    # Per-user data that browsers may keep but must revalidate before each use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.update(('Accept-Encoding', 'X-User-ID'))
+
+
+def init_app(app):
+    """Answer repeated GETs with 304 and compress large JSON and text responses"""
+
+    @app.after_request
+    def _conditional_and_compressed(response):
+        if request.method != 'GET' or response.status_code != 200 or response.direct_passthrough:
+            return response
+
+        if 'Content-Encoding' in response.headers or not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        if response.is_streamed:
+            # Streamed bodies are never buffered: no content-hash ETag, compressed as they are sent
+            encoding = preferred_encoding()
+            if encoding:
+                response.response = encode_stream(response.response, encoding)
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+            return response
+
+        # Content-hash ETag for responses that did not set one from the data's version
+        if not response.get_etag()[0]:
+            response.add_etag()
+        if not_modified(response.get_etag()[0]):
+            return not_modified_response(response.get_etag()[0])
+
+        encoding = preferred_encoding()
+        body = response.get_data()
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            response.set_data(encode(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(representation_etag(response.get_etag()[0], encoding))
+            response.vary.add('Accept-Encoding')
+        return response
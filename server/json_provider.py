@@ -0,0 +1,97 @@
+import json
+import os
+
+import orjson
+from flask import Response, current_app
+from flask.json.provider import DefaultJSONProvider
+
+# JSON encoder for API responses: 'orjson' or 'stdlib'
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+
+# List responses with at least this many items are streamed item by item instead of encoded whole
+STREAM_MIN_ITEMS = int(os.getenv('JSON_STREAM_MIN_ITEMS', '200'))
+
+# Streamed items are sent in chunks of about this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's json-module provider, without sorting keys, and with ``dumps_bytes`` for cached payloads"""
+
+    sort_keys = False
+
+    def dumps_bytes(self, obj) -> bytes:
+        return json.dumps(obj, default=self.default, separators=(',', ':')).encode()
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """orjson-backed provider; values orjson rejects (e.g. integers over 64 bits) fall back to the json module.
+
+    Dates are still rendered by Flask's default (HTTP dates), so responses keep their format.
+    """
+
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_bytes(self, obj) -> bytes:
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.OPTIONS)
+        except TypeError:
+            return super().dumps_bytes(obj)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def streamed_json_response(payload: dict, key: str) -> Response:
+    """JSON response whose large ``payload[key]`` (a list or dict) is encoded and sent item by item.
+
+    Small collections (under STREAM_MIN_ITEMS) are encoded whole, so they keep their ETag.
+    """
+    provider = current_app.json
+    items = payload[key]
+    if len(items) < STREAM_MIN_ITEMS:
+        return provider.response(payload)
+
+    rest = provider.dumps_bytes({name: value for name, value in payload.items() if name != key})
+    head = rest[:-1] + (b',' if len(rest) > 2 else b'') + provider.dumps_bytes(key) + b':'
+
+    def generate():
+        is_dict = isinstance(items, dict)
+        chunk = [head, b'{' if is_dict else b'[']
+        size = 0
+        for index, item in enumerate(items.items() if is_dict else items):
+            if index:
+                chunk.append(b',')
+            if is_dict:
+                chunk += [provider.dumps_bytes(str(item[0])), b':', provider.dumps_bytes(item[1])]
+            else:
+                chunk.append(provider.dumps_bytes(item))
+            size += len(chunk[-1])
+            if size >= STREAM_CHUNK_BYTES:
+                yield b''.join(chunk)
+                chunk, size = [], 0
+        chunk.append(b'}}\n' if is_dict else b']}\n')
+        yield b''.join(chunk)
+
+    return Response(generate(), mimetype='application/json')
+
+
+def init_app(app):
+    """Serialize the app's JSON with orjson unless JSON_PROVIDER=stdlib"""
+    if JSON_PROVIDER == 'orjson':
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = StdlibJSONProvider(app)
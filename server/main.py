@@ -11,6 +11,11 @@ load_dotenv()
 from tasks import tasks_bp
 from projects import projects_bp
 from health import health_bp
+from utils.recovery import start_task_recovery
+import http_cache
+import json_provider
+import metrics
+import tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +26,18 @@ app = Flask(__name__)
 # Configure CORS
 CORS(app, origins=['http://localhost:3000', 'https://*.vercel.app'])
 
+# orjson-backed JSON responses (JSON_PROVIDER)
+json_provider.init_app(app)
+
+# Record request latency per blueprint route
+metrics.init_app(app)
+
+# ETags, 304s and compression for large payloads
+http_cache.init_app(app)
+
+# Trace each request (TRACING_ENABLED) and carry its context into task execution
+tracing.init_app(app)
+
 # Register blueprints
 app.register_blueprint(health_bp)
 app.register_blueprint(tasks_bp)
@@ -41,4 +58,11 @@ if __name__ == '__main__':
     logger.info(f"Starting Flask server on port {port}")
     logger.info(f"Debug mode: {debug}")
     
+    # Pick up tasks left behind by the previous process (only once under the debug reloader);
+    # in queue mode the workers (worker.py) run recovery instead
+    inline = os.environ.get('EXECUTION_MODE', 'inline') == 'inline'
+    recover_on_startup = os.environ.get('RECOVER_TASKS_ON_STARTUP', 'true').lower() == 'true'
+    if inline and recover_on_startup and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_task_recovery()
+    
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+from tracing import span
+
+# Set (see gunicorn.conf.py) when several worker processes serve the API: counters and
+# histograms are then written to files in this directory and summed at scrape time
+MULTIPROCESS_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Buckets for multi-minute work (phases, queue waits)
+LONG_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 900, 1200, 1800, 3600)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by blueprint route',
+    ['blueprint', 'route', 'method', 'status']
+)
+QUEUE_WAIT = Histogram(
+    'task_queue_wait_seconds', 'Time tasks spend queued before a host slot is reserved, by priority class', ['priority'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10) + LONG_BUCKETS[3:]
+)
+CONTAINER_CREATE_LATENCY = Histogram(
+    'container_create_seconds', 'Docker container create latency', ['host']
+)
+CONTAINER_START_LATENCY = Histogram(
+    'container_start_seconds', 'Docker container start latency', ['host']
+)
+PHASE_DURATION = Histogram(
+    'task_phase_duration_seconds', 'Duration of task phases (clone, agent, extraction)', ['phase'],
+    buckets=LONG_BUCKETS
+)
+LOG_BYTES_PARSED = Counter(
+    'task_log_bytes_parsed_total', 'Bytes of container output parsed for results'
+)
+SUPABASE_LATENCY = Histogram(
+    'supabase_request_duration_seconds', 'Supabase call latency by operation', ['operation']
+)
+GITHUB_LATENCY = Histogram(
+    'github_request_duration_seconds', 'GitHub API call latency by operation', ['operation']
+)
+AGENT_TURNS = Histogram(
+    'agent_turns', 'Model responses per agent run', buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+AGENT_TURN_LATENCY = Histogram(
+    'agent_turn_seconds', 'Time from a prompt or tool result to the next model response',
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+AGENT_TOOL_CALLS = Counter(
+    'agent_tool_calls_total', 'Tool calls made by the agent', ['tool']
+)
+AGENT_TOKENS = Counter(
+    'agent_tokens_total', 'Tokens used by the agent (input, output, cache_read, cache_creation)', ['kind']
+)
+AGENT_COST = Counter(
+    'agent_cost_usd_total', 'Agent cost reported by Claude Code, in US dollars'
+)
+QUOTA_REJECTIONS = Counter(
+    'quota_rejections_total', 'Tasks refused at submission or held back at dispatch by a quota',
+    ['quota', 'scope', 'stage']
+)
+RESPONSE_CACHE = Counter(
+    'http_response_cache_total', 'Task payload responses by cache outcome (hit, miss, not_modified)', ['result']
+)
+
+
+def track_latency(histogram):
+    """Decorator observing a function's (or coroutine's) duration, labeled with its name.
+
+    The call is also traced as a span named after the function.
+    """
+    def decorator(func):
+        observer = histogram.labels(func.__name__)
+        span_name = func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with span(span_name):
+                        return await func(*args, **kwargs)
+                finally:
+                    observer.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with span(span_name):
+                    return func(*args, **kwargs)
+            finally:
+                observer.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def github_call(operation: str):
+    """Time (and trace) a block of GitHub API calls"""
+    start = time.perf_counter()
+    try:
+        with span(f'github.{operation}'):
+            yield
+    finally:
+        GITHUB_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+
+class PipelineCollector:
+    """Scrape-time gauges for the scheduler queue and Docker hosts (nothing is updated per task)"""
+
+    def __init__(self, pool, queue_depth):
+        self.pool = pool
+        self.queue_depth = queue_depth
+
+    def describe(self):
+        # Names only: registering must not call collect(), which reads the executor's queue
+        return [GaugeMetricFamily(name, '') for name in (
+            'task_queue_depth', 'docker_host_active_containers', 'docker_host_capacity', 'docker_host_healthy'
+        )]
+
+    def collect(self):
+        yield GaugeMetricFamily('task_queue_depth', 'Tasks waiting for a host slot', value=self.queue_depth())
+
+        active = GaugeMetricFamily('docker_host_active_containers', 'Task containers holding a slot per host', labels=['host'])
+        capacity = GaugeMetricFamily('docker_host_capacity', 'Task container slots per host', labels=['host'])
+        healthy = GaugeMetricFamily('docker_host_healthy', 'Whether the host passed its last health check', labels=['host'])
+        for host in self.pool.snapshot():
+            active.add_metric([host['name']], host['active'])
+            capacity.add_metric([host['name']], host['capacity'])
+            healthy.add_metric([host['name']], 1 if host['healthy'] else 0)
+        yield active
+        yield capacity
+        yield healthy
+
+
+class QueueTableCollector:
+    """Scrape-time gauge for the shared ``task_queue`` table (queue mode)"""
+
+    def __init__(self, count):
+        self.count = count
+
+    def describe(self):
+        return [GaugeMetricFamily('task_queue_table_depth', '')]
+
+    def collect(self):
+        try:
+            depth = self.count()
+        except Exception:
+            return  # Already logged by the database layer; skip the gauge for this scrape
+        yield GaugeMetricFamily('task_queue_table_depth', 'Tasks waiting in the task_queue table for a worker', value=depth)
+
+
+_pipeline_collectors = []
+
+
+def register_pipeline(pool, queue_depth):
+    """Export ``pool``'s hosts and ``queue_depth()`` (tasks waiting locally) on /metrics"""
+    collector = PipelineCollector(pool, queue_depth)
+    _pipeline_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def register_queue_table(count):
+    """Export ``count()`` (tasks waiting in the ``task_queue`` table) on /metrics"""
+    collector = QueueTableCollector(count)
+    _pipeline_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def init_app(app):
+    """Record request latency for every blueprint route of ``app``"""
+
+    @app.before_request
+    def _start_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started_at = g.pop('request_started_at', None)
+        if started_at is not None:
+            REQUEST_LATENCY.labels(
+                request.blueprint or 'app',
+                request.url_rule.rule if request.url_rule else 'unmatched',
+                request.method,
+                response.status_code
+            ).observe(time.perf_counter() - started_at)
+        return response
+
+
+def metrics_response() -> Response:
+    registry = REGISTRY
+    if MULTIPROCESS_DIR:
+        # Totals across all worker processes; local queue and host gauges are those of the answering
+        # process (workers and inline API processes only), the task_queue table gauge is shared
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _pipeline_collectors:
+            registry.register(collector)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
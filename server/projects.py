@@ -1,6 +1,9 @@
 from flask import Blueprint, jsonify, request
 import logging
 from database import DatabaseOperations
+from utils.agent_stream import summarize_agent_usage
+from utils.timeline import summarize_timelines
+import json_provider
 import re
 
 logger = logging.getLogger(__name__)
@@ -36,10 +39,10 @@ def get_projects():
             return jsonify({'error': 'User ID required'}), 400
         
         projects = DatabaseOperations.get_user_projects(user_id)
-        return jsonify({
+        return json_provider.streamed_json_response({
             'status': 'success',
             'projects': projects
-        })
+        }, 'projects')
         
     except Exception as e:
         logger.error(f"Error fetching projects: {str(e)}")
@@ -192,4 +195,50 @@ def get_project_tasks(project_id):
         
     except Exception as e:
         logger.error(f"Error fetching tasks for project {project_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@projects_bp.route('/projects/<int:project_id>/timeline', methods=['GET'])
+def get_project_timeline(project_id):
+    """Per-phase timing of a project's recent tasks (clone, agent, diff, ...)"""
+    try:
+        user_id = request.headers.get('X-User-ID')
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+        
+        project = DatabaseOperations.get_project_by_id(project_id, user_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        timelines = DatabaseOperations.get_project_timelines(project_id, user_id, limit)
+        return jsonify({
+            'status': 'success',
+            'timeline': summarize_timelines(timelines)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching timeline for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@projects_bp.route('/projects/<int:project_id>/agent-usage', methods=['GET'])
+def get_project_agent_usage(project_id):
+    """Turns, tool calls, tokens and cost of a project's recent tasks, with the slowest and most expensive"""
+    try:
+        user_id = request.headers.get('X-User-ID')
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+        
+        project = DatabaseOperations.get_project_by_id(project_id, user_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        runs = DatabaseOperations.get_project_agent_usage(project_id, user_id, limit)
+        return jsonify({
+            'status': 'success',
+            'agent_usage': summarize_agent_usage(runs)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching agent usage for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -1,12 +1,16 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 import uuid
 import time
-import threading
 import logging
 from models import TaskStatus
 from database import DatabaseOperations
-from utils import run_ai_code_task_v2  # Updated function name
-from github import Github
+from utils import start_ai_code_task_v2, cancel_ai_code_task_v2, diff_files, get_quota_manager, QuotaExceeded
+from utils.priorities import normalize_priority
+from github_client import get_github
+from metrics import github_call
+import http_cache
+import json_provider
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +39,23 @@ def start_task():
         if not all([prompt, repo_url, github_token]):
             return jsonify({'error': 'prompt, repo_url, and github_token are required'}), 400
         
+        # 'interactive' (the default, for the UI) or 'batch' (scripted submissions)
+        try:
+            priority = normalize_priority(data.get('priority'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Validate model selection - only claude is supported
         if model != 'claude':
             return jsonify({'error': 'model must be "claude"'}), 400
         
+        # Per-user and per-project quotas: refused tasks are never created
+        try:
+            get_quota_manager().check_submission(user_id, project_id)
+        except QuotaExceeded as e:
+            logger.info(f"🚦 Refused task for user {user_id}: {e}")
+            return jsonify({'error': str(e), **e.to_dict()}), 429, {'Retry-After': str(e.retry_after)}
+        
         # Create initial chat message
         chat_messages = [{
             'role': 'user',
@@ -47,33 +64,55 @@ def start_task():
         }]
         
         # Create task in database
-        task = DatabaseOperations.create_task(
-            user_id=user_id,
-            project_id=project_id,
-            repo_url=repo_url,
-            target_branch=branch,
-            agent=model,
-            chat_messages=chat_messages
-        )
+        try:
+            task = DatabaseOperations.create_task(
+                user_id=user_id,
+                project_id=project_id,
+                repo_url=repo_url,
+                target_branch=branch,
+                agent=model,
+                chat_messages=chat_messages,
+                priority=priority
+            )
+        except Exception:
+            get_quota_manager().refund_submission(user_id, project_id)
+            raise
         
         if not task:
+            get_quota_manager().refund_submission(user_id, project_id)
             return jsonify({'error': 'Failed to create task'}), 500
         
-        # Start task in background thread
-        thread = threading.Thread(target=run_ai_code_task_v2, args=(task['id'], user_id, github_token))
-        thread.daemon = True
-        thread.start()
+        # Checked before queueing the task, which would count itself otherwise once dispatched
+        quota_wait = get_quota_manager().concurrency_wait(user_id, project_id)
         
-        return jsonify({
+        # Start task in the background on the configured execution engine
+        start_ai_code_task_v2(task['id'], user_id, github_token, repo_url=repo_url, project_id=project_id, priority=priority)
+        
+        response = {
             'status': 'success',
             'task_id': task['id'],
             'message': 'Task started successfully'
-        })
+        }
+        if quota_wait:
+            # Accepted, but held in the queue until one of the owner's running tasks finishes
+            response['message'] = f"Task queued: {quota_wait['scope']} is at its 'concurrent_tasks' quota ({quota_wait['limit']:g})"
+            response['quota_wait'] = quota_wait
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Error starting task: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@tasks_bp.route('/quotas', methods=['GET'])
+def get_quotas():
+    """The user's (and optionally a project's) quota limits and what is left of them"""
+    user_id = request.headers.get('X-User-ID')
+    if not user_id:
+        return jsonify({'error': 'User ID required'}), 400
+    if not get_quota_manager().enabled:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **get_quota_manager().usage(user_id, request.args.get('project_id', type=int))})
+
 @tasks_bp.route('/task-status/<int:task_id>', methods=['GET'])
 def get_task_status(task_id):
     """Get the status of a specific task"""
@@ -152,11 +191,12 @@ def list_all_tasks():
                 'chat_messages': task.get('chat_messages', [])
             }
         
-        return jsonify({
+        # Long task lists (with their chat histories) are encoded and sent task by task
+        return json_provider.streamed_json_response({
             'status': 'success',
             'tasks': formatted_tasks,
             'total_tasks': len(tasks)
-        })
+        }, 'tasks')
         
     except Exception as e:
         logger.error(f"Error listing tasks: {str(e)}")
@@ -170,11 +210,26 @@ def get_task_details(task_id):
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
         
+        # Revisits of an unchanged task are answered without loading its diff and patch
+        version = DatabaseOperations.get_task_version(task_id, user_id)
+        if not version:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        etag = http_cache.task_etag(version)
+        if http_cache.not_modified(etag):
+            return http_cache.not_modified_response(etag)
+        
         task = DatabaseOperations.get_task_by_id(task_id, user_id)
         if not task:
             return jsonify({'error': 'Task not found'}), 404
         
-        return jsonify({
+        # ?view=summary leaves out the diff, patch and file contents (see /tasks/<id>/files)
+        view = request.args.get('view', 'full')
+        if view == 'summary':
+            task = _task_summary(task)
+        
+        # The row may have changed since the version check
+        return http_cache.cached_json_response(('task', task_id, view), http_cache.task_etag(task), lambda: {
             'status': 'success',
             'task': task
         })
@@ -183,6 +238,40 @@ def get_task_details(task_id):
         logger.error(f"Error fetching task details: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def _task_summary(task: dict) -> dict:
+    summary = {key: value for key, value in task.items() if key not in ('git_diff', 'git_patch')}
+    metadata = task.get('execution_metadata') or {}
+    summary['execution_metadata'] = {key: value for key, value in metadata.items() if key != 'file_changes'}
+    return summary
+
+@tasks_bp.route('/tasks/<int:task_id>/cancel', methods=['POST'])
+def cancel_task(task_id):
+    """Cancel a queued or running task and free its container slot"""
+    try:
+        user_id = request.headers.get('X-User-ID')
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+        
+        task = DatabaseOperations.get_task_by_id(task_id, user_id)
+        if not task:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        if task['status'] in ['completed', 'failed', 'cancelled']:
+            return jsonify({'error': f"Task is already {task['status']}"}), 409
+        
+        outcome = cancel_ai_code_task_v2(task)
+        logger.info(f"🛑 Task {task_id} cancelled ({outcome})")
+        
+        return jsonify({
+            'status': 'success',
+            'task_id': task_id,
+            'cancelled': outcome
+        })
+        
+    except Exception as e:
+        logger.error(f"Error cancelling task: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @tasks_bp.route('/tasks/<int:task_id>/chat', methods=['POST'])
 def add_chat_message(task_id):
     """Add a chat message to a task"""
@@ -240,6 +329,101 @@ def get_git_diff(task_id):
         logger.error(f"Error fetching git diff: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@tasks_bp.route('/tasks/<int:task_id>/files', methods=['GET'])
+def list_task_files(task_id):
+    """Index of a task's changed files with per-file stats; contents load per file"""
+    try:
+        user_id = request.headers.get('X-User-ID')
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+        
+        version = DatabaseOperations.get_task_version(task_id, user_id)
+        if not version:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        etag = http_cache.task_etag(version)
+        if http_cache.not_modified(etag):
+            return http_cache.not_modified_response(etag)
+        
+        files = diff_files.task_files(task_id, etag, lambda: DatabaseOperations.get_task_by_id(task_id, user_id))
+        if files is None:
+            return jsonify({'error': 'Task not found'}), 404
+        return http_cache.cached_json_response(('task-files', task_id), etag, lambda: {
+            'status': 'success',
+            'task_id': task_id,
+            'stats': files.stats(),
+            'files': files.index()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error listing task files: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@tasks_bp.route('/tasks/<int:task_id>/files/<path:path>', methods=['GET'])
+def get_task_file(task_id, path):
+    """One part (diff, before, after or hunks) of a changed file, optionally a byte or line range of it"""
+    try:
+        user_id = request.headers.get('X-User-ID')
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+        
+        part = request.args.get('part', 'diff')
+        if part not in diff_files.PARTS + ('hunks',):
+            return jsonify({'error': f"part must be one of {', '.join(diff_files.PARTS + ('hunks',))}"}), 400
+        
+        lines = None
+        if request.args.get('lines'):
+            first, _, last = request.args['lines'].partition('-')
+            if not first.isdigit() or int(first) < 1 or (last and (not last.isdigit() or int(last) < int(first))):
+                return jsonify({'error': 'lines must look like 10-20 or 10- (1-based, inclusive)'}), 400
+            lines = (int(first), int(last) if last else None)
+        
+        version = DatabaseOperations.get_task_version(task_id, user_id)
+        if not version:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        etag = http_cache.task_etag(version)
+        if http_cache.not_modified(etag):
+            return http_cache.not_modified_response(etag)
+        
+        files = diff_files.task_files(task_id, etag, lambda: DatabaseOperations.get_task_by_id(task_id, user_id))
+        if files is None:
+            return jsonify({'error': 'Task not found'}), 404
+        if path not in files:
+            return jsonify({'error': 'File not found in this task'}), 404
+        
+        if part == 'hunks':
+            # Structured hunks with word-level spans; null when the file's contents were not captured
+            return http_cache.cached_json_response(('task-file-hunks', task_id, path), etag, lambda: {
+                'status': 'success',
+                'path': path,
+                'hunks': files.hunks(path)
+            })
+        
+        body = files.content(path, part)
+        
+        if lines:
+            response = Response(diff_files.line_range(body, *lines), mimetype='text/plain')
+            response.headers['X-Total-Lines'] = str(files.line_count(path, part))
+            response.set_etag(etag)
+            return response
+        
+        if request.range:
+            # Byte ranges of giant files are served uncompressed, sliced by werkzeug
+            response = Response(body, mimetype='text/plain')
+            response.set_etag(etag)
+            return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+        
+        response = http_cache.cached_response(('task-file', task_id, path, part), etag, lambda: body, mimetype='text/plain')
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+        
+    except RequestedRangeNotSatisfiable:
+        return jsonify({'error': 'Requested range is outside the file'}), 416
+    except Exception as e:
+        logger.error(f"Error fetching task file: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @tasks_bp.route('/validate-token', methods=['POST'])
 def validate_github_token():
     """Validate GitHub token and check permissions"""
@@ -252,14 +436,17 @@ def validate_github_token():
             return jsonify({'error': 'github_token is required'}), 400
         
         # Create GitHub client
-        g = Github(github_token)
+        g = get_github(github_token)
         
         # Test basic authentication
-        user = g.get_user()
-        logger.info(f"🔐 Token belongs to user: {user.login}")
+        with github_call('get_user'):
+            user = g.get_user()
+            login = user.login
+        logger.info(f"🔐 Token belongs to user: {login}")
         
         # Test token scopes
-        rate_limit = g.get_rate_limit()
+        with github_call('get_rate_limit'):
+            rate_limit = g.get_rate_limit()
         logger.info(f"📊 Rate limit info: {rate_limit.core.remaining}/{rate_limit.core.limit}")
         
         # If repo URL provided, test repo access
@@ -267,7 +454,8 @@ def validate_github_token():
         if repo_url:
             try:
                 repo_parts = repo_url.replace('https://github.com/', '').replace('.git', '')
-                repo = g.get_repo(repo_parts)
+                with github_call('get_repo'):
+                    repo = g.get_repo(repo_parts)
                 
                 # Test various permissions
                 permissions = {
@@ -381,8 +569,9 @@ def create_pull_request(task_id):
         repo_parts = task['repo_url'].replace('https://github.com/', '').replace('.git', '')
         
         # Create GitHub client
-        g = Github(github_token)
-        repo = g.get_repo(repo_parts)
+        g = get_github(github_token)
+        with github_call('get_repo'):
+            repo = g.get_repo(repo_parts)
         
         # Determine branch strategy
         base_branch = task['target_branch']
@@ -391,7 +580,8 @@ def create_pull_request(task_id):
         logger.info(f"📋 Creating PR branch '{pr_branch}' from base '{base_branch}'")
         
         # Get the latest commit from the base branch
-        base_branch_obj = repo.get_branch(base_branch)
+        with github_call('get_branch'):
+            base_branch_obj = repo.get_branch(base_branch)
         base_sha = base_branch_obj.commit.sha
         
         # Create new branch for the PR
@@ -406,7 +596,8 @@ def create_pull_request(task_id):
                 pass  # Branch doesn't exist, which is what we want
             
             # Create the new branch
-            new_ref = repo.create_git_ref(f"refs/heads/{pr_branch}", base_sha)
+            with github_call('create_git_ref'):
+                new_ref = repo.create_git_ref(f"refs/heads/{pr_branch}", base_sha)
             logger.info(f"✅ Created branch '{pr_branch}' from {base_sha[:8]}")
             
         except Exception as branch_error:
@@ -440,12 +631,13 @@ def create_pull_request(task_id):
         logger.info(f"✅ Applied patch, updated {len(files_updated)} files")
         
         # Create pull request
-        pr = repo.create_pull(
-            title=pr_title,
-            body=pr_body,
-            head=pr_branch,
-            base=base_branch
-        )
+        with github_call('create_pull'):
+            pr = repo.create_pull(
+                title=pr_title,
+                body=pr_body,
+                head=pr_branch,
+                base=base_branch
+            )
         
         # Update task with PR information
         DatabaseOperations.update_task(task_id, user_id, {
@@ -544,7 +736,8 @@ def apply_patch_to_github_repo(repo, branch, patch_content, task):
                     
                     # Get the original file content if it exists
                     try:
-                        file_obj = repo.get_contents(current_file, ref=branch)
+                        with github_call('get_contents'):
+                            file_obj = repo.get_contents(current_file, ref=branch)
                         original_content = file_obj.decoded_content.decode('utf-8')
                         logger.info(f"📥 Got original content for {current_file}")
                     except:
@@ -584,14 +777,16 @@ def apply_patch_to_github_repo(repo, branch, patch_content, task):
         
         try:
             # Get the current commit to build upon
-            current_commit = repo.get_commit(branch)
+            with github_call('get_commit'):
+                current_commit = repo.get_commit(branch)
             
             # Create tree elements for all changed files
             tree_elements = []
             
             for file_path, new_content in files_to_update.items():
                 # Create a blob for the file content
-                blob = repo.create_git_blob(new_content, "utf-8")
+                with github_call('create_git_blob'):
+                    blob = repo.create_git_blob(new_content, "utf-8")
                 
                 # Add to tree elements
                 tree_elements.append({
@@ -605,18 +800,21 @@ def apply_patch_to_github_repo(repo, branch, patch_content, task):
                 updated_files.append(file_path)
             
             # Create a new tree with all the changes
-            new_tree = repo.create_git_tree(tree_elements, base_tree=current_commit.commit.tree)
+            with github_call('create_git_tree'):
+                new_tree = repo.create_git_tree(tree_elements, base_tree=current_commit.commit.tree)
             
             # Create a single commit with all the changes
-            new_commit = repo.create_git_commit(
-                message=commit_message,
-                tree=new_tree,
-                parents=[current_commit.commit]
-            )
+            with github_call('create_git_commit'):
+                new_commit = repo.create_git_commit(
+                    message=commit_message,
+                    tree=new_tree,
+                    parents=[current_commit.commit]
+                )
             
             # Update the branch to point to the new commit
-            ref = repo.get_git_ref(f"heads/{branch}")
-            ref.edit(new_commit.sha)
+            with github_call('update_git_ref'):
+                ref = repo.get_git_ref(f"heads/{branch}")
+                ref.edit(new_commit.sha)
             
             logger.info(f"✅ Created single commit {new_commit.sha[:8]} with {len(updated_files)} files")
             
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# Server modules import each other by top-level name (``database``, ``utils``), as when run from server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from bench.fakes import FakeSupabase
+
+
+@pytest.fixture
+def fake_db():
+    """In-memory Supabase with a little latency per query, so concurrent callers interleave"""
+    db = FakeSupabase(latency=0.001)
+    database.set_supabase(db)
+    yield db
+    database.set_supabase(None)
@@ -0,0 +1,109 @@
+import math
+
+from utils.docker_hosts import DockerHost, DockerHostPool, repo_cache_key
+
+REPO = 'https://github.com/example/repo'
+
+
+def make_pool(capacities, load_factor=0.25):
+    pool = DockerHostPool([DockerHost(name, f'tcp://fake-{name}:2375', capacity) for name, capacity in capacities.items()])
+    pool.load_factor = load_factor
+    return pool
+
+
+def test_acquire_without_repo_picks_least_loaded_host():
+    pool = make_pool({'a': 2, 'b': 4})
+
+    placed = [pool.acquire({'task_id': task_id}).name for task_id in range(3)]
+
+    assert placed == ['a', 'b', 'b']
+
+
+def test_acquire_returns_none_when_every_host_is_full():
+    pool = make_pool({'a': 1, 'b': 1})
+    pool.acquire({'task_id': 1})
+    pool.acquire({'task_id': 2})
+
+    assert pool.acquire({'task_id': 3}) is None
+
+
+def test_acquire_without_slots_ignores_capacity_but_not_health():
+    pool = make_pool({'a': 1})
+    pool.acquire({'task_id': 1})
+
+    assert pool.acquire({'task_id': 2}, slots=False).name == 'a'
+    pool.hosts['a'].healthy = False
+    assert pool.acquire({'task_id': 3}, slots=False) is None
+
+
+def test_release_frees_the_slot_once():
+    pool = make_pool({'a': 1})
+    pool.acquire({'task_id': 1})
+
+    pool.release('a', 1)
+    pool.release('a', 1)
+
+    assert pool.hosts['a'].active == 0
+    assert pool.acquire({'task_id': 2}).name == 'a'
+
+
+def test_same_repo_goes_to_its_ring_owner():
+    pool = make_pool({'a': 10, 'b': 10, 'c': 10})
+    owner = pool._ring_order(repo_cache_key(REPO))[0]
+
+    task = {'task_id': 1, 'repo_url': REPO}
+    host = pool.acquire(task)
+
+    assert host.name == owner
+    assert task['placement']['strategy'] == 'ring_owner'
+    assert task['placement']['warm'] is False
+
+
+def test_warm_host_wins_over_ring_owner():
+    pool = make_pool({'a': 10, 'b': 10, 'c': 10})
+    warm = pool._ring_order(repo_cache_key(REPO))[-1]
+    pool.mark_warm(warm, REPO)
+
+    task = {'task_id': 1, 'repo_url': REPO}
+    host = pool.acquire(task)
+
+    assert host.name == warm
+    assert task['placement']['strategy'] == 'warm_affinity'
+    assert pool.affinity_hit_rate() == 1.0
+
+
+def test_affinity_never_exceeds_the_load_bound():
+    pool = make_pool({'a': 10, 'b': 10, 'c': 10})
+    strategies = set()
+
+    for task_id in range(1, 10):
+        task = {'task_id': task_id, 'repo_url': REPO}
+        pool.acquire(task)
+        strategies.add(task['placement']['strategy'])
+        bound = math.ceil(1.25 * task_id / 3)
+        assert max(host.active for host in pool.hosts.values()) <= bound
+
+    # Once the owner is at the bound, the repository's tasks spill to the next hosts on the ring
+    assert 'ring_successor' in strategies
+
+
+def test_affinity_choice_gives_up_when_no_candidate_is_under_the_bound():
+    pool = make_pool({'a': 10, 'b': 10})
+    pool.hosts['a'].active = 3
+
+    host, placement = pool._affinity_choice(REPO, [pool.hosts['a']])
+
+    assert host is None
+    assert placement == {'strategy': 'least_loaded', 'warm': False, 'load_bound': 3}
+
+
+def test_affinity_choice_skips_unhealthy_hosts_in_the_bound():
+    pool = make_pool({'a': 10, 'b': 10})
+    pool.hosts['b'].healthy = False
+    pool.hosts['a'].active = 3
+
+    host, placement = pool._affinity_choice(REPO, [pool.hosts['a']])
+
+    # Only 'a' is healthy, so the bound is the whole load: ceil(1.25 * 4 / 1)
+    assert host is pool.hosts['a']
+    assert placement['load_bound'] == 5
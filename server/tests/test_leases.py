@@ -0,0 +1,60 @@
+import threading
+
+from database import DatabaseOperations
+from utils import leases
+
+
+def race(claim, racers=16) -> list:
+    """Run ``claim(index)`` in ``racers`` threads released at once; the indexes that won"""
+    barrier = threading.Barrier(racers)
+    won = []
+
+    def run(index):
+        barrier.wait()
+        if claim(index):
+            won.append(index)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(racers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return won
+
+
+def test_exactly_one_executor_claims_an_unleased_task(fake_db):
+    fake_db.tables['tasks'].append({'id': 1, 'status': 'pending', 'executor_id': None, 'lease_expires_at': None})
+
+    won = race(lambda index: DatabaseOperations.claim_task(1, f'executor-{index}', leases.lease_expiry()))
+
+    assert len(won) == 1
+    assert fake_db.tables['tasks'][0]['executor_id'] == f'executor-{won[0]}'
+
+
+def test_exactly_one_executor_takes_over_an_expired_lease(fake_db):
+    expired = leases.lease_expiry(-60)
+    fake_db.tables['tasks'].append({'id': 1, 'status': 'running', 'executor_id': 'dead', 'lease_expires_at': expired})
+
+    won = race(lambda index: DatabaseOperations.claim_task(1, f'executor-{index}', leases.lease_expiry(), expired))
+
+    assert len(won) == 1
+    assert fake_db.tables['tasks'][0]['executor_id'] == f'executor-{won[0]}'
+
+
+def test_claim_fails_once_the_lease_has_moved_on(fake_db, monkeypatch):
+    monkeypatch.setattr(leases, '_start_renewing', lambda: None)
+    fake_db.tables['tasks'].append({'id': 1, 'status': 'pending', 'executor_id': None, 'lease_expires_at': None})
+
+    assert leases.claim(1)
+    assert not leases.claim(1)
+    assert leases.owns(fake_db.tables['tasks'][0])
+
+
+def test_released_task_is_expired_for_other_executors(fake_db, monkeypatch):
+    monkeypatch.setattr(leases, '_start_renewing', lambda: None)
+    fake_db.tables['tasks'].append({'id': 1, 'status': 'running', 'executor_id': None, 'lease_expires_at': None})
+    leases.claim(1)
+
+    leases.release(1)
+
+    assert leases.lease_expired(fake_db.tables['tasks'][0])
@@ -0,0 +1,71 @@
+import pytest
+
+from utils.quotas import QuotaExceeded, QuotaManager, TokenBucket, quota_limits
+
+
+def test_bucket_starts_full_and_refills_at_its_rate():
+    bucket = TokenBucket(capacity=30, rate=30 / 3600, now=0)
+
+    bucket.consume(30, now=0)
+    bucket.refill(now=120)
+
+    assert bucket.level == pytest.approx(1.0)
+
+
+def test_bucket_never_refills_beyond_capacity():
+    bucket = TokenBucket(capacity=10, rate=1, now=0)
+    bucket.consume(5, now=0)
+
+    bucket.refill(now=1000)
+
+    assert bucket.level == 10
+
+
+def test_refill_ignores_time_going_backwards():
+    bucket = TokenBucket(capacity=10, rate=1, now=100)
+    bucket.consume(10, now=100)
+
+    bucket.refill(now=50)
+
+    assert bucket.level == 0
+    assert bucket.refreshed_at == 100
+
+
+def test_usage_charged_after_the_fact_puts_the_bucket_into_debt():
+    bucket = TokenBucket(capacity=600, rate=600 / 86400, now=0)
+
+    bucket.consume(900, now=0)
+
+    assert bucket.level == -300
+    # Usable again once it has refilled to one token: 301 tokens at 1/144 per second
+    assert bucket.retry_after(now=0) == 301 * 144
+    assert bucket.retry_after(now=301 * 144) == 0
+
+
+def test_submission_is_refused_once_the_hourly_bucket_is_empty():
+    limits = quota_limits()
+    limits['user'].update(tasks_per_hour=2, concurrent_tasks=0, container_minutes_per_day=0, agent_tokens_per_day=0)
+    quotas = QuotaManager(store=None, limits=limits, enabled=True)
+
+    quotas.check_submission('user')
+    quotas.check_submission('user')
+    with pytest.raises(QuotaExceeded) as refused:
+        quotas.check_submission('user')
+
+    assert refused.value.quota == 'tasks_per_hour'
+    assert refused.value.retry_after == 1800
+
+
+def test_concurrency_limit_holds_back_dispatch_until_a_task_finishes():
+    limits = quota_limits()
+    limits['user'].update(concurrent_tasks=1, tasks_per_hour=0, container_minutes_per_day=0, agent_tokens_per_day=0)
+    quotas = QuotaManager(store=None, limits=limits, enabled=True)
+    quotas.started({'task_id': 1, 'user_id': 'user'})
+
+    assert not quotas.admits({'task_id': 2, 'user_id': 'user'})
+    assert quotas.concurrency_wait('user')['running'] == 1
+
+    quotas.finished(1)
+
+    assert quotas.admits({'task_id': 2, 'user_id': 'user'})
+    assert quotas.concurrency_wait('user') is None
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from bench.fakes import FakeDockerClient
+from utils.docker_hosts import DockerHost, DockerHostPool
+from utils.priorities import WeightedTurns, effective_priority, next_job
+from utils.scheduler import TaskScheduler
+
+
+def make_job(task_id, priority='interactive', waited=0.0, user_id='user'):
+    return {'task_id': task_id, 'user_id': user_id, 'priority': priority, 'queued_at': time.time() - waited}
+
+
+def test_effective_priority_moves_up_a_class_per_aging_period():
+    assert effective_priority('batch', 10, aging_seconds=300) == 'batch'
+    assert effective_priority('batch', 301, aging_seconds=300) == 'interactive'
+    assert effective_priority('interactive', 10_000, aging_seconds=300) == 'interactive'
+    assert effective_priority('batch', 10_000, aging_seconds=0) == 'batch'
+
+
+def test_weighted_turns_share_dispatches_by_weight():
+    turns = WeightedTurns({'interactive': 4, 'batch': 1})
+    eligible = ('interactive', 'batch')
+
+    chosen = []
+    for _ in range(10):
+        name = turns.choose(eligible)
+        turns.commit(name, eligible)
+        chosen.append(name)
+
+    assert chosen.count('interactive') == 8
+    assert chosen.count('batch') == 2
+    # Smooth: batch turns are spread out rather than bunched together
+    assert ('batch', 'batch') not in zip(chosen, chosen[1:])
+
+
+def test_turn_is_kept_until_committed():
+    turns = WeightedTurns({'interactive': 1, 'batch': 1})
+    eligible = ('interactive', 'batch')
+
+    first = turns.choose(eligible)
+
+    assert turns.choose(eligible) == first
+    turns.commit(first, eligible)
+    assert turns.choose(eligible) != first
+
+
+def test_next_job_takes_the_oldest_job_of_the_class_whose_turn_it_is():
+    jobs = [make_job(1, 'batch'), make_job(2), make_job(3)]
+
+    job, eligible = next_job(jobs, WeightedTurns({'interactive': 4, 'batch': 1}))
+
+    assert job['task_id'] == 2
+    assert set(eligible) == {'interactive', 'batch'}
+
+
+def test_aged_batch_job_competes_as_interactive():
+    jobs = [make_job(1, 'batch', waited=600), make_job(2)]
+
+    job, eligible = next_job(jobs, WeightedTurns())
+
+    assert job['task_id'] == 1
+    assert job['dispatch_class'] == 'interactive'
+    assert eligible == ('interactive',)
+
+
+def test_next_job_passes_over_owners_the_quotas_refuse():
+    class Quotas:
+        def admits(self, job):
+            return job['user_id'] != 'busy'
+
+    jobs = [make_job(1, user_id='busy'), make_job(2)]
+
+    job, _ = next_job(jobs, WeightedTurns(), Quotas())
+
+    assert job['task_id'] == 2
+
+
+def test_scheduler_dispatches_waiting_classes_by_weight():
+    host = DockerHost('bench0', 'tcp://fake-0:2375', 1)
+    host.client = FakeDockerClient()
+    pool = DockerHostPool([host])
+    dispatched = []
+    blocker = threading.Event()
+    done = threading.Event()
+
+    def runner(job, host):
+        if job['task_id'] == 0:
+            blocker.wait(5)
+        dispatched.append(job['priority'])
+        pool.release(host.name, job['task_id'])
+        if len(dispatched) == 11:
+            done.set()
+
+    scheduler = TaskScheduler(pool, runner, max_workers=2)
+    # Holds the only slot while both classes queue up behind it
+    scheduler.submit(0, 'user', 'token')
+    for task_id in range(1, 6):
+        scheduler.submit(task_id, 'user', 'token', priority='batch')
+    for task_id in range(6, 11):
+        scheduler.submit(task_id, 'user', 'token', priority='interactive')
+    blocker.set()
+
+    assert done.wait(5)
+    # While both classes wait, four of every five dispatches are interactive
+    assert dispatched[1:6].count('interactive') == 4
+    assert scheduler.queue_depth() == 0
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import context as otel_context, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+    OTEL_AVAILABLE = True
+except ImportError:
+    SpanExporter = object
+    OTEL_AVAILABLE = False
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tracing is opt-in and needs the opentelemetry-sdk package
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+# file (JSON lines, a local stand-in for a collector), console or otlp
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'file')
+TRACING_FILE = os.getenv('TRACING_FILE', '/tmp/async-code-traces.jsonl')
+SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'async-code-server')
+
+_tracer = None
+_init_lock = threading.Lock()
+
+
+class FileSpanExporter(SpanExporter):
+    """Append finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        try:
+            with self._lock, open(self.path, 'a') as f:
+                for span in spans:
+                    f.write(span.to_json(indent=None) + '\n')
+            return SpanExportResult.SUCCESS
+        except OSError as e:
+            logger.warning(f"⚠️  Failed to write {len(spans)} spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        pass
+
+
+def _build_exporter():
+    if TRACING_EXPORTER == 'console':
+        return ConsoleSpanExporter()
+    if TRACING_EXPORTER == 'otlp':
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    return FileSpanExporter(TRACING_FILE)
+
+
+def get_tracer():
+    """The process tracer, set up on first use; None when tracing is off"""
+    global _tracer, TRACING_ENABLED
+    if not TRACING_ENABLED or _tracer is not None:
+        return _tracer
+    with _init_lock:
+        if _tracer is None:
+            if not OTEL_AVAILABLE:
+                logger.warning("⚠️  TRACING_ENABLED is set but opentelemetry-sdk is not installed - tracing disabled")
+                TRACING_ENABLED = False
+                return None
+            try:
+                provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}))
+                provider.add_span_processor(BatchSpanProcessor(_build_exporter()))
+            except Exception as e:
+                logger.warning(f"⚠️  Failed to set up the '{TRACING_EXPORTER}' trace exporter - tracing disabled: {e}")
+                TRACING_ENABLED = False
+                return None
+            _tracer = provider.get_tracer(__name__)
+            logger.info(f"🔭 Tracing enabled ({TRACING_EXPORTER} exporter)")
+    return _tracer
+
+
+def _attributes(attributes: dict) -> dict:
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Run a block inside a child span of the current trace (a no-op when tracing is off)"""
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, **attributes):
+    """Open a span that is ended elsewhere, e.g. by another thread, with ``end_span``"""
+    tracer = get_tracer()
+    if tracer is None:
+        return None
+    return tracer.start_span(name, attributes=_attributes(attributes))
+
+
+def end_span(open_span, error: str = None):
+    if open_span is None:
+        return
+    if error:
+        open_span.set_status(trace.Status(trace.StatusCode.ERROR, error[:200]))
+    open_span.end()
+
+
+def inject() -> dict:
+    """W3C trace context (``traceparent``) of the current span, to carry across threads or processes"""
+    if get_tracer() is None:
+        return {}
+    carrier = {}
+    TraceContextTextMapPropagator().inject(carrier)
+    return carrier
+
+
+@contextmanager
+def resume(parent):
+    """Make ``parent`` (an open span or an ``inject()`` carrier) the current trace context"""
+    if get_tracer() is None or not parent:
+        yield
+        return
+    if isinstance(parent, dict):
+        ctx = TraceContextTextMapPropagator().extract(parent)
+    else:
+        ctx = trace.set_span_in_context(parent)
+    token = otel_context.attach(ctx)
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+
+def current_trace_id():
+    """Hex id of the current trace, or None"""
+    if get_tracer() is None:
+        return None
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, '032x') if span_context.is_valid else None
+
+
+def container_env() -> dict:
+    """Environment variables that let the task container join the current trace"""
+    carrier = inject()
+    return {'TRACEPARENT': carrier['traceparent']} if carrier.get('traceparent') else {}
+
+
+def init_app(app):
+    """Open a server span for every request, continuing an incoming ``traceparent``"""
+    from flask import g, request
+
+    if get_tracer() is None:
+        return
+
+    @app.before_request
+    def _start_request_span():
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_span = _tracer.start_span(
+            f"{request.method} {route}",
+            context=TraceContextTextMapPropagator().extract({key.lower(): value for key, value in request.headers.items()}),
+            kind=trace.SpanKind.SERVER,
+            attributes={'http.method': request.method, 'http.route': route}
+        )
+        g.trace_span = request_span
+        g.trace_token = otel_context.attach(trace.set_span_in_context(request_span))
+
+    @app.after_request
+    def _tag_response(response):
+        request_span = g.get('trace_span')
+        if request_span is not None:
+            request_span.set_attribute('http.status_code', response.status_code)
+            response.headers['X-Trace-Id'] = format(request_span.get_span_context().trace_id, '032x')
+        return response
+
+    @app.teardown_request
+    def _end_request_span(error=None):
+        request_span = g.pop('trace_span', None)
+        if request_span is not None:
+            end_span(request_span, str(error) if error else None)
+            otel_context.detach(g.pop('trace_token'))
@@ -5,12 +5,23 @@ import fcntl
 import queue
 import atexit
 
-from .code_task_v2 import run_ai_code_task_v2, _run_ai_code_task_v2_internal
-
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Loaded on first use, so helpers like utils.output_parser import without the executor (and Docker SDK)
+_EXECUTOR_EXPORTS = ('run_ai_code_task_v2', 'start_ai_code_task_v2', 'cancel_ai_code_task_v2', 'execution_status', 'get_quota_manager')
+
+
+def __getattr__(name):
+    if name in _EXECUTOR_EXPORTS:
+        from . import code_task_v2
+        return getattr(code_task_v2, name)
+    if name == 'QuotaExceeded':
+        from .quotas import QuotaExceeded
+        return QuotaExceeded
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Global Codex execution queue and lock for sequential processing
 codex_execution_queue = queue.Queue()
@@ -80,6 +91,7 @@ def queue_codex_task(task_id, user_id=None, github_token=None, is_v2=True):
 def _execute_codex_task_v2(task_id: int, user_id: str, github_token: str):
     """Execute Codex task v2 - internal method called by sequential processor"""
     # This will contain the actual execution logic
+    from .code_task_v2 import _run_ai_code_task_v2_internal
     return _run_ai_code_task_v2_internal(task_id, user_id, github_token)
 
 
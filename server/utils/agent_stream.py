@@ -0,0 +1,194 @@
+import json
+import logging
+
+from .output_parser import OUTPUT_FORMAT_MARKER
+from .stats import percentile
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Put by the task runner in front of each line of Claude Code's stream-json output:
+# "=== AGENT EVENT: <epoch ms> <event json>"
+AGENT_EVENT_MARKER = '=== AGENT EVENT: '
+
+# Usage fields of the Anthropic API, by the name they are recorded under
+TOKEN_KINDS = {
+    'input_tokens': 'input',
+    'output_tokens': 'output',
+    'cache_read_input_tokens': 'cache_read',
+    'cache_creation_input_tokens': 'cache_creation',
+}
+
+# Per-turn records kept in execution_metadata; longer runs keep their first turns only
+MAX_RECORDED_TURNS = 500
+
+
+def _content(message) -> list:
+    content = (message or {}).get('content')
+    return [block for block in content if isinstance(block, dict)] if isinstance(content, list) else []
+
+
+def _usage(usage) -> dict:
+    usage = usage if isinstance(usage, dict) else {}
+    return {kind: int(usage.get(field) or 0) for field, kind in TOKEN_KINDS.items()}
+
+
+class AgentStream:
+    """Tool calls, turns, token usage and turn latency of one agent run, fed its events in order.
+
+    A turn is one model response. Claude Code emits a response with several content
+    blocks as several ``assistant`` events sharing a message id; they count once.
+    A turn's latency runs from the event before it (the prompt being sent, or the
+    last tool result) to its first event.
+    """
+
+    def __init__(self, started_ms: int = None):
+        self.model = None
+        self.turns = []  # {'seconds', 'tools', 'usage'}
+        self.tool_calls = {}
+        self.tool_errors = 0
+        self.result = None
+        self.started_ms = started_ms
+        self.last_ms = started_ms
+        self._turns_by_message = {}
+
+    def feed(self, event: dict, at_ms: int = None):
+        """Account for one stream-json event, received at ``at_ms`` (epoch milliseconds)"""
+        if self.started_ms is None:
+            self.started_ms = at_ms
+        kind = event.get('type')
+        if kind == 'system' and event.get('subtype') == 'init':
+            self.model = event.get('model')
+        elif kind == 'assistant':
+            self._assistant(event.get('message') or {}, at_ms)
+        elif kind == 'user':
+            self.tool_errors += sum(1 for block in _content(event.get('message')) if block.get('type') == 'tool_result' and block.get('is_error'))
+        elif kind == 'result':
+            self.result = event
+        if at_ms is not None:
+            self.last_ms = at_ms
+
+    def _assistant(self, message: dict, at_ms: int):
+        message_id = message.get('id')
+        turn = self._turns_by_message.get(message_id) if message_id else None
+        if turn is None:
+            seconds = (at_ms - self.last_ms) / 1000 if at_ms is not None and self.last_ms is not None else None
+            turn = {'seconds': None if seconds is None else round(max(0.0, seconds), 3), 'tools': [], 'usage': {}}
+            self.turns.append(turn)
+            if message_id:
+                self._turns_by_message[message_id] = turn
+        for block in _content(message):
+            if block.get('type') == 'tool_use':
+                name = str(block.get('name') or 'unknown')
+                turn['tools'].append(name)
+                self.tool_calls[name] = self.tool_calls.get(name, 0) + 1
+        if message.get('usage'):
+            # Later events of a message repeat its usage with the final output count
+            turn['usage'] = _usage(message['usage'])
+
+    def summary(self) -> dict:
+        """What ``execution_metadata['agent']`` records about the run"""
+        result = self.result or {}
+        if isinstance(result.get('usage'), dict):
+            tokens = _usage(result['usage'])
+        else:
+            tokens = {kind: sum(turn['usage'].get(kind, 0) for turn in self.turns) for kind in TOKEN_KINDS.values()}
+
+        duration_ms = result.get('duration_ms')
+        if duration_ms is None and self.started_ms is not None and self.last_ms is not None:
+            duration_ms = self.last_ms - self.started_ms
+        latencies = [turn['seconds'] for turn in self.turns if turn['seconds'] is not None]
+        return {
+            'model': self.model,
+            'outcome': result.get('subtype', 'incomplete'),  # success, error_max_turns, ... or incomplete (no result event)
+            'turns': len(self.turns),
+            'tool_calls': dict(sorted(self.tool_calls.items(), key=lambda item: -item[1])),
+            'tool_errors': self.tool_errors,
+            'tokens': tokens,
+            'cost_usd': result.get('total_cost_usd'),
+            'duration_seconds': None if duration_ms is None else round(duration_ms / 1000, 3),
+            'api_duration_seconds': round(result['duration_api_ms'] / 1000, 3) if result.get('duration_api_ms') is not None else None,
+            'turn_seconds': {
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'max': max(latencies)
+            } if latencies else None,
+            'turn_log': [
+                {'seconds': turn['seconds'], 'output_tokens': turn['usage'].get('output', 0), 'tools': turn['tools']}
+                for turn in self.turns[:MAX_RECORDED_TURNS]
+            ]
+        }
+
+
+def parse_agent_stream(logs: str):
+    """Agent accounting from the AGENT EVENT lines of container output, or None when there are none"""
+    # Events precede result extraction; stopping there keeps commit messages in the patch out
+    end = logs.rfind('\n' + OUTPUT_FORMAT_MARKER + '\n')
+    end = len(logs) if end < 0 else end
+    stream = AgentStream()
+    events = malformed = 0
+    position = logs.find(AGENT_EVENT_MARKER, 0, end)
+    while position >= 0:
+        line_end = logs.find('\n', position, end)
+        if line_end < 0:
+            line_end = end
+        at_line_start = position == 0 or logs[position - 1] == '\n'
+        line = logs[position + len(AGENT_EVENT_MARKER):line_end]
+        position = logs.find(AGENT_EVENT_MARKER, line_end, end)
+        if not at_line_start:
+            continue
+        try:
+            at_ms, _, payload = line.partition(' ')
+            event = json.loads(payload)
+            if not isinstance(event, dict):
+                raise ValueError('not an object')
+            stream.feed(event, int(at_ms))
+            events += 1
+        except ValueError:
+            malformed += 1
+    if malformed:
+        logger.warning(f"⚠️  Ignored {malformed} malformed agent event line(s)")
+    return stream.summary() if events else None
+
+
+def summarize_agent_usage(runs: list, top: int = 5) -> dict:
+    """Aggregate ``[{'task_id', 'agent'}]`` of a project's tasks, with its slowest and most expensive ones"""
+    runs = [run for run in runs if run.get('agent')]
+    if not runs:
+        return {'tasks': 0}
+
+    def total_tokens(agent):
+        return sum(agent.get('tokens', {}).values())
+
+    def stats(values):
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        return {'mean': round(sum(values) / len(values), 3), 'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95), 'max': max(values)}
+
+    tokens = {kind: sum(run['agent'].get('tokens', {}).get(kind, 0) for run in runs) for kind in TOKEN_KINDS.values()}
+    tool_calls = {}
+    for run in runs:
+        for name, count in run['agent'].get('tool_calls', {}).items():
+            tool_calls[name] = tool_calls.get(name, 0) + count
+    costs = [run['agent'].get('cost_usd') for run in runs if run['agent'].get('cost_usd') is not None]
+
+    def brief(run):
+        agent = run['agent']
+        return {
+            'task_id': run['task_id'], 'turns': agent.get('turns'), 'tokens': total_tokens(agent),
+            'cost_usd': agent.get('cost_usd'), 'duration_seconds': agent.get('duration_seconds')
+        }
+
+    return {
+        'tasks': len(runs),
+        'tokens': tokens,
+        'cost_usd': round(sum(costs), 4) if costs else None,
+        'tool_calls': dict(sorted(tool_calls.items(), key=lambda item: -item[1])),
+        'turns': stats([run['agent'].get('turns') for run in runs]),
+        'duration_seconds': stats([run['agent'].get('duration_seconds') for run in runs]),
+        'turn_p95_seconds': stats([(run['agent'].get('turn_seconds') or {}).get('p95') for run in runs]),
+        'most_expensive': [brief(run) for run in sorted(runs, key=lambda run: -total_tokens(run['agent']))[:top]],
+        'slowest': [brief(run) for run in sorted(runs, key=lambda run: -(run['agent'].get('duration_seconds') or 0))[:top]]
+    }
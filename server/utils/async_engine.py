@@ -0,0 +1,630 @@
+import asyncio
+import contextvars
+import logging
+import os
+import ssl
+import struct
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import aiohttp
+import docker.utils
+
+from database import DatabaseOperations
+from metrics import CONTAINER_CREATE_LATENCY, CONTAINER_START_LATENCY, QUEUE_WAIT, SUPABASE_LATENCY, track_latency
+from tracing import resume, span
+from . import leases
+from .code_task_v2 import (
+    _get_task_prompt,
+    _cancel_requested,
+    _cancel_requests,
+    _cancelled_elsewhere,
+    _killed_without_cancel,
+    _build_container_kwargs,
+    _build_exit_updates,
+    _observe_agent_usage,
+    _observe_phase_durations,
+    _record_run_metadata,
+    REPO_CACHE_ENABLED,
+    get_docker_pool,
+    get_quota_manager,
+    get_resource_profiles,
+)
+from .docker_hosts import docker_tls_paths
+from .priorities import DEFAULT_PRIORITY, WeightedTurns, next_job
+from .resources import ResourceSampler, format_bytes
+from .watchdog import Watchdog, watchdog_limits
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-stage timeouts in seconds, overridable with ASYNC_STAGE_TIMEOUT_<STAGE>; a running
+# container is bounded by its watchdog limits instead (utils/watchdog.py)
+STAGE_TIMEOUTS = {
+    'fetch': 30,
+    'create': 120,
+    'collect': 120,
+    'update': 30,
+}
+for _stage in STAGE_TIMEOUTS:
+    _override = os.getenv(f'ASYNC_STAGE_TIMEOUT_{_stage.upper()}')
+    if _override:
+        STAGE_TIMEOUTS[_stage] = float(_override)
+
+# Seconds between watchdog checks and resource samples of each running container
+WATCH_INTERVAL = float(os.getenv('ASYNC_WATCH_INTERVAL', '5'))
+
+
+class AsyncDockerClient:
+    """Minimal Docker Engine API client over aiohttp (unix socket, tcp or tcp with TLS)"""
+
+    def __init__(self, base_url: str = None):
+        self.base_url = base_url or os.getenv('DOCKER_HOST', 'unix:///var/run/docker.sock')
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            parsed = urlparse(self.base_url)
+            if parsed.scheme == 'unix':
+                # limit=0: every running task keeps one long-poll /wait request open
+                connector = aiohttp.UnixConnector(path=parsed.path, limit=0)
+                self._api_root = 'http://docker'
+            else:
+                tls = docker_tls_paths(self.base_url)
+                connector = aiohttp.TCPConnector(limit=0, ssl=_ssl_context(tls) if tls else False)
+                self._api_root = f"{'https' if tls else 'http'}://{parsed.netloc}"
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None))
+        return self._session
+
+    async def _request(self, method: str, path: str, params: dict = None, body: dict = None, raw: bool = False):
+        session = self._get_session()
+        async with session.request(method, f"{self._api_root}{path}", params=params, json=body) as response:
+            if response.status >= 400:
+                message = await response.text()
+                raise Exception(f"Docker API error {response.status} on {method} {path}: {message.strip()}")
+            if raw:
+                return await response.read()
+            if response.status == 204:
+                return None
+            return await response.json(content_type=None)
+
+    async def create_container(self, container_kwargs: dict) -> str:
+        name, config = _engine_api_config(container_kwargs)
+        result = await self._request('POST', '/containers/create', params={'name': name}, body=config)
+        return result['Id']
+
+    async def start_container(self, container_id: str):
+        await self._request('POST', f'/containers/{container_id}/start')
+
+    async def wait_container(self, container_id: str) -> int:
+        result = await self._request('POST', f'/containers/{container_id}/wait')
+        return result.get('StatusCode', -1)
+
+    async def inspect_container(self, container_id: str) -> dict:
+        return await self._request('GET', f'/containers/{container_id}/json')
+
+    async def kill_container(self, container_id: str):
+        await self._request('POST', f'/containers/{container_id}/kill')
+
+    async def remove_container(self, container_id: str, force: bool = True):
+        await self._request('DELETE', f'/containers/{container_id}', params={'force': 'true' if force else 'false'})
+
+    async def container_logs(self, container_id: str, timestamps: bool = False, since: float = None) -> str:
+        params = {'stdout': 'true', 'stderr': 'true'}
+        if timestamps:
+            params['timestamps'] = 'true'
+        if since:
+            params['since'] = f'{since:.9f}'
+        raw = await self._request('GET', f'/containers/{container_id}/logs', params=params, raw=True)
+        return _demux_logs(raw).decode('utf-8', errors='replace')
+
+    async def container_stats(self, container_id: str) -> dict:
+        return await self._request('GET', f'/containers/{container_id}/stats', params={'stream': 'false'})
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class AsyncSupabaseClient:
+    """Async PostgREST access to the tables the execution pipeline touches"""
+
+    def __init__(self, url: str = None, key: str = None):
+        self.url = (url or os.getenv('SUPABASE_URL', '')).rstrip('/')
+        self.key = key or os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers={
+                'apikey': self.key,
+                'Authorization': f'Bearer {self.key}',
+                'Content-Type': 'application/json',
+                'Prefer': 'return=representation',
+            })
+        return self._session
+
+    async def _request(self, method: str, table: str, filters: dict, body: dict = None) -> list:
+        if not self.url or not self.key:
+            raise ValueError("Database not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables")
+
+        params = {column: f'eq.{value}' for column, value in filters.items()}
+        if method == 'GET':
+            params['select'] = '*'
+        session = self._get_session()
+        async with session.request(method, f"{self.url}/rest/v1/{table}", params=params, json=body) as response:
+            if response.status >= 400:
+                message = await response.text()
+                raise Exception(f"Supabase error {response.status} on {method} {table}: {message.strip()}")
+            return await response.json(content_type=None) or []
+
+    @track_latency(SUPABASE_LATENCY)
+    async def get_task_by_id(self, task_id: int, user_id: str):
+        rows = await self._request('GET', 'tasks', {'id': task_id, 'user_id': user_id})
+        return rows[0] if rows else None
+
+    @track_latency(SUPABASE_LATENCY)
+    async def get_user_by_id(self, user_id: str):
+        try:
+            rows = await self._request('GET', 'users', {'id': user_id})
+            return rows[0] if rows else None
+        except Exception as e:
+            logger.error(f"Error getting user: {e}")
+            return None
+
+    @track_latency(SUPABASE_LATENCY)
+    async def get_project_by_id(self, project_id: int, user_id: str):
+        rows = await self._request('GET', 'projects', {'id': project_id, 'user_id': user_id})
+        return rows[0] if rows else None
+
+    @track_latency(SUPABASE_LATENCY)
+    async def update_task(self, task_id: int, user_id: str, updates: dict):
+        updates = DatabaseOperations.stamp_task_updates(updates)
+        rows = await self._request('PATCH', 'tasks', {'id': task_id, 'user_id': user_id}, body=updates)
+        return rows[0] if rows else None
+
+    @track_latency(SUPABASE_LATENCY)
+    async def mark_task_running(self, task_id: int, user_id: str):
+        updates = DatabaseOperations.stamp_task_updates({'status': 'running'})
+        rows = await self._request('PATCH', 'tasks', {'id': task_id, 'user_id': user_id, 'status': 'pending'}, body=updates)
+        return rows[0] if rows else None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class AsyncTaskEngine:
+    """Run the task pipeline as coroutines on one event loop in a dedicated thread.
+
+    Submitted tasks wait in the engine's own queue, which a dispatcher coroutine
+    serves like ``TaskScheduler``: by priority class with weighted turns and aging,
+    passing over owners at a quota, once a host can fit the task. Per-host slots
+    size the threads engine's worker pools and are not enforced here; at most
+    ``max_concurrency`` tasks run at once instead.
+
+    Every stage (DB fetch, container create, wait, log collection, DB update) is a
+    coroutine bounded by ``asyncio.wait_for`` so a single process can drive hundreds
+    of concurrent tasks without a thread per container. While a container runs, its
+    watchdog deadlines are checked and its resource usage sampled every
+    ``WATCH_INTERVAL`` seconds.
+    """
+
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or int(os.getenv('ASYNC_ENGINE_MAX_CONCURRENCY', '500'))
+        self._docker_clients = {}
+        self.db = AsyncSupabaseClient()
+        self._loop = None
+        self._wakeup = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._queue = []  # Jobs waiting for a host, in submission order
+        self._turns = WeightedTurns()
+        self._running = 0
+        get_docker_pool().add_release_listener(self.notify)
+
+    def start(self):
+        """Start the event loop thread (idempotent)"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._run_loop, name='async-task-engine', daemon=True).start()
+        self._ready.wait()
+        get_docker_pool().start_health_checks()
+        logger.info(f"🚀 Async task engine started (max concurrency: {self.max_concurrency})")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._loop.create_task(self._dispatch_loop())
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    def submit(self, task_id: int, user_id: str, github_token: str, repo_url: str = None, resources: dict = None, trace_context: dict = None,
+               project_id: int = None, priority: str = DEFAULT_PRIORITY, queued_at: float = None):
+        """Queue a task on the engine (same arguments as ``TaskScheduler.submit``) and
+        return a ``concurrent.futures.Future`` that resolves once it finished"""
+        self.start()
+        job = {
+            'task_id': task_id,
+            'user_id': user_id,
+            'project_id': project_id,
+            'priority': priority or DEFAULT_PRIORITY,
+            'github_token': github_token,
+            'repo_url': repo_url,
+            'resources': resources,
+            'trace_context': trace_context,
+            'queued_at': queued_at or time.time(),
+        }
+        return asyncio.run_coroutine_threadsafe(self.run_task(job), self._loop)
+
+    def notify(self):
+        """Wake the dispatcher, e.g. after a host slot was released"""
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def cancel(self, task_id: int) -> bool:
+        """Drop a task that is still waiting in the queue; False if it was already dispatched"""
+        if self._loop is None:
+            return False
+        return asyncio.run_coroutine_threadsafe(self._cancel(task_id), self._loop).result()
+
+    def drain(self) -> list:
+        """Remove and return every job still waiting for a host, e.g. to hand them to another process"""
+        if self._loop is None:
+            return []
+        return asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result()
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def run(self, task_id: int, user_id: str, github_token: str):
+        """Run a task on the engine and block until it finishes"""
+        return self.submit(task_id, user_id, github_token).result()
+
+    async def _stage(self, name: str, task_id: int, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, timeout=STAGE_TIMEOUTS[name])
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"Stage '{name}' of task {task_id} timed out after {STAGE_TIMEOUTS[name]}s")
+
+    async def run_task(self, job: dict):
+        task_id, user_id = job['task_id'], job['user_id']
+        with resume(job.get('trace_context')), span('task.run', task_id=task_id, engine='async'):
+            host = None
+            try:
+                if job['resources'] is None:
+                    # Profile lookup may hit the database; keep it off the event loop (in this task's trace)
+                    job['resources'] = await asyncio.get_running_loop().run_in_executor(
+                        None, contextvars.copy_context().run, get_resource_profiles().limits_for, job['project_id'], job['repo_url']
+                    )
+                host = await self._dispatched(job)
+                if host is None:
+                    # Cancelled or handed back while it waited
+                    return
+                await self._run_pipeline(job, host)
+            except Exception as e:
+                logger.error(f"💥 Async pipeline failed for task {task_id}: {e}")
+                try:
+                    await self._stage('update', task_id, self.db.update_task(task_id, user_id, {
+                        'status': 'failed',
+                        'error': str(e)
+                    }))
+                except Exception:
+                    logger.error(f"Failed to update task {task_id} status after exception")
+            finally:
+                _cancel_requests.discard(task_id)
+                if host is not None:
+                    self._running -= 1
+                    # Frees the host's resources and the task's quota, and wakes the dispatcher
+                    get_docker_pool().release(host.name, task_id)
+
+    async def _dispatched(self, job: dict):
+        """Queue a job and wait until the dispatcher picked a host for it (None if it left the queue)"""
+        job['dispatched'] = self._loop.create_future()
+        self._queue.append(job)
+        logger.info(f"📋 Queued {job['priority']} task {job['task_id']} on async engine (queue depth: {len(self._queue)})")
+        self._wakeup.set()
+        return await job['dispatched']
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            while self._queue and self._running < self.max_concurrency:
+                job, eligible = next_job(self._queue, self._turns, get_quota_manager())
+                if job is None:
+                    # Every queued task's owner is at a quota - wait for a release or for budgets to refill
+                    break
+                host = get_docker_pool().acquire(job, slots=False)
+                if host is None:
+                    # Every host is unhealthy or short on memory/CPU - wait for a release or health change
+                    break
+                self._queue.remove(job)
+                self._turns.commit(job['dispatch_class'], eligible)
+                get_quota_manager().started(job)
+                self._running += 1
+
+                wait_time = time.time() - job['queued_at']
+                QUEUE_WAIT.labels(job['priority']).observe(wait_time)
+                aged = f" (aged to {job['dispatch_class']})" if job['dispatch_class'] != job['priority'] else ''
+                logger.info(f"🚚 Dispatching {job['priority']} task {job['task_id']}{aged} to host '{host.name}' after {wait_time:.2f}s in queue")
+                job['dispatched'].set_result(host)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _cancel(self, task_id: int) -> bool:
+        for job in self._queue:
+            if job['task_id'] == task_id:
+                self._queue.remove(job)
+                job['dispatched'].set_result(None)
+                logger.info(f"🛑 Removed task {task_id} from the async engine queue")
+                return True
+        return False
+
+    async def _drain(self) -> list:
+        jobs, self._queue = self._queue, []
+        for job in jobs:
+            job['dispatched'].set_result(None)
+        return [{key: value for key, value in job.items() if key != 'dispatched'} for job in jobs]
+
+    async def _run_pipeline(self, job: dict, host):
+        task_id, user_id = job['task_id'], job['user_id']
+        task, user = await self._stage('fetch', task_id, asyncio.gather(
+            self.db.get_task_by_id(task_id, user_id),
+            self.db.get_user_by_id(user_id)
+        ))
+        if not task:
+            logger.error(f"Task {task_id} not found in database")
+            return
+        if task.get('status') == 'cancelled' or _cancel_requested(task_id):
+            logger.info(f"🛑 Task {task_id} was cancelled while queued - skipping")
+            return
+        if not leases.owns(task):
+            logger.warning(f"⚠️  Task {task_id} is now owned by executor {task['executor_id']} - skipping")
+            return
+
+        model_name = task.get('agent', 'claude').upper()
+        if task.get('agent', 'claude') != 'claude':
+            await self._stage('update', task_id, self.db.update_task(task_id, user_id, {
+                'status': 'failed',
+                'error': f"Unsupported model: {task.get('agent')}. Only Claude is supported."
+            }))
+            return
+
+        prompt = _get_task_prompt(task)
+        if not prompt:
+            await self._stage('update', task_id, self.db.update_task(task_id, user_id, {
+                'status': 'failed',
+                'error': "No user prompt found in chat messages"
+            }))
+            return
+
+        if not await self._stage('update', task_id, self.db.mark_task_running(task_id, user_id)):
+            logger.info(f"🛑 Task {task_id} is no longer pending - skipping")
+            return
+        logger.info(f"🚀 Starting {model_name} Code task {task_id} on async engine (host '{host.name}')")
+
+        if _cancel_requested(task_id):
+            await self._stage('update', task_id, self.db.update_task(task_id, user_id, {
+                'status': 'cancelled',
+                'error': 'Task was cancelled before its container started'
+            }))
+            return
+        # Deadlines may be tuned per project
+        project = await self._stage('fetch', task_id, self.db.get_project_by_id(task['project_id'], user_id)) if task.get('project_id') else None
+        watchdog = Watchdog(watchdog_limits(project.get('settings') if project else None))
+        resources = job['resources']
+        user_preferences = user.get('preferences', {}) if user else {}
+        container_kwargs = _build_container_kwargs(task_id, user_id, task, prompt, user_preferences, job['github_token'], resources)
+        await self._run_container(task_id, user_id, model_name, host, container_kwargs, task.get('repo_url'), job.get('placement'), resources, watchdog)
+
+    def _docker_for(self, host) -> AsyncDockerClient:
+        if host.name not in self._docker_clients:
+            self._docker_clients[host.name] = AsyncDockerClient(host.base_url)
+        return self._docker_clients[host.name]
+
+    async def _kill(self, docker_client: AsyncDockerClient, container_id: str):
+        """Kill a task container; one that already exited (404/409) is left to the normal exit path"""
+        try:
+            await docker_client.kill_container(container_id)
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to kill container {container_id[:12]}: {e}")
+
+    async def _run_container(self, task_id: int, user_id: str, model_name: str, host, container_kwargs: dict, repo_url: str, placement: dict, resources: dict, watchdog: Watchdog):
+        docker_client = self._docker_for(host)
+        container_id = await self._stage('create', task_id, self._create_container(docker_client, host.name, task_id, container_kwargs))
+        await self._stage('update', task_id, self.db.update_task(task_id, user_id, {
+            'container_id': container_id,
+            'docker_host': host.name
+        }))
+
+        exit_info = {'exit_code': -1, 'oom_killed': False, 'timed_out': False, 'cancelled': False, 'watchdog': None, 'phases': {}}
+        sampler = ResourceSampler()
+        if _cancel_requested(task_id):
+            # Cancelled while the container was being created
+            await self._kill(docker_client, container_id)
+        logger.info(f"⏳ Watching container {container_id[:12]} of task {task_id} (limits: {watchdog.limits})")
+        watcher = asyncio.ensure_future(self._watch(task_id, docker_client, container_id, watchdog, sampler, exit_info))
+        try:
+            with span('docker.wait', container_id=container_id[:12]):
+                exit_info['exit_code'] = await docker_client.wait_container(container_id)
+        finally:
+            watcher.cancel()
+        state = (await docker_client.inspect_container(container_id)).get('State', {})
+        exit_info['oom_killed'] = bool(state.get('OOMKilled'))
+        exit_info['cancelled'] = _cancel_requested(task_id)
+        if watchdog.follows_output:
+            # Catch the output written since the last check
+            await self._observe_output(docker_client, container_id, watchdog)
+        exit_info['phases'] = watchdog.phase_durations()
+
+        try:
+            with span('docker.logs', container_id=container_id[:12]):
+                logs = await self._stage('collect', task_id, docker_client.container_logs(container_id))
+        except Exception as e:
+            logger.warning(f"❌ Failed to get container logs: {e}")
+            logs = f"Failed to retrieve logs: {e}"
+
+        try:
+            await docker_client.remove_container(container_id, force=True)
+            logger.info(f"🧹 Successfully removed container {container_id[:12]}")
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to remove container {container_id[:12]}: {e}")
+
+        if _killed_without_cancel(exit_info):
+            stored = await self._stage('fetch', task_id, self.db.get_task_by_id(task_id, user_id))
+            exit_info['cancelled'] = _cancelled_elsewhere(stored)
+
+        # Parsing is CPU-bound; keep it off the event loop
+        with span('task.parse', log_bytes=len(logs)):
+            updates = await asyncio.get_running_loop().run_in_executor(
+                None, _build_exit_updates, exit_info, logs, format_bytes(resources['memory_bytes'])
+            )
+        _observe_phase_durations(updates, exit_info)
+        _observe_agent_usage(updates, task_id)
+        _record_run_metadata(updates, exit_info, placement, resources, sampler.summary())
+        await self._stage('update', task_id, self.db.update_task(task_id, user_id, updates))
+
+        if updates['status'] == 'completed':
+            # The run left a mirror of the repository in this host's cache volume
+            if REPO_CACHE_ENABLED:
+                get_docker_pool().mark_warm(host.name, repo_url)
+            logger.info(f"🎉 {model_name} Task {task_id} completed successfully on async engine")
+        elif updates['status'] == 'cancelled':
+            logger.info(f"🛑 {model_name} Task {task_id} was cancelled")
+        else:
+            logger.error(f"💥 {model_name} Task {task_id} failed: {updates['error'][:200]}...")
+
+    async def _watch(self, task_id: int, docker_client: AsyncDockerClient, container_id: str, watchdog: Watchdog, sampler: ResourceSampler, exit_info: dict):
+        """Sample the container's resource usage and kill it once a watchdog deadline passes"""
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            try:
+                sampler.record(await docker_client.container_stats(container_id))
+            except Exception as e:
+                logger.warning(f"⚠️  Could not sample resources of container {container_id[:12]}: {e}")
+            if watchdog.follows_output:
+                await self._observe_output(docker_client, container_id, watchdog)
+            fired = watchdog.expired()
+            if fired and not _cancel_requested(task_id):
+                exit_info['timed_out'] = True
+                exit_info['watchdog'] = fired
+                logger.warning(f"⏰ Container {container_id[:12]} hit its {fired['deadline']} deadline ({fired['limit_seconds']}s) - killing")
+                await self._kill(docker_client, container_id)
+                return
+
+    async def _observe_output(self, docker_client: AsyncDockerClient, container_id: str, watchdog: Watchdog):
+        """Feed output written since the container's log cursor to its watchdog"""
+        try:
+            chunk = await docker_client.container_logs(container_id, timestamps=True, since=watchdog.log_cursor)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not read output of container {container_id[:12]}: {e}")
+            return
+        if chunk:
+            watchdog.observe(chunk)
+
+    async def _create_container(self, docker_client: AsyncDockerClient, host_name: str, task_id: int, container_kwargs: dict) -> str:
+        """Create and start the task container, retrying with backoff like the sync path"""
+        max_retries = 5
+        for attempt in range(max_retries):
+            try:
+                started_at = time.perf_counter()
+                with span('docker.create', host=host_name):
+                    container_id = await docker_client.create_container(container_kwargs)
+                created_at = time.perf_counter()
+                CONTAINER_CREATE_LATENCY.labels(host_name).observe(created_at - started_at)
+                with span('docker.start', host=host_name, container_id=container_id[:12]):
+                    await docker_client.start_container(container_id)
+                CONTAINER_START_LATENCY.labels(host_name).observe(time.perf_counter() - created_at)
+                logger.info(f"✅ Container created successfully: {container_id[:12]} (name: {container_kwargs['name']})")
+                return container_id
+            except Exception as e:
+                if 'Conflict' in str(e) or '409' in str(e):
+                    container_kwargs['name'] = f'claude-code-task-{task_id}-{int(time.time())}-{uuid.uuid4().hex[:8]}'
+                    logger.warning(f"🔄 Container name conflict, retrying as {container_kwargs['name']}")
+                else:
+                    logger.warning(f"⚠️  Docker API error on attempt {attempt + 1}: {e}")
+                if attempt == max_retries - 1:
+                    raise Exception(f"Failed to create container after {max_retries} attempts: {e}")
+                await asyncio.sleep(2 ** attempt)  # Exponential backoff
+
+
+def _engine_api_config(container_kwargs: dict):
+    """Translate docker-py ``containers.run`` kwargs into a Docker Engine API create body"""
+    environment = container_kwargs.get('environment') or {}
+    host_config = {
+        'NetworkMode': container_kwargs.get('network_mode', 'bridge'),
+        'Ulimits': [dict(ulimit) for ulimit in container_kwargs.get('ulimits', [])],
+    }
+    if container_kwargs.get('mem_limit'):
+        mem_limit = container_kwargs['mem_limit']
+        host_config['Memory'] = mem_limit if isinstance(mem_limit, int) else docker.utils.parse_bytes(mem_limit)
+    if container_kwargs.get('cpu_shares'):
+        host_config['CpuShares'] = container_kwargs['cpu_shares']
+    if container_kwargs.get('nano_cpus'):
+        host_config['NanoCpus'] = container_kwargs['nano_cpus']
+    if container_kwargs.get('cpuset_cpus'):
+        host_config['CpusetCpus'] = container_kwargs['cpuset_cpus']
+    if container_kwargs.get('volumes'):
+        host_config['Binds'] = [
+            f"{source}:{mount['bind']}:{mount.get('mode', 'rw')}"
+            for source, mount in container_kwargs['volumes'].items()
+        ]
+
+    config = {
+        'Image': container_kwargs['image'],
+        'Cmd': container_kwargs['command'],
+        'Env': [f'{key}={value}' for key, value in environment.items() if value is not None],
+        'WorkingDir': container_kwargs.get('working_dir'),
+        'Tty': container_kwargs.get('tty', False),
+        'OpenStdin': container_kwargs.get('stdin_open', False),
+        'Labels': container_kwargs.get('labels', {}),
+        'HostConfig': host_config,
+    }
+    return container_kwargs['name'], config
+
+
+def _ssl_context(tls: dict) -> ssl.SSLContext:
+    """Client TLS for a Docker endpoint, from the files ``docker_tls_paths`` names"""
+    if tls['verify']:
+        context = ssl.create_default_context(cafile=tls['ca'])
+    else:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if os.path.exists(tls['cert']):
+        context.load_cert_chain(tls['cert'], tls['key'])
+    return context
+
+
+def _demux_logs(raw: bytes) -> bytes:
+    """Strip the 8-byte stream headers Docker adds to non-TTY container logs"""
+    output = []
+    offset = 0
+    while offset + 8 <= len(raw):
+        stream_type, size = struct.unpack('>BxxxL', raw[offset:offset + 8])
+        if stream_type not in (0, 1, 2):
+            # Not multiplexed (TTY container) - return as is
+            return raw
+        output.append(raw[offset + 8:offset + 8 + size])
+        offset += 8 + size
+    return b''.join(output)
+
+
+# Engine singleton, started on first use
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncTaskEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncTaskEngine()
+    return _engine
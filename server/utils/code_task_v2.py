@@ -6,22 +6,77 @@ import docker.types
 import uuid
 import time
 import random
+import threading
 from datetime import datetime
 from database import DatabaseOperations
+from metrics import (
+    AGENT_COST, AGENT_TOKENS, AGENT_TOOL_CALLS, AGENT_TURN_LATENCY, AGENT_TURNS, CONTAINER_CREATE_LATENCY,
+    CONTAINER_START_LATENCY, LOG_BYTES_PARSED, PHASE_DURATION, register_pipeline, register_queue_table
+)
+from tracing import container_env, current_trace_id, end_span, inject, resume, span, start_span
 import fcntl
+import functools
+from . import leases
+from .completion_monitor import TASK_CONTAINER_LABEL
+from .diff_files import store_file_changes
+from .docker_hosts import DockerHostPool, repo_cache_volume
+from .resources import ResourceProfiles, ResourceSampler, build_resource_profile, format_bytes
+from .scheduler import TaskScheduler
+from .snapshots import SNAPSHOT_MAX_BYTES
+from .agent_stream import parse_agent_stream
+from .output_parser import parse_container_output
+from .priorities import DEFAULT_PRIORITY
+from .quotas import QuotaManager
+from .timeline import parse_timeline, timeline_durations
+from .watchdog import DEFAULT_WATCHDOG_LIMITS, Watchdog, describe_deadline, watchdog_limits
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Docker client
-docker_client = docker.from_env()
+# Execution engine: 'threads' (completion monitor + worker pool) or 'async' (asyncio pipeline)
+EXECUTION_ENGINE = os.getenv('EXECUTION_ENGINE', 'threads')
 
-def cleanup_orphaned_containers():
-    """Clean up orphaned AI code task containers aggressively"""
+# Where tasks run: 'inline' (the API process that accepted a task runs it) or 'queue'
+# (the API only enqueues tasks; worker processes started with worker.py run them)
+EXECUTION_MODE = os.getenv('EXECUTION_MODE', 'inline')
+if EXECUTION_MODE == 'queue':
+    # Tasks waiting for a worker sit in the shared task_queue table, the same for every process
+    register_queue_table(DatabaseOperations.count_queued_tasks)
+
+# Container limits; memory and CPU come from per-project resource profiles,
+# time limits from per-project watchdog settings
+CONTAINER_TIMEOUT_SECONDS = DEFAULT_WATCHDOG_LIMITS['total_seconds']
+
+# Tail of the logs kept on a cancelled task
+PARTIAL_OUTPUT_CHARS = 20000
+
+# Tasks cancelled while being dispatched; checked right before and after the container starts
+_cancel_requests = set()
+
+# Keep a per-repository git mirror in a named volume on each host so repeat tasks clone locally
+REPO_CACHE_ENABLED = os.getenv('REPO_CACHE_ENABLED', 'true').lower() == 'true'
+
+# Task containers run the runner baked into this image (task-runner.sh at the repository root,
+# built by Dockerfile.claude-automation); containers fail fast when its version differs
+TASK_IMAGE = 'claude-code-automation:latest'
+TASK_RUNNER = '/usr/local/bin/task-runner'
+TASK_RUNNER_VERSION = '2'
+
+# Print the container environment and run Claude Code with --debug
+TASK_RUNNER_DEBUG = os.getenv('TASK_RUNNER_DEBUG', 'false').lower() == 'true'
+
+def cleanup_orphaned_containers(host=None):
+    """Clean up orphaned AI code task containers aggressively on one host (default: all healthy hosts)"""
+    if host is None:
+        for pool_host in list(get_docker_pool().hosts.values()):
+            if pool_host.healthy:
+                cleanup_orphaned_containers(pool_host)
+        return
+    
     try:
         # Get all containers with our naming pattern
-        containers = docker_client.containers.list(all=True, filters={'name': 'ai-code-task-'})
+        containers = host.client.containers.list(all=True, filters={'name': 'ai-code-task-'})
         orphaned_count = 0
         current_time = time.time()
         
@@ -62,16 +117,170 @@ def cleanup_orphaned_containers():
             logger.info(f"🧹 Cleaned up {orphaned_count} orphaned containers")
         
     except Exception as e:
-        logger.warning(f"⚠️  Failed to cleanup orphaned containers: {e}")
+        logger.warning(f"⚠️  Failed to cleanup orphaned containers on host '{host.name}': {e}")
+
+def _wait_for_host(task_id: int = None, poll_interval: float = 1.0):
+    """Block until a Docker host slot can be reserved"""
+    while True:
+        host = get_docker_pool().acquire({'task_id': task_id} if task_id is not None else None)
+        if host is not None:
+            return host
+        time.sleep(poll_interval)
+
+def _release_host(host, task_id: int = None):
+    if host is not None:
+        get_docker_pool().release(host.name, task_id)
+
+def start_ai_code_task_v2(task_id: int, user_id: str, github_token: str, repo_url: str = None, project_id: int = None, priority: str = DEFAULT_PRIORITY):
+    """Start a new task: in this process (``inline``) or by handing it to the worker processes (``queue``)"""
+    if EXECUTION_MODE == 'queue':
+        # Queue entries hold no credentials: the worker reads the token from the user's settings
+        DatabaseOperations.save_github_token(user_id, github_token)
+        DatabaseOperations.enqueue_task(task_id, user_id, repo_url=repo_url, project_id=project_id, trace_context=inject(), priority=priority)
+        logger.info(f"📮 Queued {priority} task {task_id} for the workers")
+        return None
+    
+    if not leases.claim(task_id):
+        logger.warning(f"⚠️  Task {task_id} is already owned by another executor - not starting it here")
+        return None
+    return _submit_task(task_id, user_id, github_token, repo_url=repo_url, project_id=project_id, priority=priority)
+
+def _submit_task(task_id: int, user_id: str, github_token: str, repo_url: str = None, project_id: int = None, trace_context: dict = None,
+                 priority: str = DEFAULT_PRIORITY, queued_at: float = None):
+    """Queue a task this process has claimed on the configured execution engine"""
+    trace_context = trace_context or inject()
+    resources = get_resource_profiles().limits_for(project_id, repo_url)
+    return local_scheduler().submit(
+        task_id, user_id, github_token, repo_url=repo_url, resources=resources, trace_context=trace_context,
+        project_id=project_id, priority=priority, queued_at=queued_at
+    )
+
+def local_scheduler():
+    """The queue this process dispatches tasks from: the ``TaskScheduler`` or the async engine's own"""
+    with _executor_lock:
+        if 'local_scheduler' not in _executor:
+            if EXECUTION_ENGINE == 'async':
+                from .async_engine import get_async_engine
+                scheduler = get_async_engine()
+            else:
+                scheduler = get_task_scheduler()
+            _executor['local_scheduler'] = scheduler
+            # Queue depth and per-host container gauges for /metrics, only from processes that dispatch tasks
+            register_pipeline(get_docker_pool(), scheduler.queue_depth)
+        return _executor['local_scheduler']
+
+def local_queue_depth() -> int:
+    """Tasks this process has taken on that still wait for a Docker host slot"""
+    return local_scheduler().queue_depth()
+
+def execution_status(role: str) -> dict:
+    """Role of this process and, where it runs tasks, its executor id, queue and host state"""
+    status = {'role': role, 'execution_mode': EXECUTION_MODE, 'engine': EXECUTION_ENGINE}
+    if role == 'api' and EXECUTION_MODE == 'queue':
+        return status
+    status.update({
+        'executor_id': leases.executor_id(),
+        'queue_depth': local_queue_depth(),
+        'hosts': get_docker_pool().snapshot()
+    })
+    return status
+
+def cancel_ai_code_task_v2(task: dict) -> str:
+    """Stop a queued or running task and hand its host slot to the next queued task.
+
+    Returns ``'dequeued'`` (never started), ``'killed'`` (container stopped; its
+    partial output is collected by the completion handler), ``'flagged'``
+    (being dispatched; stopped as soon as its container exists) or
+    ``'unreachable'`` (its Docker host is no longer configured; only marked cancelled).
+    """
+    task_id = task['id']
+    user_id = task['user_id']
+    if task.get('executor_id') == leases.executor_id():
+        # Only the process dispatching or watching the task checks these; others rely on the stored status
+        _cancel_requests.add(task_id)
+    
+    dequeued = DatabaseOperations.take_queued_task(task_id) if EXECUTION_MODE == 'queue' else None
+    # API processes in queue mode hold no local queue; the task_queue row is the only place it waits
+    if dequeued or (EXECUTION_MODE != 'queue' and local_scheduler().cancel(task_id)):
+        _cancel_requests.discard(task_id)
+        DatabaseOperations.update_task(task_id, user_id, {
+            'status': 'cancelled',
+            'error': 'Task was cancelled before it started'
+        })
+        return 'dequeued'
+    
+    container_id = task.get('container_id')
+    if not container_id:
+        DatabaseOperations.update_task(task_id, user_id, {
+            'status': 'cancelled',
+            'error': 'Task was cancelled before its container started'
+        })
+        return 'flagged'
+    
+    try:
+        host = get_docker_pool().get(task.get('docker_host'))
+    except ValueError as e:
+        logger.warning(f"⚠️  {e} - marking task {task_id} cancelled without stopping container {container_id[:12]}")
+        _cancel_requests.discard(task_id)
+        DatabaseOperations.update_task(task_id, user_id, {
+            'status': 'cancelled',
+            'error': 'Task was cancelled'
+        })
+        return 'unreachable'
+    
+    if not host.monitor.cancel(container_id):
+        # Not tracked by this process (async engine, or started before a restart) - kill it directly
+        logger.info(f"🛑 Killing container {container_id[:12]} of task {task_id} on '{host.name}'")
+        try:
+            host.client.containers.get(container_id).kill()
+        except docker.errors.NotFound:
+            logger.info(f"🧹 Container {container_id[:12]} already removed")
+        except docker.errors.APIError as e:
+            logger.warning(f"⚠️  Failed to kill container {container_id[:12]}: {e}")
+        if EXECUTION_ENGINE != 'async':
+            _cancel_requests.discard(task_id)
+        # The process watching the container only sees the kill; it keeps this status (see _cancelled_elsewhere)
+        DatabaseOperations.update_task(task_id, user_id, {
+            'status': 'cancelled',
+            'error': 'Task was cancelled'
+        })
+    
+    # Free the slot now instead of after log collection; the handler's own release is then a no-op
+    get_docker_pool().release(host.name, task_id)
+    return 'killed'
 
-def run_ai_code_task_v2(task_id: int, user_id: str, github_token: str):
-    """Run Claude Code automation in a container - Supabase version"""
+def _cancel_requested(task_id: int) -> bool:
+    return task_id in _cancel_requests
+
+def _killed_without_cancel(exit_info: dict) -> bool:
+    """A failed exit this process did not cancel; the cancel may have reached another process,
+    which kills the container directly and marks the task cancelled"""
+    return exit_info['exit_code'] != 0 and not exit_info.get('cancelled')
+
+def _cancelled_elsewhere(stored: dict) -> bool:
+    return bool(stored) and stored.get('status') == 'cancelled'
+
+def run_ai_code_task_v2(task_id: int, user_id: str, github_token: str, host=None, placement: dict = None, resources: dict = None):
+    """Run Claude Code automation in a container - Supabase version.
+    
+    ``host`` is a slot already reserved on a Docker host (by the scheduler),
+    ``placement`` the scheduler's placement decision and ``resources`` the
+    memory/CPU limits admitted on that host; the slot is released here
+    unless the container was handed to the completion monitor.
+    Returns True once the container is running under the monitor.
+    """
+    if EXECUTION_ENGINE == 'async':
+        # Thin adapter: the asyncio engine owns the whole pipeline
+        from .async_engine import get_async_engine
+        return get_async_engine().run(task_id, user_id, github_token)
+    
     try:
         # Get task from database to check the model type
         task = DatabaseOperations.get_task_by_id(task_id, user_id)
         if not task:
             logger.error(f"Task {task_id} not found in database")
-            return
+            _release_host(host, task_id)
+            return False
         
         model_cli = task.get('agent', 'claude')
         
@@ -82,13 +291,15 @@ def run_ai_code_task_v2(task_id: int, user_id: str, github_token: str):
                 'status': 'failed',
                 'error': f'Unsupported model: {model_cli}. Only Claude is supported.'
             })
-            return
+            _release_host(host, task_id)
+            return False
         
         logger.info(f"🚀 Running Claude Code task {task_id}")
-        return _run_ai_code_task_v2_internal(task_id, user_id, github_token)
+        return _run_ai_code_task_v2_internal(task_id, user_id, github_token, host, placement, resources)
             
     except Exception as e:
         logger.error(f"💥 Exception in run_ai_code_task_v2: {str(e)}")
+        _release_host(host, task_id)
         try:
             DatabaseOperations.update_task(task_id, user_id, {
                 'status': 'failed',
@@ -97,31 +308,252 @@ def run_ai_code_task_v2(task_id: int, user_id: str, github_token: str):
         except:
             logger.error(f"Failed to update task {task_id} status after exception")
 
-def _run_ai_code_task_v2_internal(task_id: int, user_id: str, github_token: str):
+def _get_task_prompt(task: dict) -> str:
+    """Get the first user prompt from the task's chat messages"""
+    if task.get('chat_messages'):
+        for msg in task['chat_messages']:
+            if msg.get('role') == 'user':
+                return msg.get('content', '')
+    return ""
+
+def _build_container_kwargs(task_id: int, user_id: str, task: dict, prompt: str, user_preferences: dict, github_token: str, resources: dict = None) -> dict:
+    """Build the docker-py ``containers.run`` arguments (runner environment, limits) for a task"""
+    resources = resources or build_resource_profile([])
+    
+    # Create container environment variables
+    env_vars = {
+        'CI': 'true',  # Indicate we're in CI/non-interactive environment
+        'TERM': 'dumb',  # Use dumb terminal to avoid interactive features
+        'NO_COLOR': '1',  # Disable colors for cleaner output
+        'FORCE_COLOR': '0',  # Disable colors for cleaner output
+        'NONINTERACTIVE': '1',  # Common flag for non-interactive mode
+        'DEBIAN_FRONTEND': 'noninteractive',  # Non-interactive package installs
+        **container_env(),  # TRACEPARENT, so tooling in the container can join the task's trace
+    }
+    
+    if user_preferences:
+        logger.info(f"🔧 Found user preferences for Claude: {list(user_preferences.keys())}")
+    
+    # Start with default Claude environment
+    claude_env = {
+        'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY'),
+        'ANTHROPIC_NONINTERACTIVE': '1'  # Custom flag for Anthropic tools
+    }
+    # Merge with user's custom Claude environment variables
+    claude_config = user_preferences.get('claudeCode', {})
+    if claude_config and claude_config.get('env'):
+        claude_env.update(claude_config['env'])
+    env_vars.update(claude_env)
+    
+    # Load Claude credentials from user preferences in Supabase
+    credentials_content = ""
+    credentials_json = claude_config.get('credentials') if claude_config else None
+    
+    # Check if credentials is meaningful (not empty object, null, undefined, or empty string)
+    if isinstance(credentials_json, dict) and len(credentials_json) > 0:
+        try:
+            credentials_content = json.dumps(credentials_json)
+            logger.info(f"📋 Loaded Claude credentials from user preferences ({len(credentials_content)} characters) for task {task_id}")
+        except Exception as e:
+            logger.error(f"❌ Failed to process Claude credentials from user preferences: {e}")
+            credentials_content = ""
+    else:
+        logger.info(f"ℹ️  No Claude credentials in user preferences for task {task_id} - skipping credentials setup")
+    
+    # The task itself, for the runner baked into the image (task-runner.sh)
+    env_vars.update({
+        'TASK_RUNNER_VERSION': TASK_RUNNER_VERSION,
+        'TASK_REPO_URL': task['repo_url'],
+        'TASK_GITHUB_TOKEN': github_token or '',
+        'TASK_BRANCH': task['target_branch'],
+        'TASK_PROMPT': prompt,
+        'TASK_CLAUDE_CREDENTIALS': credentials_content,
+        'TASK_REPO_CACHE': '1' if REPO_CACHE_ENABLED else '0',
+        'TASK_SNAPSHOT_MAX_BYTES': str(SNAPSHOT_MAX_BYTES),
+        'TASK_RUNNER_DEBUG': '1' if TASK_RUNNER_DEBUG else '0',
+    })
+    
+    # Configure Docker security options
+    container_kwargs = {
+        'image': TASK_IMAGE,
+        'command': [TASK_RUNNER],
+        'environment': env_vars,
+        'detach': True,
+        'remove': False,  # Don't auto-remove so we can get logs
+        'working_dir': '/workspace',
+        'network_mode': 'bridge',  # Ensure proper networking
+        'tty': False,  # Don't allocate TTY - may prevent clean exit
+        'stdin_open': False,  # Don't keep stdin open - may prevent clean exit
+        'name': f'claude-code-task-{task_id}-{int(time.time())}-{uuid.uuid4().hex[:8]}',  # Highly unique container name with UUID
+        'mem_limit': resources['memory_bytes'],  # Sized from the project's resource profile
+        'nano_cpus': int(resources['cpus'] * 1e9),  # Hard CPU limit matching the host reservation
+        'cpu_shares': 1024,  # Standard CPU allocation
+        'ulimits': [docker.types.Ulimit(name='nofile', soft=1024, hard=2048)],  # File descriptor limits
+        'labels': {
+            TASK_CONTAINER_LABEL: 'true',  # Lets the completion monitor filter Docker events
+            f'{TASK_CONTAINER_LABEL}.task-id': str(task_id),
+            f'{TASK_CONTAINER_LABEL}.user-id': str(user_id)
+        }
+    }
+    
+    if resources.get('cpuset'):
+        container_kwargs['cpuset_cpus'] = resources['cpuset']
+    
+    if REPO_CACHE_ENABLED:
+        # Same volume name on every host; Docker creates it on first use
+        container_kwargs['volumes'] = {repo_cache_volume(task['repo_url']): {'bind': '/cache', 'mode': 'rw'}}
+    
+    return container_kwargs
+
+def _build_exit_updates(exit_info: dict, logs: str, memory_limit: str = None) -> dict:
+    """Translate a container exit and its logs into the task row updates, with the phase timeline"""
+    updates = _exit_status_updates(exit_info, logs, memory_limit)
+    timeline = parse_timeline(logs)
+    if timeline:
+        updates['execution_metadata']['timeline'] = timeline
+    agent = parse_agent_stream(logs)
+    if agent:
+        updates['execution_metadata']['agent'] = agent
+    return updates
+
+def _observe_phase_durations(updates: dict, exit_info: dict):
+    """Feed the task's phase durations to /metrics, preferring the in-container timeline"""
+    timeline = updates['execution_metadata'].get('timeline')
+    phases = timeline_durations(timeline) if timeline else exit_info.get('phases', {})
+    for phase, seconds in phases.items():
+        PHASE_DURATION.labels(phase).observe(seconds)
+
+def _observe_agent_usage(updates: dict, task_id: int = None):
+    """Feed the agent's turns, tool calls, tokens and cost to /metrics, and its tokens to the owner's quota"""
+    agent = updates['execution_metadata'].get('agent')
+    if not agent:
+        return
+    if task_id is not None:
+        get_quota_manager().record_agent_usage(task_id, agent)
+    AGENT_TURNS.observe(agent['turns'])
+    for turn in agent['turn_log']:
+        if turn['seconds'] is not None:
+            AGENT_TURN_LATENCY.observe(turn['seconds'])
+    for tool, count in agent['tool_calls'].items():
+        AGENT_TOOL_CALLS.labels(tool).inc(count)
+    for kind, count in agent['tokens'].items():
+        AGENT_TOKENS.labels(kind).inc(count)
+    if agent.get('cost_usd'):
+        AGENT_COST.inc(agent['cost_usd'])
+
+def _exit_status_updates(exit_info: dict, logs: str, memory_limit: str = None) -> dict:
+    exit_code = exit_info['exit_code']
+    
+    if exit_info.get('cancelled'):
+        logger.info(f"🛑 Container was cancelled - keeping {min(len(logs), PARTIAL_OUTPUT_CHARS)} characters of partial output")
+        return {
+            'status': 'cancelled',
+            'error': 'Task was cancelled',
+            'execution_metadata': {
+                'exit_code': exit_code,
+                'exit_reason': 'cancelled',
+                'partial_output': logs[-PARTIAL_OUTPUT_CHARS:]
+            }
+        }
+    
+    if exit_info['oom_killed']:
+        memory_limit = memory_limit or format_bytes(build_resource_profile([])['memory_bytes'])
+        logger.error(f"💥 Container was OOM-killed (memory limit {memory_limit})")
+        return {
+            'status': 'failed',
+            'error': f"Container was killed after exceeding its memory limit ({memory_limit}): {logs[-2000:]}",
+            'execution_metadata': {
+                'exit_code': exit_code,
+                'exit_reason': 'oom_killed'
+            }
+        }
+    
+    if exit_info['timed_out']:
+        fired = exit_info.get('watchdog') or {
+            'deadline': 'total',
+            'phase': None,
+            'limit_seconds': CONTAINER_TIMEOUT_SECONDS
+        }
+        reason = describe_deadline(fired)
+        logger.error(f"⏰ Container {reason}")
+        return {
+            'status': 'failed',
+            'error': f"Container was stopped because it {reason}: {logs[-2000:]}",
+            'execution_metadata': {
+                'exit_code': exit_code,
+                'exit_reason': 'stalled' if fired['deadline'] == 'inactivity' else 'timeout',
+                'watchdog': fired
+            }
+        }
+    
+    if exit_code != 0:
+        logger.error(f"❌ Container exited with error code {exit_code}")
+        return {
+            'status': 'failed',
+            'error': f"Container exited with code {exit_code}: {logs}",
+            'execution_metadata': {
+                'exit_code': exit_code,
+                'exit_reason': 'error'
+            }
+        }
+    
+    logger.info(f"✅ Container exited successfully (code 0) - parsing results...")
+    LOG_BYTES_PARSED.inc(len(logs))
+    results = parse_container_output(logs)
+    logger.info(f"🔄 Updating task status to COMPLETED... (diff lines: {results['diff_lines']})")
+    
+    return {
+        'status': 'completed',
+        'commit_hash': results['commit_hash'],
+        'git_diff': results['git_diff'],
+        'git_patch': results['git_patch'],
+        'changed_files': results['changed_files'],
+        'execution_metadata': {
+            'file_changes': store_file_changes(results['file_changes'], results['git_diff']),
+            'completed_at': datetime.now().isoformat()
+        }
+    }
+
+def _run_ai_code_task_v2_internal(task_id: int, user_id: str, github_token: str, host=None, placement: dict = None, resources: dict = None):
     """Internal implementation of Claude Code automation"""
+    if resources is None:
+        resources = build_resource_profile([])
+    if host is None:
+        host = _wait_for_host(task_id)
+        placement = {'strategy': 'least_loaded', 'warm': False, 'host': host.name}
+    handed_off = False
+    task = None
     try:
         # Clean up any orphaned containers before starting new task
-        cleanup_orphaned_containers()
+        cleanup_orphaned_containers(host)
         
         # Get task from database (v2 function)
         task = DatabaseOperations.get_task_by_id(task_id, user_id)
         if not task:
             logger.error(f"Task {task_id} not found in database")
-            return
+            return False
+        
+        if task.get('status') == 'cancelled':
+            logger.info(f"🛑 Task {task_id} was cancelled while queued - skipping")
+            _cancel_requests.discard(task_id)
+            return False
+        
+        if not leases.owns(task):
+            # Our lease lapsed while the task was queued and another executor took it over
+            logger.warning(f"⚠️  Task {task_id} is now owned by executor {task['executor_id']} - skipping")
+            return False
         
-        # Update task status to running
-        DatabaseOperations.update_task(task_id, user_id, {'status': 'running'})
+        # Update task status to running, unless it was cancelled since it was read
+        if not DatabaseOperations.mark_task_running(task_id, user_id):
+            logger.info(f"🛑 Task {task_id} is no longer pending - skipping")
+            _cancel_requests.discard(task_id)
+            return False
         
         model_name = task.get('agent', 'claude').upper()
         logger.info(f"🚀 Starting {model_name} Code task {task_id}")
         
         # Get prompt from chat messages
-        prompt = ""
-        if task.get('chat_messages'):
-            for msg in task['chat_messages']:
-                if msg.get('role') == 'user':
-                    prompt = msg.get('content', '')
-                    break
+        prompt = _get_task_prompt(task)
         
         if not prompt:
             error_msg = "No user prompt found in chat messages"
@@ -130,337 +562,32 @@ def _run_ai_code_task_v2_internal(task_id: int, user_id: str, github_token: str)
                 'status': 'failed',
                 'error': error_msg
             })
-            return
+            return False
         
         logger.info(f"📋 Task details: prompt='{prompt[:50]}...', repo={task['repo_url']}, branch={task['target_branch']}, model={model_name}")
         logger.info(f"Starting {model_name} task {task_id}")
         
-        # Escape special characters in prompt for shell safety
-        escaped_prompt = prompt.replace('"', '\\"').replace('$', '\\$').replace('`', '\\`')
-        
-        # Create container environment variables
-        env_vars = {
-            'CI': 'true',  # Indicate we're in CI/non-interactive environment
-            'TERM': 'dumb',  # Use dumb terminal to avoid interactive features
-            'NO_COLOR': '1',  # Disable colors for cleaner output
-            'FORCE_COLOR': '0',  # Disable colors for cleaner output
-            'NONINTERACTIVE': '1',  # Common flag for non-interactive mode
-            'DEBIAN_FRONTEND': 'noninteractive',  # Non-interactive package installs
-        }
-        
-        # Add Claude-specific API keys and environment variables
-        model_cli = task.get('agent', 'claude')
-        
         # Get user preferences for custom environment variables
         user = DatabaseOperations.get_user_by_id(user_id)
         user_preferences = user.get('preferences', {}) if user else {}
         
-        if user_preferences:
-            logger.info(f"🔧 Found user preferences for Claude: {list(user_preferences.keys())}")
-        
-        # Start with default Claude environment
-        claude_env = {
-            'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY'),
-            'ANTHROPIC_NONINTERACTIVE': '1'  # Custom flag for Anthropic tools
-        }
-        # Merge with user's custom Claude environment variables
-        claude_config = user_preferences.get('claudeCode', {})
-        if claude_config and claude_config.get('env'):
-            claude_env.update(claude_config['env'])
-        env_vars.update(claude_env)
-        print(env_vars)
-        # Use Claude Code container image
-        container_image = 'claude-code-automation:latest'
-        
-        
-        # Load Claude credentials from user preferences in Supabase
-        credentials_content = ""
-        escaped_credentials = ""
-        logger.info(f"🔍 Looking for Claude credentials in user preferences for task {task_id}")
-        
-        # Check if user has Claude credentials in their preferences
-        claude_config = user_preferences.get('claudeCode', {})
-        credentials_json = claude_config.get('credentials') if claude_config else None
-        
-        # Check if credentials is meaningful (not empty object, null, undefined, or empty string)
-        has_meaningful_credentials = (
-            credentials_json is not None and 
-            credentials_json != {} and 
-            credentials_json != "" and
-            (isinstance(credentials_json, dict) and len(credentials_json) > 0)
-        )
-        
-        if has_meaningful_credentials:
-            try:
-                # Convert JSON object to string for writing to container
-                credentials_content = json.dumps(credentials_json)
-                logger.info(f"📋 Successfully loaded Claude credentials from user preferences and stringified ({len(credentials_content)} characters) for task {task_id}")
-                # Escape credentials content for shell
-                escaped_credentials = credentials_content.replace("'", "'\"'\"'").replace('\n', '\\n')
-                logger.info(f"📋 Credentials content escaped for shell injection")
-            except Exception as e:
-                logger.error(f"❌ Failed to process Claude credentials from user preferences: {e}")
-                credentials_content = ""
-                escaped_credentials = ""
-        else:
-            logger.info(f"ℹ️  No meaningful Claude credentials found in user preferences for task {task_id} - skipping credentials setup (credentials: {credentials_json})")
+        # Deadlines may be tuned per project
+        project = DatabaseOperations.get_project_by_id(task['project_id'], user_id) if task.get('project_id') else None
+        limits = watchdog_limits(project.get('settings') if project else None)
         
-        # 打印 Claude 相关环境变量（只显示 key 是否存在和长度，不打印具体 key）
-        safe_env_vars = {k: (v[:5] + '...' if v and len(v) > 8 else v) if 'KEY' in k or 'TOKEN' in k else v for k, v in env_vars.items()}
-        logger.info(f"[调试] Claude 相关 env_vars: {safe_env_vars}")
-        logger.info(f"[调试] Claude prompt: {prompt}")
+        container_kwargs = _build_container_kwargs(task_id, user_id, task, prompt, user_preferences, github_token, resources)
         
-        # Create the command to run in container (v2 function)
-        repo_url = task['repo_url']
-        if github_token:
-            # 替换 https://github.com/owner/repo.git 为 https://<token>@github.com/owner/repo.git
-            repo_url = repo_url.replace('https://github.com/', f'https://{github_token}@github.com/')
-        
-        container_command = f'''
-echo "===== [调试] 容器启动，打印全部环境变量 ====="
-env
-echo "===== [调试] 当前目录内容 ====="
-ls -alh
-echo "===== [调试] ANTHROPIC_API_KEY 长度: $(echo -n $ANTHROPIC_API_KEY | wc -c) ====="
-echo "===== [调试] ANTHROPIC_BASE_URL: $ANTHROPIC_BASE_URL ====="
-echo "===== [调试] ANTHROPIC_BASE_URL 长度: $(echo -n $ANTHROPIC_BASE_URL | wc -c) ====="
-set -e
-echo "Setting up repository..."
-
-# Clone repository
-git clone -b {task['target_branch']} {repo_url} /workspace/repo
-cd /workspace/repo
-
-# Configure git
-git config user.email "claude-code@automation.com"
-git config user.name "Claude Code Automation"
-
-# We'll extract the patch instead of pushing directly
-echo "📋 Will extract changes as patch for later PR creation..."
-
-echo "Starting Claude Code with prompt..."
-
-# Create a temporary file with the prompt using heredoc for proper handling
-cat << 'PROMPT_EOF' > /tmp/prompt.txt
-{prompt}
-PROMPT_EOF
-
-# Setup Claude credentials
-echo "Setting up Claude credentials..."
-
-# Create ~/.claude directory if it doesn't exist
-mkdir -p ~/.claude
-
-# Write credentials content directly to file
-if [ ! -z '{escaped_credentials}' ]; then
-    echo "📋 Writing credentials to ~/.claude/.credentials.json"
-    cat << 'CREDENTIALS_EOF' > ~/.claude/.credentials.json
-{credentials_content}
-CREDENTIALS_EOF
-    echo "✅ Claude credentials configured"
-else
-    echo "⚠️  No credentials content available"
-fi
-
-echo "Using Claude CLI..."
-
-# Try different ways to invoke claude
-echo "Checking claude installation..."
-
-if [ -f /usr/local/bin/claude ]; then
-    echo "Found claude at /usr/local/bin/claude"
-    echo "File type:"
-    file /usr/local/bin/claude || echo "file command not available"
-    echo "First few lines:"
-    head -5 /usr/local/bin/claude || echo "head command failed"
-    
-    # Check if it's a shell script
-    if head -1 /usr/local/bin/claude | grep -q "#!/bin/sh\|#!/bin/bash\|#!/usr/bin/env bash"; then
-        echo "Detected shell script, running with sh..."
-        sh /usr/local/bin/claude < /tmp/prompt.txt
-    # Check if it's a Node.js script (including env -S node pattern)
-    elif head -1 /usr/local/bin/claude | grep -q "#!/usr/bin/env.*node\|#!/usr/bin/node"; then
-        echo "Detected Node.js script..."
-        if command -v node >/dev/null 2>&1; then
-            echo "Running with node..."
-            # Try different approaches for Claude CLI
-            
-            # First try with --help to see available options
-            echo "Checking claude options..."
-            node /usr/local/bin/claude --help 2>/dev/null || echo "Help not available"
-            
-            # Try non-interactive approaches
-            echo "Attempting non-interactive execution..."
-            
-            # Method 1: Use the official --print flag for non-interactive mode
-            echo "Using --print flag for non-interactive mode..."
-            cat /tmp/prompt.txt | node /usr/local/bin/claude --print --allowedTools "Edit,Bash" --debug 2>&1
-            CLAUDE_EXIT_CODE=$?
-            echo "Claude Code finished with exit code: $CLAUDE_EXIT_CODE"
-            
-            if [ $CLAUDE_EXIT_CODE -ne 0 ]; then
-                echo "ERROR: Claude Code failed with exit code $CLAUDE_EXIT_CODE"
-                exit $CLAUDE_EXIT_CODE
-            fi
-            
-            echo "===== [调试] Claude CLI 执行后 ====="
-            echo "✅ Claude Code completed successfully"
-        else
-            echo "Node.js not found, trying direct execution..."
-            /usr/local/bin/claude < /tmp/prompt.txt
-            CLAUDE_EXIT_CODE=$?
-            echo "Claude Code finished with exit code: $CLAUDE_EXIT_CODE"
-            if [ $CLAUDE_EXIT_CODE -ne 0 ]; then
-                echo "ERROR: Claude Code failed with exit code $CLAUDE_EXIT_CODE"
-                exit $CLAUDE_EXIT_CODE
-            fi
-            echo "✅ Claude Code completed successfully"
-        fi
-    # Check if it's a Python script
-    elif head -1 /usr/local/bin/claude | grep -q "#!/usr/bin/env python\|#!/usr/bin/python"; then
-        echo "Detected Python script..."
-        if command -v python3 >/dev/null 2>&1; then
-            echo "Running with python3..."
-            python3 /usr/local/bin/claude < /tmp/prompt.txt
-            CLAUDE_EXIT_CODE=$?
-        elif command -v python >/dev/null 2>&1; then
-            echo "Running with python..."
-            python /usr/local/bin/claude < /tmp/prompt.txt
-            CLAUDE_EXIT_CODE=$?
-        else
-            echo "Python not found, trying direct execution..."
-            /usr/local/bin/claude < /tmp/prompt.txt
-            CLAUDE_EXIT_CODE=$?
-        fi
-        echo "Claude Code finished with exit code: $CLAUDE_EXIT_CODE"
-        if [ $CLAUDE_EXIT_CODE -ne 0 ]; then
-            echo "ERROR: Claude Code failed with exit code $CLAUDE_EXIT_CODE"
-            exit $CLAUDE_EXIT_CODE
-        fi
-        echo "✅ Claude Code completed successfully"
-    else
-        echo "Unknown script type, trying direct execution..."
-        /usr/local/bin/claude < /tmp/prompt.txt
-        CLAUDE_EXIT_CODE=$?
-        echo "Claude Code finished with exit code: $CLAUDE_EXIT_CODE"
-        if [ $CLAUDE_EXIT_CODE -ne 0 ]; then
-            echo "ERROR: Claude Code failed with exit code $CLAUDE_EXIT_CODE"
-            exit $CLAUDE_EXIT_CODE
-        fi
-        echo "✅ Claude Code completed successfully"
-    fi
-elif command -v claude >/dev/null 2>&1; then
-    echo "Using claude from PATH..."
-    CLAUDE_PATH=$(which claude)
-    echo "Claude found at: $CLAUDE_PATH"
-    claude < /tmp/prompt.txt
-    CLAUDE_EXIT_CODE=$?
-    echo "Claude Code finished with exit code: $CLAUDE_EXIT_CODE"
-    if [ $CLAUDE_EXIT_CODE -ne 0 ]; then
-        echo "ERROR: Claude Code failed with exit code $CLAUDE_EXIT_CODE"
-        exit $CLAUDE_EXIT_CODE
-    fi
-    echo "✅ Claude Code completed successfully"
-else
-    echo "ERROR: claude command not found anywhere"
-    echo "Checking available interpreters:"
-    which python3 2>/dev/null && echo "python3: available" || echo "python3: not found"
-    which python 2>/dev/null && echo "python: available" || echo "python: not found"
-    which node 2>/dev/null && echo "node: available" || echo "node: not found"
-    which sh 2>/dev/null && echo "sh: available" || echo "sh: not found"
-    exit 1
-fi  # End of Claude CLI setup
-
-# Check if there are changes
-if git diff --quiet; then
-    echo "ℹ️  No changes made by Claude - this is a valid outcome"
-    echo "The AI tool ran successfully but decided not to make changes"
-    
-    # Create empty patch and diff for consistency
-    echo "=== PATCH START ==="
-    echo "No changes were made"
-    echo "=== PATCH END ==="
-    
-    echo "=== GIT DIFF START ==="
-    echo "No changes were made"
-    echo "=== GIT DIFF END ==="
-    
-    echo "=== CHANGED FILES START ==="
-    echo "No files were changed"
-    echo "=== CHANGED FILES END ==="
-    
-    echo "=== FILE CHANGES START ==="
-    echo "No file changes to display"
-    echo "=== FILE CHANGES END ==="
-    
-    # Set empty commit hash
-    echo "COMMIT_HASH="
-else
-    # Commit changes locally
-    git add .
-    git commit -m "Claude: {escaped_prompt[:100]}"
-
-    # Get commit info
-    COMMIT_HASH=$(git rev-parse HEAD)
-    echo "COMMIT_HASH=$COMMIT_HASH"
-
-    # Generate patch file for later application
-    echo "📦 Generating patch file..."
-    git format-patch HEAD~1 --stdout > /tmp/changes.patch
-    echo "=== PATCH START ==="
-    cat /tmp/changes.patch
-    echo "=== PATCH END ==="
-
-    # Also get the diff for display
-    echo "=== GIT DIFF START ==="
-    git diff HEAD~1 HEAD
-    echo "=== GIT DIFF END ==="
-
-    # List changed files for reference
-    echo "=== CHANGED FILES START ==="
-    git diff --name-only HEAD~1 HEAD
-    echo "=== CHANGED FILES END ==="
-
-    # Get before/after content for merge view
-    echo "=== FILE CHANGES START ==="
-    for file in $(git diff --name-only HEAD~1 HEAD); do
-        echo "FILE: $file"
-        echo "=== BEFORE START ==="
-        git show HEAD~1:"$file" 2>/dev/null || echo "FILE_NOT_EXISTS"
-        echo "=== BEFORE END ==="
-        echo "=== AFTER START ==="
-        cat "$file" 2>/dev/null || echo "FILE_DELETED"
-        echo "=== AFTER END ==="
-        echo "=== FILE END ==="
-    done
-    echo "=== FILE CHANGES END ==="
-fi
-
-# Explicitly exit with success code
-echo "Container work completed successfully"
-exit 0
-'''
+        if _cancel_requested(task_id):
+            logger.info(f"🛑 Task {task_id} was cancelled before its container started")
+            _cancel_requests.discard(task_id)
+            DatabaseOperations.update_task(task_id, user_id, {
+                'status': 'cancelled',
+                'error': 'Task was cancelled before its container started'
+            })
+            return False
         
         # Run container with unified AI Code tools (supports both Claude and Codex)
-        logger.info(f"🐳 Creating Docker container for task {task_id} using {container_image} (model: {model_name})")
-        
-        # Configure Docker security options
-        container_kwargs = {
-            'image': container_image,
-            'command': ['bash', '-c', container_command],
-            'environment': env_vars,
-            'detach': True,
-            'remove': False,  # Don't auto-remove so we can get logs
-            'working_dir': '/workspace',
-            'network_mode': 'bridge',  # Ensure proper networking
-            'tty': False,  # Don't allocate TTY - may prevent clean exit
-            'stdin_open': False,  # Don't keep stdin open - may prevent clean exit
-            'name': f'claude-code-task-{task_id}-{int(time.time())}-{uuid.uuid4().hex[:8]}',  # Highly unique container name with UUID
-            'mem_limit': '2g',  # Limit memory usage to prevent resource conflicts
-            'cpu_shares': 1024,  # Standard CPU allocation
-            'ulimits': [docker.types.Ulimit(name='nofile', soft=1024, hard=2048)]  # File descriptor limits
-        }
-        
+        logger.info(f"🐳 Creating Docker container for task {task_id} on host '{host.name}' using {container_kwargs['image']} (model: {model_name}, memory: {format_bytes(resources['memory_bytes'])}, cpus: {resources['cpus']}{', cpuset: ' + resources['cpuset'] if resources.get('cpuset') else ''})")
         
         # Retry container creation with enhanced conflict handling
         container = None
@@ -468,7 +595,7 @@ exit 0
         for attempt in range(max_retries):
             try:
                 logger.info(f"🔄 Container creation attempt {attempt + 1}/{max_retries}")
-                container = docker_client.containers.run(**container_kwargs)
+                container = _create_and_start_container(host, container_kwargs)
                 logger.info(f"✅ Container created successfully: {container.id[:12]} (name: {container_kwargs['name']})")
                 break
             except docker.errors.APIError as e:
@@ -480,7 +607,7 @@ exit 0
                     container_kwargs['name'] = new_name
                     logger.info(f"🆔 New container name: {new_name}")
                     # Try to clean up any conflicting containers
-                    cleanup_orphaned_containers()
+                    cleanup_orphaned_containers(host)
                 else:
                     logger.warning(f"⚠️  Docker API error on attempt {attempt + 1}: {e}")
                     if attempt == max_retries - 1:
@@ -492,203 +619,136 @@ exit 0
                     raise
                 time.sleep(2 ** attempt)  # Exponential backoff
         
-        # Update task with container ID (v2 function)
-        DatabaseOperations.update_task(task_id, user_id, {'container_id': container.id})
+        # Update task with container ID and the host it runs on (v2 function)
+        updated = DatabaseOperations.update_task(task_id, user_id, {
+            'container_id': container.id,
+            'docker_host': host.name
+        })
+        if updated and updated.get('status') == 'cancelled':
+            # Cancelled through another process (an API process in queue mode) during dispatch
+            _cancel_requests.add(task_id)
+        
+        # Record peak memory/CPU on the monitor's sweeps to refine the project's resource profile
+        sampler = ResourceSampler(container)
+        
+        # Hand the container to the host's completion monitor instead of blocking this thread in container.wait()
+        logger.info(f"⏳ Handing container {container.id[:12]} to completion monitor on '{host.name}' (limits: {limits})...")
+        container_span = start_span('task.container', task_id=task_id, host=host.name, container_id=container.id[:12])
+        host.monitor.watch(
+            container,
+            functools.partial(_handle_container_exit, task_id, user_id, model_name, host.name, task['repo_url'], placement, resources, sampler, trace_span=container_span),
+            watchdog=Watchdog(limits),
+            sampler=sampler
+        )
+        handed_off = True
         
-        logger.info(f"⏳ Waiting for container to complete (timeout: 300s)...")
+        if _cancel_requested(task_id):
+            # Cancelled while the container was being created
+            host.monitor.cancel(container.id)
+            get_docker_pool().release(host.name, task_id)
+        return True
+            
+    except Exception as e:
+        model_name = task.get('agent', 'claude').upper() if task else 'UNKNOWN'
+        logger.error(f"💥 Unexpected exception in {model_name} task {task_id}: {str(e)}")
         
-        # Wait for container to finish - should exit naturally when script completes
         try:
-            logger.info(f"🔄 Waiting for container script to complete naturally...")
-            
-            # Check initial container state
-            container.reload()
-            logger.info(f"🔍 Container initial state: {container.status}")
-            
-            # Use standard wait - container should exit when bash script finishes
-            logger.info(f"🔄 Calling container.wait() - container should exit when script completes...")
-            result = container.wait(timeout=1800)  # 30 minute timeout
-            logger.info(f"🎯 Container exited naturally! Exit code: {result['StatusCode']}")
-            
-            # Verify final container state
-            container.reload()
-            logger.info(f"🔍 Final container state: {container.status}")
-            
-            # Get logs before any cleanup operations
-            logger.info(f"📜 Retrieving container logs...")
-            try:
-                logs = container.logs().decode('utf-8')
-                logger.info(f"📝 Retrieved {len(logs)} characters of logs")
-                logger.info(f"🔍 First 200 chars of logs: {logs[:200]}...")
-            except Exception as log_error:
-                logger.warning(f"❌ Failed to get container logs: {log_error}")
-                logs = f"Failed to retrieve logs: {log_error}"
-            
-            # Clean up container after getting logs
-            try:
-                container.reload()  # Refresh container state
-                container.remove()
-                logger.info(f"🧹 Successfully removed container {container.id[:12]}")
-            except docker.errors.NotFound:
-                logger.info(f"🧹 Container {container.id[:12]} already removed")
-            except Exception as cleanup_error:
-                logger.warning(f"⚠️  Failed to remove container {container.id[:12]}: {cleanup_error}")
-                # Try force removal as fallback
-                try:
-                    container.remove(force=True)
-                    logger.info(f"🧹 Force removed container {container.id[:12]}")
-                except docker.errors.NotFound:
-                    logger.info(f"🧹 Container {container.id[:12]} already removed")
-                except Exception as force_cleanup_error:
-                    logger.error(f"❌ Failed to force remove container {container.id[:12]}: {force_cleanup_error}")
-                
-        except Exception as e:
-            logger.error(f"⏰ Container timeout or error: {str(e)}")
-            logger.error(f"🔄 Updating task status to FAILED due to timeout/error...")
-            
             DatabaseOperations.update_task(task_id, user_id, {
                 'status': 'failed',
-                'error': f"Container execution timeout or error: {str(e)}"
+                'error': str(e)
             })
-            
-            # Try to get logs even on error
-            try:
+        except:
+            logger.error(f"Failed to update task {task_id} status after exception")
+        
+        logger.error(f"🔄 {model_name} Task {task_id} failed with exception: {str(e)}")
+        return False
+    
+    finally:
+        # The slot stays reserved while the completion monitor owns the container
+        if not handed_off:
+            get_docker_pool().release(host.name, task_id)
+
+def _create_and_start_container(host, container_kwargs: dict):
+    """Create and start a task container (what ``containers.run`` does), timing both steps"""
+    create_kwargs = {key: value for key, value in container_kwargs.items() if key not in ['detach', 'remove']}
+    started_at = time.perf_counter()
+    with span('docker.create', host=host.name):
+        container = host.client.containers.create(**create_kwargs)
+    created_at = time.perf_counter()
+    CONTAINER_CREATE_LATENCY.labels(host.name).observe(created_at - started_at)
+    try:
+        with span('docker.start', host=host.name, container_id=container.id[:12]):
+            container.start()
+    except Exception:
+        container.remove(force=True)
+        raise
+    CONTAINER_START_LATENCY.labels(host.name).observe(time.perf_counter() - created_at)
+    return container
+
+def _handle_container_exit(task_id: int, user_id: str, model_name: str, host_name: str, repo_url: str, placement: dict, resources: dict, sampler, container, exit_info: dict, trace_span=None):
+    """Collect logs and results for a task container once the completion monitor reports its exit.
+
+    ``trace_span`` is the span opened when the container was handed off; collection
+    is traced beneath it and it is ended here.
+    """
+    error = None
+    with resume(trace_span):
+        try:
+            error = _collect_container_exit(task_id, user_id, model_name, host_name, repo_url, placement, resources, sampler, container, exit_info)
+        finally:
+            end_span(trace_span, error)
+
+def _collect_container_exit(task_id: int, user_id: str, model_name: str, host_name: str, repo_url: str, placement: dict, resources: dict, sampler, container, exit_info: dict):
+    """Store a finished container's results; returns the task error, if any"""
+    error = None
+    try:
+        usage = sampler.summary()
+        
+        # Get logs before any cleanup operations
+        logger.info(f"📜 Retrieving container logs for task {task_id}...")
+        try:
+            with span('docker.logs', container_id=container.id[:12]):
                 logs = container.logs().decode('utf-8')
-            except Exception as log_error:
-                logs = f"Container failed and logs unavailable: {log_error}"
-            
-            # Try to clean up container on error
-            try:
-                container.reload()  # Refresh container state
-                container.remove(force=True)
-                logger.info(f"Cleaned up failed container {container.id}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to remove failed container {container.id}: {cleanup_error}")
-            return
+            logger.info(f"📝 Retrieved {len(logs)} characters of logs")
+            logger.info(f"🔍 First 200 chars of logs: {logs[:200]}...")
+        except Exception as log_error:
+            logger.warning(f"❌ Failed to get container logs: {log_error}")
+            logs = f"Failed to retrieve logs: {log_error}"
         
-        if result['StatusCode'] == 0:
-            logger.info(f"✅ Container exited successfully (code 0) - parsing results...")
-            # Parse output to extract commit hash, diff, and patch
-            lines = logs.split('\n')
-            commit_hash = None
-            git_diff = []
-            git_patch = []
-            changed_files = []
-            file_changes = []
-            capturing_diff = False
-            capturing_patch = False
-            capturing_files = False
-            capturing_file_changes = False
-            capturing_before = False
-            capturing_after = False
-            current_file = None
-            current_before = []
-            current_after = []
-            
-            for line in lines:
-                if line.startswith('COMMIT_HASH='):
-                    commit_hash = line.split('=', 1)[1]
-                    logger.info(f"🔑 Found commit hash: {commit_hash}")
-                elif line == '=== PATCH START ===':
-                    capturing_patch = True
-                    logger.info(f"📦 Starting to capture git patch...")
-                elif line == '=== PATCH END ===':
-                    capturing_patch = False
-                    logger.info(f"📦 Finished capturing git patch ({len(git_patch)} lines)")
-                elif line == '=== GIT DIFF START ===':
-                    capturing_diff = True
-                    logger.info(f"📊 Starting to capture git diff...")
-                elif line == '=== GIT DIFF END ===':
-                    capturing_diff = False
-                    logger.info(f"📊 Finished capturing git diff ({len(git_diff)} lines)")
-                elif line == '=== CHANGED FILES START ===':
-                    capturing_files = True
-                    logger.info(f"📁 Starting to capture changed files...")
-                elif line == '=== CHANGED FILES END ===':
-                    capturing_files = False
-                    logger.info(f"📁 Finished capturing changed files ({len(changed_files)} files)")
-                elif line == '=== FILE CHANGES START ===':
-                    capturing_file_changes = True
-                    logger.info(f"🔄 Starting to capture file changes...")
-                elif line == '=== FILE CHANGES END ===':
-                    capturing_file_changes = False
-                    # Add the last file if we were processing one
-                    if current_file:
-                        file_changes.append({
-                            'filename': current_file,
-                            'before': '\n'.join(current_before),
-                            'after': '\n'.join(current_after)
-                        })
-                    logger.info(f"🔄 Finished capturing file changes ({len(file_changes)} files)")
-                elif capturing_file_changes:
-                    if line.startswith('FILE: '):
-                        # Save previous file data if exists
-                        if current_file:
-                            file_changes.append({
-                                'filename': current_file,
-                                'before': '\n'.join(current_before),
-                                'after': '\n'.join(current_after)
-                            })
-                        # Start new file
-                        current_file = line.split('FILE: ', 1)[1]
-                        current_before = []
-                        current_after = []
-                        capturing_before = False
-                        capturing_after = False
-                    elif line == '=== BEFORE START ===':
-                        capturing_before = True
-                        capturing_after = False
-                    elif line == '=== BEFORE END ===':
-                        capturing_before = False
-                    elif line == '=== AFTER START ===':
-                        capturing_after = True
-                        capturing_before = False
-                    elif line == '=== AFTER END ===':
-                        capturing_after = False
-                    elif line == '=== FILE END ===':
-                        # File processing complete
-                        pass
-                    elif capturing_before:
-                        current_before.append(line)
-                    elif capturing_after:
-                        current_after.append(line)
-                elif capturing_patch:
-                    git_patch.append(line)
-                elif capturing_diff:
-                    git_diff.append(line)
-                elif capturing_files:
-                    if line.strip():  # Only add non-empty lines
-                        changed_files.append(line.strip())
-            
-            logger.info(f"🔄 Updating task status to COMPLETED...")
-            
-            # Update task in database
-            DatabaseOperations.update_task(task_id, user_id, {
-                'status': 'completed',
-                'commit_hash': commit_hash,
-                'git_diff': '\n'.join(git_diff),
-                'git_patch': '\n'.join(git_patch),
-                'changed_files': changed_files,
-                'execution_metadata': {
-                    'file_changes': file_changes,
-                    'completed_at': datetime.now().isoformat()
-                }
-            })
-            
-            logger.info(f"🎉 {model_name} Task {task_id} completed successfully! Commit: {commit_hash[:8] if commit_hash else 'N/A'}, Diff lines: {len(git_diff)}")
-            
+        # Clean up container after getting logs
+        try:
+            container.remove(force=True)
+            logger.info(f"🧹 Successfully removed container {container.id[:12]}")
+        except docker.errors.NotFound:
+            logger.info(f"🧹 Container {container.id[:12]} already removed")
+        except Exception as cleanup_error:
+            logger.error(f"❌ Failed to remove container {container.id[:12]}: {cleanup_error}")
+        
+        if _killed_without_cancel(exit_info):
+            exit_info['cancelled'] = _cancelled_elsewhere(DatabaseOperations.get_task_version(task_id, user_id))
+        
+        with span('task.parse', log_bytes=len(logs)):
+            updates = _build_exit_updates(exit_info, logs, format_bytes(resources['memory_bytes']))
+        _observe_phase_durations(updates, exit_info)
+        _observe_agent_usage(updates, task_id)
+        _record_run_metadata(updates, exit_info, placement, resources, usage)
+        DatabaseOperations.update_task(task_id, user_id, updates)
+        
+        if updates['status'] == 'completed':
+            # The run left a mirror of the repository in this host's cache volume
+            if REPO_CACHE_ENABLED:
+                get_docker_pool().mark_warm(host_name, repo_url)
+            commit_hash = updates['commit_hash']
+            logger.info(f"🎉 {model_name} Task {task_id} completed successfully! Commit: {commit_hash[:8] if commit_hash else 'N/A'}")
+        elif updates['status'] == 'cancelled':
+            logger.info(f"🛑 {model_name} Task {task_id} was cancelled")
         else:
-            logger.error(f"❌ Container exited with error code {result['StatusCode']}")
-            DatabaseOperations.update_task(task_id, user_id, {
-                'status': 'failed',
-                'error': f"Container exited with code {result['StatusCode']}: {logs}"
-            })
-            logger.error(f"💥 {model_name} Task {task_id} failed: {logs[:200]}...")
+            logger.error(f"💥 {model_name} Task {task_id} failed: {updates['error'][:200]}...")
+            error = updates['error']
             
     except Exception as e:
-        model_name = task.get('agent', 'claude').upper() if task else 'UNKNOWN'
-        logger.error(f"💥 Unexpected exception in {model_name} task {task_id}: {str(e)}")
-        
+        logger.error(f"💥 Unexpected exception collecting results for {model_name} task {task_id}: {str(e)}")
+        error = str(e)
         try:
             DatabaseOperations.update_task(task_id, user_id, {
                 'status': 'failed',
@@ -696,5 +756,65 @@ exit 0
             })
         except:
             logger.error(f"Failed to update task {task_id} status after exception")
-        
-        logger.error(f"🔄 {model_name} Task {task_id} failed with exception: {str(e)}")
+    
+    finally:
+        _cancel_requests.discard(task_id)
+        # Free the host slot and its resource reservation so the scheduler can dispatch the next queued task
+        get_docker_pool().release(host_name, task_id)
+    return error
+
+def _record_run_metadata(updates: dict, exit_info: dict, placement: dict, resources: dict, usage: dict):
+    """Add the trace, host placement and resource usage of a finished run to its task updates"""
+    trace_id = current_trace_id()
+    if trace_id:
+        updates['execution_metadata']['trace_id'] = trace_id
+    if placement:
+        updates['execution_metadata']['placement'] = placement
+    updates['execution_metadata']['resources'] = dict(usage, limits={
+        'memory_bytes': resources['memory_bytes'],
+        'cpus': resources['cpus'],
+        'cpuset': resources.get('cpuset'),
+        'source': resources.get('source')
+    })
+    if exit_info['oom_killed'] and resources.get('profile_key'):
+        # Size the next run of this project above the limit it just hit
+        get_resource_profiles().invalidate(resources['profile_key'])
+
+def _run_scheduled_task(job: dict, host):
+    # Continue the trace of the request that queued the task
+    with resume(job.get('trace_context')), span('task.run', task_id=job['task_id'], host=host.name, queue_wait_seconds=round(time.time() - job['queued_at'], 3)):
+        run_ai_code_task_v2(job['task_id'], job['user_id'], job['github_token'], host, job.get('placement'), job.get('resources'))
+
+# Executor state, built on first use so importing this module connects to nothing
+_executor = {}
+_executor_lock = threading.RLock()
+
+def get_docker_pool() -> DockerHostPool:
+    """Docker hosts that run task containers; each host has its own client and completion monitor"""
+    with _executor_lock:
+        if 'docker_pool' not in _executor:
+            pool = _executor['docker_pool'] = DockerHostPool.from_env()
+            # A task stops counting towards its owner's quotas when its host slot is freed
+            pool.add_task_release_listener(get_quota_manager().finished)
+        return _executor['docker_pool']
+
+def get_quota_manager() -> QuotaManager:
+    """Per-user and per-project quotas"""
+    with _executor_lock:
+        if 'quota_manager' not in _executor:
+            _executor['quota_manager'] = QuotaManager(DatabaseOperations)
+        return _executor['quota_manager']
+
+def get_resource_profiles() -> ResourceProfiles:
+    """Memory/CPU limits derived from the peak usage recorded for each project's recent tasks"""
+    with _executor_lock:
+        if 'resource_profiles' not in _executor:
+            _executor['resource_profiles'] = ResourceProfiles(DatabaseOperations.get_resource_history)
+        return _executor['resource_profiles']
+
+def get_task_scheduler() -> TaskScheduler:
+    """Priority queues dispatching tasks as host capacity frees up, within each owner's quotas"""
+    with _executor_lock:
+        if 'task_scheduler' not in _executor:
+            _executor['task_scheduler'] = TaskScheduler(get_docker_pool(), _run_scheduled_task, quotas=get_quota_manager())
+        return _executor['task_scheduler']
@@ -0,0 +1,303 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .watchdog import Watchdog
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Label attached to every task container so the event stream only carries our containers
+TASK_CONTAINER_LABEL = 'ai-code-task'
+
+# Exit code Docker reports for SIGKILL (OOM killer, `docker kill`, timeouts)
+SIGKILL_EXIT_CODE = 137
+
+
+class CompletionMonitor:
+    """Track task containers through a single Docker event subscription.
+
+    Instead of parking one thread in ``container.wait()`` per running task, the
+    monitor listens for ``die``/``oom`` events of labeled task containers and hands
+    result collection to a small worker pool. Every ``sweep_interval`` a sweeper
+    thread hands each container's check (a resource stats snapshot, new output
+    since its log cursor, deadlines) to a pool of ``sweep_workers`` threads and kills overdue containers,
+    which then surface through the same ``die`` event path. A container whose
+    previous check is still running is skipped, so slow log reads never queue up.
+    """
+
+    def __init__(self, client, max_workers: int = 4, sweep_interval: float = 5.0, sweep_workers: int = 8):
+        self.client = client
+        self.sweep_interval = sweep_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='completion-worker')
+        self._sweep_executor = ThreadPoolExecutor(max_workers=sweep_workers, thread_name_prefix='completion-sweep')
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopped = threading.Event()
+        self._events = None
+        self._last_event_time = None
+
+    def start(self):
+        """Start the event listener and timeout sweeper (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        threading.Thread(target=self._event_loop, name='completion-events', daemon=True).start()
+        threading.Thread(target=self._sweep_loop, name='completion-sweeper', daemon=True).start()
+        logger.info("👀 Container completion monitor started")
+
+    def stop(self):
+        """Stop listening for events and shut down the worker pool"""
+        self._stopped.set()
+        events = self._events
+        if events is not None:
+            try:
+                events.close()
+            except Exception:
+                pass
+        self._executor.shutdown(wait=False)
+        self._sweep_executor.shutdown(wait=False)
+
+    def watch(self, container, callback, timeout: float = None, watchdog: Watchdog = None, sampler=None):
+        """Register a started container; ``callback(container, exit_info)`` runs once it exits.
+
+        Deadlines come from ``watchdog``, or just ``timeout`` seconds of total runtime.
+        A ``ResourceSampler`` passed as ``sampler`` takes a stats snapshot on every sweep.
+        ``exit_info`` is a dict with ``exit_code``, ``oom_killed``, ``timed_out``,
+        ``cancelled``, ``watchdog`` (the deadline that fired, if any) and ``phases``
+        (seconds spent per phase).
+        """
+        self.start()
+        if watchdog is None and timeout:
+            watchdog = Watchdog({'total_seconds': timeout})
+        with self._lock:
+            self._watched[container.id] = {
+                'container': container,
+                'callback': callback,
+                'watchdog': watchdog,
+                'sampler': sampler,
+                'fired': None,
+                'oom_killed': False,
+                'timed_out': False,
+                'cancelled': False,
+                'checking': False,  # A sweep check is queued or running
+                'poll_lock': threading.Lock(),  # One log read (and cursor move) at a time
+            }
+        logger.info(f"👀 Watching container {container.id[:12]} for completion (limits: {watchdog.limits if watchdog else None})")
+
+        # The container may have exited before we registered it - reconcile against its current state
+        self._reconcile(container.id)
+
+    def cancel(self, container_id: str) -> bool:
+        """Kill a watched container on request; its callback then runs with ``cancelled`` set"""
+        with self._lock:
+            entry = self._watched.get(container_id)
+            if entry is None:
+                return False
+            entry['cancelled'] = True
+
+        logger.info(f"🛑 Cancelling container {container_id[:12]}")
+        try:
+            entry['container'].kill()
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to kill cancelled container {container_id[:12]}: {e}")
+            self._reconcile(container_id, force=True)
+        return True
+
+    def is_watching(self, container_id: str) -> bool:
+        with self._lock:
+            return container_id in self._watched
+
+    def watched_count(self) -> int:
+        with self._lock:
+            return len(self._watched)
+
+    def _event_loop(self):
+        """Consume the Docker event stream, reconnecting on failure"""
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                self._events = self.client.events(
+                    decode=True,
+                    since=self._last_event_time,
+                    filters={
+                        'type': 'container',
+                        'event': ['die', 'oom'],
+                        'label': TASK_CONTAINER_LABEL,
+                    }
+                )
+                # Events may have been missed while the stream was down
+                self._reconcile_all()
+                backoff = 1
+
+                for event in self._events:
+                    self._last_event_time = event.get('time', self._last_event_time)
+                    self._handle_event(event)
+
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+                logger.warning(f"⚠️  Docker event stream interrupted: {e} - reconnecting in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _handle_event(self, event):
+        container_id = event.get('id') or event.get('Actor', {}).get('ID')
+        action = event.get('Action') or event.get('status')
+
+        with self._lock:
+            entry = self._watched.get(container_id)
+            if entry is None:
+                return
+            if action == 'oom':
+                entry['oom_killed'] = True
+                logger.warning(f"💥 Container {container_id[:12]} hit its memory limit (OOM)")
+                return
+            if action != 'die':
+                return
+            del self._watched[container_id]
+
+        attributes = event.get('Actor', {}).get('Attributes', {})
+        try:
+            exit_code = int(attributes.get('exitCode', -1))
+        except (TypeError, ValueError):
+            exit_code = -1
+        self._dispatch(entry, exit_code)
+
+    def _reconcile(self, container_id: str, force: bool = False):
+        """Complete a watched container if Docker already reports it as exited.
+
+        With ``force`` a container that can no longer be inspected is completed as lost.
+        """
+        with self._lock:
+            entry = self._watched.get(container_id)
+        if entry is None:
+            return
+
+        try:
+            container = entry['container']
+            container.reload()
+            if container.status not in ['exited', 'dead']:
+                return
+            state = container.attrs.get('State', {})
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to inspect container {container_id[:12]}: {e}")
+            if not force:
+                return
+            state = {'ExitCode': -1}
+
+        with self._lock:
+            # The event loop may have completed it in the meantime
+            if self._watched.pop(container_id, None) is None:
+                return
+        if state.get('OOMKilled'):
+            entry['oom_killed'] = True
+        self._dispatch(entry, state.get('ExitCode', -1))
+
+    def _reconcile_all(self):
+        with self._lock:
+            container_ids = list(self._watched.keys())
+        for container_id in container_ids:
+            self._reconcile(container_id)
+
+    def _dispatch(self, entry, exit_code: int):
+        self._executor.submit(self._complete, entry, exit_code)
+
+    def _complete(self, entry, exit_code: int):
+        container = entry['container']
+        oom_killed = entry['oom_killed']
+
+        # A SIGKILL without a preceding oom event can still be an OOM kill - ask Docker
+        if exit_code == SIGKILL_EXIT_CODE and not oom_killed and not entry['timed_out'] and not entry['cancelled']:
+            try:
+                container.reload()
+                oom_killed = bool(container.attrs.get('State', {}).get('OOMKilled'))
+            except Exception as e:
+                logger.warning(f"⚠️  Could not inspect OOM state of {container.id[:12]}: {e}")
+
+        watchdog = entry['watchdog']
+        if watchdog and watchdog.follows_output:
+            # Catch the output written since the last sweep
+            self._poll_output(entry)
+
+        exit_info = {
+            'exit_code': exit_code,
+            'oom_killed': oom_killed,
+            'timed_out': entry['timed_out'],
+            'cancelled': entry['cancelled'],
+            'watchdog': entry['fired'],
+            'phases': watchdog.phase_durations() if watchdog else {},
+        }
+        logger.info(f"🎯 Container {container.id[:12]} exited: {exit_info}")
+
+        try:
+            entry['callback'](container, exit_info)
+        except Exception as e:
+            logger.error(f"❌ Completion handler failed for container {container.id[:12]}: {e}")
+
+    def _sweep_loop(self):
+        """Queue a check for every watched container that has none in flight"""
+        while not self._stopped.wait(self.sweep_interval):
+            with self._lock:
+                entries = [
+                    entry for entry in self._watched.values()
+                    if (entry['watchdog'] or entry['sampler']) and not entry['timed_out'] and not entry['cancelled'] and not entry['checking']
+                ]
+                for entry in entries:
+                    entry['checking'] = True
+            for entry in entries:
+                try:
+                    self._sweep_executor.submit(self._check, entry)
+                except RuntimeError:
+                    # Shut down by stop()
+                    return
+
+    def _check(self, entry):
+        """Sample a container's resources, feed its new output to its watchdog and kill it once a deadline passed"""
+        try:
+            if entry['sampler']:
+                entry['sampler'].sample()
+            watchdog = entry['watchdog']
+            if not watchdog:
+                return
+            if watchdog.follows_output:
+                self._poll_output(entry)
+            fired = watchdog.expired()
+            if not fired:
+                return
+            with self._lock:
+                if entry['timed_out'] or entry['cancelled']:
+                    return
+                entry['timed_out'] = True
+                entry['fired'] = fired
+            container = entry['container']
+            logger.warning(f"⏰ Container {container.id[:12]} hit its {fired['deadline']} deadline ({fired['limit_seconds']}s) - killing")
+            try:
+                container.kill()
+            except Exception as e:
+                logger.warning(f"⚠️  Failed to kill overdue container {container.id[:12]}: {e}")
+                # Fall back to inspecting it in case it is already gone
+                self._reconcile(container.id, force=True)
+        finally:
+            entry['checking'] = False
+
+    def _poll_output(self, entry):
+        """Feed output written since the container's log cursor to its watchdog"""
+        container = entry['container']
+        watchdog = entry['watchdog']
+        with entry['poll_lock']:
+            try:
+                kwargs = {'timestamps': True}
+                if watchdog.log_cursor:
+                    kwargs['since'] = watchdog.log_cursor
+                chunk = container.logs(**kwargs).decode('utf-8', errors='replace')
+            except Exception as e:
+                logger.warning(f"⚠️  Could not read output of container {container.id[:12]}: {e}")
+                return
+            if chunk:
+                watchdog.observe(chunk)
@@ -7,14 +7,21 @@ from datetime import datetime
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-# Docker client
-docker_client = docker.from_env()
+# Docker client, connected on first use so importing this module needs no Docker daemon
+_docker_client = None
+
+def get_docker_client() -> docker.DockerClient:
+    """Docker client for the local daemon"""
+    global _docker_client
+    if _docker_client is None:
+        _docker_client = docker.from_env()
+    return _docker_client
 
 def cleanup_orphaned_containers():
     """Clean up orphaned AI code task containers aggressively"""
     try:
         # Get all containers with our naming pattern
-        containers = docker_client.containers.list(all=True, filters={'name': 'ai-code-task-'})
+        containers = get_docker_client().containers.list(all=True, filters={'name': 'ai-code-task-'})
         orphaned_count = 0
         current_time = time.time()
         
@@ -0,0 +1,348 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from . import snapshots
+from .hunks import compute_hunks, render_hunks
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Parsed diffs of this many tasks are kept in memory, so loading a task's files one by one parses its diff once
+DIFF_CACHE_TASKS = int(os.getenv('DIFF_CACHE_TASKS', '16'))
+
+# Sentinels the task script prints instead of the content of created and deleted files
+FILE_NOT_EXISTS = 'FILE_NOT_EXISTS'
+FILE_DELETED = 'FILE_DELETED'
+
+PARTS = ('diff', 'before', 'after')
+
+DIFF_HEADER = 'diff --git '
+
+
+def _header_path(header: str) -> str:
+    """New path from a ``diff --git a/<old> b/<new>`` line (used when there are no ---/+++ lines)"""
+    paths = header[len(DIFF_HEADER):]
+    middle = paths.find(' b/', (len(paths) - 3) // 2 - 1)
+    if middle < 0:
+        middle = paths.rfind(' b/')
+    return paths[middle + 3:] if middle >= 0 else paths
+
+
+def split_diff(git_diff: str) -> list:
+    """One entry per file of a unified git diff: path, status, line stats and the section's offsets"""
+    starts = [0] if git_diff.startswith(DIFF_HEADER) else []
+    position = git_diff.find('\n' + DIFF_HEADER)
+    while position >= 0:
+        starts.append(position + 1)
+        position = git_diff.find('\n' + DIFF_HEADER, position + 1)
+    ends = starts[1:] + [len(git_diff)]
+    return [_describe_section(git_diff, start, end) for start, end in zip(starts, ends)]
+
+
+def _describe_section(git_diff: str, start: int, end: int) -> dict:
+    header_end = git_diff.find('\n', start, end)
+    header_end = end if header_end < 0 else header_end
+    section = {
+        'path': _header_path(git_diff[start:header_end]),
+        'old_path': None,
+        'status': 'modified',
+        'binary': False,
+        'additions': 0,
+        'deletions': 0,
+        'offsets': (start, end)
+    }
+
+    # Extended header lines come before the first hunk; after it only hunk lines follow
+    in_hunks = False
+    for line in git_diff[header_end + 1:end].split('\n'):
+        if in_hunks:
+            if line.startswith('+'):
+                section['additions'] += 1
+            elif line.startswith('-'):
+                section['deletions'] += 1
+        elif line.startswith('@@'):
+            in_hunks = True
+        elif line.startswith('+++ b/'):
+            # git ends these lines with a tab when the path contains spaces
+            section['path'] = line[6:].rstrip('\t')
+        elif line.startswith('--- a/'):
+            section['old_path'] = line[6:].rstrip('\t')
+        elif line.startswith('new file mode'):
+            section['status'] = 'added'
+        elif line.startswith('deleted file mode'):
+            section['status'] = 'deleted'
+        elif line.startswith('rename from '):
+            section['status'] = 'renamed'
+            section['old_path'] = line[len('rename from '):]
+        elif line.startswith('rename to '):
+            section['path'] = line[len('rename to '):]
+        elif line.startswith('Binary files') or line == 'GIT binary patch':
+            section['binary'] = True
+
+    if section['status'] == 'deleted' and section['old_path']:
+        section['path'] = section['old_path']
+    if section['status'] != 'renamed':
+        section['old_path'] = None
+    return section
+
+
+class TaskFiles:
+    """The changed files of one task version, addressable by path and part (diff, before, after)"""
+
+    def __init__(self, task: dict):
+        self._diff = task.get('git_diff') or ''
+        self._files = OrderedDict()
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+        for section in split_diff(self._diff):
+            self._files[section['path']] = {**section, 'before': None, 'after': None, 'hunks': None, 'snapshot': None}
+
+        file_changes = (task.get('execution_metadata') or {}).get('file_changes') or []
+        for change in file_changes:
+            entry = self._files.get(change['filename'])
+            if entry is None:
+                entry = self._files[change['filename']] = {
+                    'path': change['filename'], 'old_path': None, 'status': change.get('status', 'modified'),
+                    'binary': False, 'additions': 0, 'deletions': 0, 'offsets': None, 'snapshot': None
+                }
+            entry['hunks'] = change.get('hunks')
+            if 'blob' in change:
+                # Blob ids and sizes only; contents are loaded or rebuilt when first asked for
+                entry['snapshot'] = change
+                entry['binary'] = entry['binary'] or change['binary']
+                entry['before'] = entry['after'] = None
+                continue
+            if change.get('before') == FILE_NOT_EXISTS:
+                entry['status'] = 'added'
+            if change.get('after') == FILE_DELETED:
+                entry['status'] = 'deleted'
+            entry['before'], entry['after'] = _inline_contents(change)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._files
+
+    def _has_contents(self, entry: dict) -> bool:
+        if entry['snapshot'] is not None:
+            return entry['snapshot'].get('has_contents', False)
+        return entry['before'] is not None
+
+    def index(self) -> list:
+        """Per-file stats and part sizes, without any content"""
+        entries = []
+        for path, entry in self._files.items():
+            snapshot = entry['snapshot']
+            if snapshot is not None:
+                # Sizes of the files themselves; their contents are only served when has_contents is set
+                sizes = {'before_bytes': snapshot['base_size'], 'after_bytes': snapshot['size'],
+                         'before_lines': snapshot.get('base_lines'), 'after_lines': snapshot.get('lines')}
+            else:
+                sizes = {}
+                for part in ('before', 'after'):
+                    sizes[f'{part}_bytes'] = len(self.content(path, part))
+                    sizes[f'{part}_lines'] = self.line_count(path, part)
+            entries.append({
+                'path': path,
+                'old_path': entry['old_path'],
+                'status': entry['status'],
+                'binary': entry['binary'],
+                'oversized': bool(snapshot and snapshot.get('oversized')),
+                'additions': entry['additions'],
+                'deletions': entry['deletions'],
+                'has_contents': self._has_contents(entry),
+                'diff_bytes': len(self.content(path, 'diff')),
+                'diff_lines': self.line_count(path, 'diff'),
+                **sizes
+            })
+        return entries
+
+    def stats(self) -> dict:
+        return {
+            'files': len(self._files),
+            'additions': sum(entry['additions'] for entry in self._files.values()),
+            'deletions': sum(entry['deletions'] for entry in self._files.values())
+        }
+
+    def text(self, path: str, part: str) -> str:
+        entry = self._files[path]
+        if part == 'diff':
+            return self._diff[entry['offsets'][0]:entry['offsets'][1]] if entry['offsets'] else ''
+        if entry['snapshot'] is not None:
+            return self._snapshot_text(path, part) or ''
+        return entry[part] or ''
+
+    def _snapshot_text(self, path: str, part: str):
+        """Old or new version of a snapshot file; None when it is not available"""
+        entry = self._files[path]
+        snapshot = entry['snapshot']
+        if not snapshot.get('has_contents'):
+            return None
+        if part == 'before':
+            return snapshots.load_blob(snapshot['base_blob'])
+        return snapshots.rebuild(snapshot['base_blob'], snapshot['blob'], self.text(path, 'diff'))
+
+    def content(self, path: str, part: str) -> bytes:
+        """UTF-8 body of one part of a file, encoded once per cached task version"""
+        key = (path, part)
+        with self._lock:
+            encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = self.text(path, part).encode()
+            with self._lock:
+                self._encoded[key] = encoded
+        return encoded
+
+    def hunks(self, path: str):
+        """Ready-to-render hunks of a file, None when its contents were not captured or are too large.
+
+        Hunks precomputed at completion are used as they are; older tasks get them computed here, once.
+        """
+        entry = self._files[path]
+        if not self._has_contents(entry) or entry['binary']:
+            return None
+        if entry['snapshot'] is not None:
+            before, after = self._snapshot_text(path, 'before'), self._snapshot_text(path, 'after')
+            if before is None or after is None or entry['hunks'] is None:
+                return None
+            return render_hunks(before, after, entry['hunks'])
+
+        if _is_binary(entry['before'], entry['after']):
+            return None
+        with self._lock:
+            if entry['hunks'] is None:
+                entry['hunks'] = compute_hunks(entry['before'], entry['after'])
+        if entry['hunks'] is None:
+            return None
+        return render_hunks(entry['before'], entry['after'], entry['hunks'])
+
+    def line_count(self, path: str, part: str) -> int:
+        body = self.content(path, part)
+        return body.count(b'\n') + (1 if body and not body.endswith(b'\n') else 0)
+
+
+def _inline_contents(change: dict) -> tuple:
+    before, after = change.get('before') or '', change.get('after') or ''
+    return ('' if before == FILE_NOT_EXISTS else before), ('' if after == FILE_DELETED else after)
+
+
+def _is_binary(before: str, after: str) -> bool:
+    return '\0' in before or '\0' in after
+
+
+def _line_count(text: str) -> int:
+    return text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+
+
+def precompute_hunks(file_changes: list) -> list:
+    """Attach structured hunks to file changes captured with their full contents (output format 2)"""
+    for change in file_changes:
+        before, after = _inline_contents(change)
+        if not _is_binary(before, after):
+            hunks = compute_hunks(before, after)
+            if hunks is not None:
+                change['hunks'] = hunks
+    return file_changes
+
+
+def store_file_changes(file_changes: list, git_diff: str) -> list:
+    """File changes of a completed task as stored in its execution metadata.
+
+    Snapshots (output format 3) keep blob ids, sizes and hunks: the old content goes
+    to the ``file_blobs`` table and the new one is rebuilt from ``git_diff`` and
+    checked against its blob id. Binary files and files over SNAPSHOT_MAX_BYTES are
+    kept as a summary only.
+    """
+    sections = {section['path']: section['offsets'] for section in split_diff(git_diff)}
+    blobs = {}
+    for change in file_changes:
+        if 'blob' not in change:
+            precompute_hunks([change])
+            continue
+
+        before = change.pop('before', None)
+        change['oversized'] = max(change['base_size'], change['size']) > snapshots.SNAPSHOT_MAX_BYTES
+        change['has_contents'] = False
+        if change['binary'] or change['oversized'] or (before is None and change['base_blob']):
+            continue
+        before = before or ''
+        if change['base_blob'] and snapshots.blob_sha(before) != change['base_blob']:
+            logger.warning(f"⚠️ Captured content of {change['filename']} does not match its blob; keeping its diff only")
+            continue
+
+        offsets = sections.get(change['filename'])
+        try:
+            after = snapshots.apply_patch(before, git_diff[offsets[0]:offsets[1]] if offsets else '') if change['blob'] else ''
+        except ValueError as e:
+            logger.warning(f"⚠️ Could not rebuild {change['filename']} from its diff: {e}")
+            continue
+        if change['blob'] and snapshots.blob_sha(after) != change['blob']:
+            logger.warning(f"⚠️ Rebuilt {change['filename']} does not match its blob; keeping its diff only")
+            continue
+
+        change['has_contents'] = True
+        change['base_lines'], change['lines'] = _line_count(before), _line_count(after)
+        hunks = compute_hunks(before, after)
+        if hunks is not None:
+            change['hunks'] = hunks
+        if change['base_blob']:
+            blobs[change['base_blob']] = before
+        if change['blob']:
+            snapshots.snapshot_cache.put(change['blob'], after)
+
+    if not snapshots.store_blobs(blobs):
+        # Without the stored old versions nothing can be rebuilt later
+        for change in file_changes:
+            if change.get('base_blob') in blobs:
+                change['has_contents'] = False
+                change.pop('hunks', None)
+    return file_changes
+
+
+def line_range(body: bytes, first: int, last: int = None) -> bytes:
+    """Lines ``first`` to ``last`` (1-based, inclusive; ``None`` means to the end) of ``body``.
+
+    Only the bytes up to the end of the range are scanned.
+    """
+    start = 0
+    for _ in range(first - 1):
+        start = body.find(b'\n', start) + 1
+        if start == 0:
+            return b''
+    if last is None:
+        return body[start:]
+    end = start
+    for _ in range(last - first + 1):
+        end = body.find(b'\n', end) + 1
+        if end == 0:
+            return body[start:]
+    return body[start:end]
+
+
+_cache = OrderedDict()  # task id -> (etag, TaskFiles)
+_cache_lock = threading.Lock()
+
+
+def task_files(task_id: int, etag: str, load_task) -> TaskFiles:
+    """Parsed files of version ``etag`` of a task; ``load_task`` fetches the row on a cache miss.
+
+    Returns None if the row is gone (deleted after its version was read).
+    """
+    with _cache_lock:
+        cached = _cache.get(task_id)
+        if cached is not None and cached[0] == etag:
+            _cache.move_to_end(task_id)
+            return cached[1]
+
+    task = load_task()
+    if task is None:
+        return None
+    files = TaskFiles(task)
+    with _cache_lock:
+        _cache[task_id] = (etag, files)
+        _cache.move_to_end(task_id)
+        while len(_cache) > DIFF_CACHE_TASKS:
+            _cache.popitem(last=False)
+    return files
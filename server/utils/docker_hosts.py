@@ -0,0 +1,470 @@
+import bisect
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import docker
+import docker.tls
+
+from .completion_monitor import CompletionMonitor
+from .resources import format_bytes, parse_cpuset
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOCKER_URL = 'unix:///var/run/docker.sock'
+DEFAULT_HOST_CAPACITY = 10
+
+# Points per host on the consistent-hash ring
+RING_VIRTUAL_NODES = 64
+
+# Named volume holding a host's git mirror of one repository
+REPO_CACHE_VOLUME_PREFIX = 'ai-code-repo-cache-'
+
+# Memory kept free on every host for the Docker daemon and the OS
+HOST_RESERVED_MEMORY = docker.utils.parse_bytes(os.getenv('HOST_RESERVED_MEMORY', '1g'))
+
+# Ratio of CPU limits that may be handed out per host CPU
+CPU_OVERCOMMIT = float(os.getenv('CPU_OVERCOMMIT', '1.0'))
+
+# CPUs task containers are pinned to (e.g. "2-15"); pinning is off when unset
+CPUSET_CPUS = os.getenv('CPUSET_CPUS', '')
+
+# Processes running tasks on the same hosts (e.g. gunicorn workers). Each process
+# books only its share of every host's slots, memory and CPUs, so together they
+# never overcommit a host.
+EXECUTOR_PROCESSES = max(1, int(os.getenv('EXECUTOR_PROCESSES', '1')))
+
+
+def docker_tls_paths(base_url: str):
+    """Client TLS files for a tcp/https Docker endpoint, following the docker CLI's environment.
+
+    TLS is used for ``https://`` URLs, or when ``DOCKER_TLS_VERIFY`` or ``DOCKER_CERT_PATH``
+    is set; the server certificate is verified against ``ca.pem`` only with
+    ``DOCKER_TLS_VERIFY``. Returns None for plain endpoints.
+    """
+    if base_url.startswith(('unix://', 'npipe://')):
+        return None
+    verify = bool(os.getenv('DOCKER_TLS_VERIFY'))
+    if not (verify or os.getenv('DOCKER_CERT_PATH') or base_url.startswith('https://')):
+        return None
+    cert_path = os.getenv('DOCKER_CERT_PATH') or os.path.join(os.path.expanduser('~'), '.docker')
+    return {
+        'ca': os.path.join(cert_path, 'ca.pem'),
+        'cert': os.path.join(cert_path, 'cert.pem'),
+        'key': os.path.join(cert_path, 'key.pem'),
+        'verify': verify,
+    }
+
+
+def repo_cache_key(repo_url: str) -> str:
+    """Stable key for a repository, independent of credentials and .git suffix"""
+    normalized = (repo_url or '').strip().lower().rstrip('/')
+    if normalized.endswith('.git'):
+        normalized = normalized[:-4]
+    if '@' in normalized:
+        # Drop any credentials embedded in the URL
+        scheme, _, rest = normalized.partition('://')
+        normalized = f"{scheme}://{rest.split('@', 1)[1]}"
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def repo_cache_volume(repo_url: str) -> str:
+    return f'{REPO_CACHE_VOLUME_PREFIX}{repo_cache_key(repo_url)}'
+
+
+def _ring_hash(value: str) -> int:
+    return int(hashlib.sha1(value.encode('utf-8')).hexdigest()[:15], 16)
+
+
+class DockerHost:
+    """One Docker endpoint that can run task containers"""
+
+    def __init__(self, name: str, base_url: str, capacity: int = DEFAULT_HOST_CAPACITY):
+        self.name = name
+        self.base_url = base_url
+        self.capacity = max(1, capacity // EXECUTOR_PROCESSES)
+        self.active = 0  # Tasks placed on this host that still hold a slot
+        self.healthy = True
+        self.last_error = None
+        self.warm_repos = set()  # repo_cache_key()s with a local mirror on this host
+        self.memory_total = None  # From `docker info`, filled in by health checks
+        self.cpu_total = None
+        self.reserved_memory = 0
+        self.reserved_cpus = 0.0
+        self.allocations = {}  # task_id -> resources reserved for the task
+        self.slots = set()  # task_ids holding a slot, so releasing twice is harmless
+        self.cpuset_free = set(parse_cpuset(CPUSET_CPUS))
+        self._client = None
+        self._monitor = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> docker.DockerClient:
+        """Docker client for this host, created on first use"""
+        with self._lock:
+            if self._client is None:
+                tls = docker_tls_paths(self.base_url)
+                if tls:
+                    tls = docker.tls.TLSConfig(
+                        client_cert=(tls['cert'], tls['key']) if os.path.exists(tls['cert']) else None,
+                        ca_cert=tls['ca'] if tls['verify'] else None,
+                        verify=tls['verify']
+                    )
+                self._client = docker.DockerClient(base_url=self.base_url, tls=tls or False)
+            return self._client
+
+    @client.setter
+    def client(self, client):
+        """Use ``client`` (for example a fake) for this host instead of connecting to base_url"""
+        with self._lock:
+            self._client = client
+
+    @property
+    def monitor(self) -> CompletionMonitor:
+        """Completion monitor subscribed to this host's event stream"""
+        client = self.client
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = CompletionMonitor(
+                    client,
+                    max_workers=int(os.getenv('COMPLETION_WORKERS', '4')),
+                    sweep_workers=int(os.getenv('COMPLETION_SWEEP_WORKERS', '8'))
+                )
+            return self._monitor
+
+    def load(self) -> float:
+        return self.active / self.capacity if self.capacity else 1.0
+
+    def has_capacity(self) -> bool:
+        return self.healthy and self.active < self.capacity
+
+    def fits(self, resources: dict = None) -> bool:
+        """Whether free memory and CPU can honour the requested limits.
+
+        A host with nothing reserved always fits, so a task larger than any
+        host still runs - alone.
+        """
+        if not resources or not self.allocations:
+            return True
+        if self.memory_total:
+            allocatable = self.memory_total - HOST_RESERVED_MEMORY // EXECUTOR_PROCESSES
+            if self.reserved_memory + resources['memory_bytes'] > allocatable:
+                return False
+        if CPUSET_CPUS:
+            return len(self.cpuset_free) >= math.ceil(resources['cpus'])
+        if self.cpu_total:
+            return self.reserved_cpus + resources['cpus'] <= self.cpu_total * CPU_OVERCOMMIT
+        return True
+
+    def reserve(self, task_id, resources: dict):
+        """Book a task's limits on this host, pinning it to free CPUs when configured"""
+        if CPUSET_CPUS:
+            if resources.get('cpuset'):
+                # Already pinned, e.g. a container reattached after a restart
+                cores = parse_cpuset(resources['cpuset'])
+            else:
+                cores = sorted(self.cpuset_free)[:max(1, math.ceil(resources['cpus']))]
+                resources['cpuset'] = ','.join(str(core) for core in cores)
+            self.cpuset_free.difference_update(cores)
+        self.reserved_memory += resources['memory_bytes']
+        self.reserved_cpus += resources['cpus']
+        self.allocations[task_id] = resources
+
+    def unreserve(self, task_id):
+        resources = self.allocations.pop(task_id, None)
+        if resources is None:
+            return
+        self.reserved_memory -= resources['memory_bytes']
+        self.reserved_cpus -= resources['cpus']
+        if resources.get('cpuset'):
+            self.cpuset_free.update(parse_cpuset(resources['cpuset']))
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'base_url': self.base_url,
+            'capacity': self.capacity,
+            'active': self.active,
+            'healthy': self.healthy,
+            'last_error': self.last_error,
+            'warm_repos': len(self.warm_repos),
+            'memory_total': format_bytes(self.memory_total) if self.memory_total else None,
+            'memory_reserved': format_bytes(self.reserved_memory),
+            'cpu_total': self.cpu_total,
+            'cpus_reserved': self.reserved_cpus,
+            'cpuset_free': len(self.cpuset_free) if CPUSET_CPUS else None,
+        }
+
+
+class DockerHostPool:
+    """Set of Docker hosts with load- and repo-affinity-aware placement of task containers.
+
+    Tasks for a repository are placed with bounded-load consistent hashing on
+    ``repo_url``: walking the ring from the repository's hash, a host already
+    holding a warm mirror of the repo wins, otherwise the first host on the ring.
+    No host is given more than ``ceil((1 + AFFINITY_LOAD_FACTOR) * average load)``
+    tasks, so affinity never skews load beyond that bound.
+
+    Tasks carrying ``resources`` (memory and CPU limits) are only admitted to a
+    host whose unreserved memory and CPU can honour them; the reservation is
+    held until the slot is released.
+
+    Hosts come from ``DOCKER_HOSTS`` as a comma separated list of
+    ``name=base_url*capacity`` entries, e.g.
+    ``local=unix:///var/run/docker.sock*8,gpu1=tcp://10.0.0.5:2375*16``.
+    Without it a single host is built from ``DOCKER_HOST``.
+    """
+
+    def __init__(self, hosts):
+        if not hosts:
+            raise ValueError("At least one Docker host is required")
+        self.hosts = {host.name: host for host in hosts}
+        self.default_host = hosts[0]
+        self.load_factor = float(os.getenv('AFFINITY_LOAD_FACTOR', '0.25'))
+        self.placements = 0
+        self.affinity_hits = 0
+        self._lock = threading.Lock()
+        self._release_listeners = []
+        self._task_release_listeners = []
+        self._health_thread = None
+        self._ring = sorted(
+            (_ring_hash(f'{host.name}#{replica}'), host.name)
+            for host in hosts
+            for replica in range(RING_VIRTUAL_NODES)
+        )
+        self._ring_points = [point for point, _ in self._ring]
+
+    @classmethod
+    def from_env(cls):
+        spec = os.getenv('DOCKER_HOSTS', '').strip()
+        if not spec:
+            capacity = int(os.getenv('DOCKER_HOST_CAPACITY', str(DEFAULT_HOST_CAPACITY)))
+            return cls([DockerHost('local', os.getenv('DOCKER_HOST', DEFAULT_DOCKER_URL), capacity)])
+        return cls(parse_docker_hosts(spec))
+
+    def get(self, name: str = None) -> DockerHost:
+        """Look up a host by name, falling back to the default host for legacy tasks"""
+        if not name:
+            return self.default_host
+        host = self.hosts.get(name)
+        if host is None:
+            raise ValueError(f"Unknown Docker host: {name}")
+        return host
+
+    def acquire(self, task: dict = None, slots: bool = True) -> DockerHost:
+        """Reserve a slot on a healthy host, or return None if all are full.
+
+        With a ``repo_url`` in ``task`` the host is chosen by repo affinity within
+        the load bound; the decision is stored in ``task['placement']``. With
+        ``resources`` only hosts that can fit them are considered. With
+        ``slots=False`` (the async engine, bounded by its own concurrency limit)
+        a host's slot capacity is not enforced, only its health and resources.
+        """
+        repo_url = task.get('repo_url') if task else None
+        resources = task.get('resources') if task else None
+        with self._lock:
+            candidates = [
+                host for host in self.hosts.values()
+                if (host.has_capacity() if slots else host.healthy) and host.fits(resources)
+            ]
+            if not candidates:
+                return None
+
+            placement = {'strategy': 'least_loaded', 'warm': False}
+            host = None
+            if repo_url:
+                host, placement = self._affinity_choice(repo_url, candidates)
+            if host is None:
+                host = min(candidates, key=lambda h: (h.load(), h.active))
+
+            host.active += 1
+            if task and task.get('task_id') is not None:
+                host.slots.add(task['task_id'])
+                if resources:
+                    host.reserve(task['task_id'], resources)
+            self.placements += 1
+            if placement['warm']:
+                self.affinity_hits += 1
+            placement.update({
+                'host': host.name,
+                'affinity_hit_rate': round(self.affinity_hits / self.placements, 4),
+            })
+
+        if task is not None:
+            task['placement'] = placement
+        logger.info(f"📍 Placed task on Docker host '{host.name}' ({host.active}/{host.capacity} slots in use, {placement['strategy']}, warm={placement['warm']})")
+        return host
+
+    def _affinity_choice(self, repo_url: str, candidates: list):
+        """Bounded-load consistent hashing over ``candidates``; call with the lock held"""
+        cache_key = repo_cache_key(repo_url)
+        healthy = [host for host in self.hosts.values() if host.healthy]
+        total_active = sum(host.active for host in healthy) + 1
+        load_bound = math.ceil((1 + self.load_factor) * total_active / max(len(healthy), 1))
+
+        eligible = {host.name for host in candidates if host.active + 1 <= load_bound}
+        ring_order = self._ring_order(cache_key)
+        ordered = [self.hosts[name] for name in ring_order if name in eligible]
+        if not ordered:
+            return None, {'strategy': 'least_loaded', 'warm': False, 'load_bound': load_bound}
+
+        for host in ordered:
+            if cache_key in host.warm_repos:
+                return host, {'strategy': 'warm_affinity', 'warm': True, 'load_bound': load_bound}
+        owner = ordered[0]
+        return owner, {
+            'strategy': 'ring_owner' if owner.name == ring_order[0] else 'ring_successor',
+            'warm': False,
+            'load_bound': load_bound,
+        }
+
+    def _ring_order(self, cache_key: str) -> list:
+        """Host names in ring order starting at the key's position"""
+        start = bisect.bisect(self._ring_points, _ring_hash(cache_key))
+        order = []
+        for index in range(len(self._ring)):
+            name = self._ring[(start + index) % len(self._ring)][1]
+            if name not in order:
+                order.append(name)
+                if len(order) == len(self.hosts):
+                    break
+        return order
+
+    def mark_warm(self, name: str, repo_url: str):
+        """Record that a host now holds a mirror of the repository"""
+        host = self.hosts.get(name)
+        if host is not None and repo_url:
+            with self._lock:
+                host.warm_repos.add(repo_cache_key(repo_url))
+
+    def refresh_residency(self, host: DockerHost):
+        """Rebuild a host's warm repo set from its repo cache volumes"""
+        volumes = host.client.volumes.list(filters={'name': REPO_CACHE_VOLUME_PREFIX})
+        warm = {
+            volume.name[len(REPO_CACHE_VOLUME_PREFIX):]
+            for volume in volumes
+            if volume.name.startswith(REPO_CACHE_VOLUME_PREFIX)
+        }
+        with self._lock:
+            host.warm_repos = warm
+
+    def claim(self, name: str, task_id, resources: dict = None):
+        """Account for a task already running on a host, e.g. one reattached after a restart.
+
+        Capacity and resource checks are skipped: the container exists either way.
+        """
+        host = self.get(name)
+        with self._lock:
+            if task_id in host.slots:
+                return host
+            host.active += 1
+            host.slots.add(task_id)
+            if resources:
+                host.reserve(task_id, resources)
+        return host
+
+    def refresh_resources(self, host: DockerHost):
+        """Read this process's share of a host's memory and CPUs from ``docker info``"""
+        info = host.client.info()
+        with self._lock:
+            host.memory_total = (info.get('MemTotal') or 0) // EXECUTOR_PROCESSES or None
+            host.cpu_total = (info.get('NCPU') or 0) / EXECUTOR_PROCESSES or None
+
+    def release(self, name: str, task_id=None):
+        """Free the slot (and resources) a task held on a host and wake up anyone waiting for capacity.
+
+        Releasing a ``task_id`` that no longer holds a slot is a no-op.
+        """
+        freed = False
+        with self._lock:
+            host = self.hosts.get(name)
+            if host is not None and (task_id is None or task_id in host.slots):
+                freed = task_id is not None and task_id in host.slots
+                host.slots.discard(task_id)
+                host.unreserve(task_id)
+                if host.active > 0:
+                    host.active -= 1
+        if freed:
+            for listener in list(self._task_release_listeners):
+                try:
+                    listener(task_id)
+                except Exception as e:
+                    logger.warning(f"⚠️  Task release listener failed: {e}")
+        for listener in list(self._release_listeners):
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"⚠️  Release listener failed: {e}")
+
+    def add_release_listener(self, listener):
+        self._release_listeners.append(listener)
+
+    def add_task_release_listener(self, listener):
+        """Call ``listener(task_id)`` once a task's slot is actually freed"""
+        self._task_release_listeners.append(listener)
+
+    def check_health(self):
+        """Ping every host and mark unreachable ones as unhealthy"""
+        for host in list(self.hosts.values()):
+            try:
+                host.client.ping()
+                self.refresh_resources(host)
+                self.refresh_residency(host)
+                if not host.healthy:
+                    logger.info(f"💚 Docker host '{host.name}' is healthy again")
+                host.healthy = True
+                host.last_error = None
+            except Exception as e:
+                if host.healthy:
+                    logger.warning(f"💔 Docker host '{host.name}' is unhealthy: {e}")
+                host.healthy = False
+                host.last_error = str(e)
+        # A host coming back adds capacity
+        for listener in list(self._release_listeners):
+            try:
+                listener()
+            except Exception:
+                pass
+
+    def start_health_checks(self, interval: float = None):
+        """Run health checks periodically in the background (idempotent)"""
+        interval = interval or float(os.getenv('DOCKER_HEALTH_INTERVAL', '15'))
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, args=(interval,), name='docker-health', daemon=True)
+            self._health_thread.start()
+
+    def _health_loop(self, interval: float):
+        while True:
+            self.check_health()
+            time.sleep(interval)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [host.to_dict() for host in self.hosts.values()]
+
+    def affinity_hit_rate(self) -> float:
+        with self._lock:
+            return self.affinity_hits / self.placements if self.placements else 0.0
+
+
+def parse_docker_hosts(spec: str) -> list:
+    """Parse a ``name=base_url*capacity`` list; name and capacity are optional"""
+    hosts = []
+    for index, entry in enumerate(part.strip() for part in spec.split(',')):
+        if not entry:
+            continue
+        name = f'host{index}'
+        if '=' in entry:
+            name, entry = entry.split('=', 1)
+        capacity = DEFAULT_HOST_CAPACITY
+        if '*' in entry:
+            entry, capacity = entry.rsplit('*', 1)
+            capacity = int(capacity)
+        hosts.append(DockerHost(name.strip(), entry.strip(), capacity))
+    return hosts
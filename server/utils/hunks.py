@@ -0,0 +1,324 @@
+"""Structured hunks for the diff viewer, computed on the server.
+
+Lines are diffed with Myers' O(ND) algorithm in its linear-space form (the
+"middle snake" divide and conquer), so memory stays proportional to the file
+size however different the two versions are. Large regions are first split
+at lines that occur exactly once on both sides (as patience diff does), so
+Myers only runs on the small gaps between them. Paired changed lines are then
+diffed word by word for intra-line highlights.
+
+Stored hunks (``compute_hunks``) hold only line numbers, run lengths and
+character spans; ``render_hunks`` joins them with the file text into the rows
+the viewer draws.
+"""
+import bisect
+import os
+import re
+
+# Unchanged lines shown around each change
+CONTEXT_LINES = int(os.getenv('DIFF_CONTEXT_LINES', '3'))
+
+# Diagonal steps one file's line diff may take before the rest of a region is shown
+# as deleted-then-inserted (bounds the time spent on two unrelated versions)
+MAX_DIFF_STEPS = int(os.getenv('DIFF_MAX_STEPS', '2000000'))
+
+# Regions shorter than this (both sides together) go straight to Myers
+ANCHOR_MIN_REGION = 64
+
+# Files with more lines than this get no hunks; the viewer falls back to the raw diff
+MAX_HUNK_LINES = int(os.getenv('DIFF_MAX_HUNK_LINES', '200000'))
+
+# Lines longer than this, and line pairs that share less than this fraction of
+# their characters, are highlighted as a whole rather than word by word
+MAX_WORD_DIFF_CHARS = 2000
+MIN_WORD_DIFF_SIMILARITY = 0.4
+
+_TOKEN = re.compile(r'\w+|\s+|[^\w\s]')
+
+EQUAL, DELETE, INSERT = ' ', '-', '+'
+
+
+class _Budget:
+    def __init__(self, steps: int):
+        self.steps = steps
+
+
+def _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi, budget):
+    """Middle snake of the shortest edit script between a[a_lo:a_hi] and b[b_lo:b_hi].
+
+    Returns ``(x0, y0, x1, y1)``, a run of equal elements (possibly empty) that
+    an optimal script passes through, or None when the step budget ran out.
+    """
+    n, m = a_hi - a_lo, b_hi - b_lo
+    delta = n - m
+    odd = delta & 1
+    limit = (n + m + 1) // 2
+    offset = limit + 1
+    forward = [0] * (2 * limit + 3)
+    backward = [0] * (2 * limit + 3)
+
+    for d in range(limit + 1):
+        budget.steps -= 2 * d + 2
+        if budget.steps < 0:
+            return None
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            # The reverse search from the end runs on diagonal delta - k
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + backward[offset + delta - k] >= n:
+                return a_lo + x0, b_lo + y0, a_lo + x, b_lo + y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return a_hi - x, b_hi - y, a_hi - x0, b_hi - y0
+    return None
+
+
+def _diff_range(a, a_lo, a_hi, b, b_lo, b_hi, ops, budget):
+    start = a_lo
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        a_lo += 1
+        b_lo += 1
+    _push(ops, EQUAL, a_lo - start)
+
+    suffix = 0
+    while a_hi > a_lo and b_hi > b_lo and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+        suffix += 1
+
+    anchors = None
+    if (a_hi - a_lo) + (b_hi - b_lo) >= ANCHOR_MIN_REGION and a_lo < a_hi and b_lo < b_hi:
+        anchors = _unique_anchors(a, a_lo, a_hi, b, b_lo, b_hi)
+
+    if a_lo == a_hi or b_lo == b_hi:
+        _push(ops, DELETE, a_hi - a_lo)
+        _push(ops, INSERT, b_hi - b_lo)
+    elif anchors:
+        for x, y in anchors:
+            _diff_range(a, a_lo, x, b, b_lo, y, ops, budget)
+            _push(ops, EQUAL, 1)
+            a_lo, b_lo = x + 1, y + 1
+        _diff_range(a, a_lo, a_hi, b, b_lo, b_hi, ops, budget)
+    else:
+        snake = _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi, budget)
+        if snake is None:
+            _push(ops, DELETE, a_hi - a_lo)
+            _push(ops, INSERT, b_hi - b_lo)
+        else:
+            x0, y0, x1, y1 = snake
+            _diff_range(a, a_lo, x0, b, b_lo, y0, ops, budget)
+            _push(ops, EQUAL, x1 - x0)
+            _diff_range(a, x1, a_hi, b, y1, b_hi, ops, budget)
+
+    _push(ops, EQUAL, suffix)
+
+
+def _unique_anchors(a, a_lo, a_hi, b, b_lo, b_hi) -> list:
+    """Longest increasing run of ``(x, y)`` pairs of elements that occur exactly once in each range"""
+    # element -> [occurrences in a, position in a, occurrences in b, position in b]
+    counts = {}
+    for x in range(a_lo, a_hi):
+        seen = counts.setdefault(a[x], [0, x, 0, 0])
+        seen[0] += 1
+    for y in range(b_lo, b_hi):
+        seen = counts.get(b[y])
+        if seen is not None:
+            seen[2] += 1
+            seen[3] = y
+    pairs = [(x, y) for in_a, x, in_b, y in counts.values() if in_a == 1 and in_b == 1]
+    pairs.sort()
+
+    # Patience sorting: longest chain of pairs increasing in both x and y
+    tails, tail_indices, previous = [], [], [None] * len(pairs)
+    for index, (_, y) in enumerate(pairs):
+        position = bisect.bisect_left(tails, y)
+        if position == len(tails):
+            tails.append(y)
+            tail_indices.append(index)
+        else:
+            tails[position] = y
+            tail_indices[position] = index
+        previous[index] = tail_indices[position - 1] if position else None
+    chain = []
+    index = tail_indices[-1] if tail_indices else None
+    while index is not None:
+        chain.append(pairs[index])
+        index = previous[index]
+    return chain[::-1]
+
+
+def _push(ops: list, tag: str, count: int):
+    if count <= 0:
+        return
+    if ops and ops[-1][0] == tag:
+        ops[-1][1] += count
+    else:
+        ops.append([tag, count])
+
+
+def diff_sequences(a: list, b: list, max_steps: int = None) -> list:
+    """Shortest edit script from ``a`` to ``b`` as ``[tag, count]`` runs (' ' equal, '-' delete, '+' insert)"""
+    ids = {}
+    a_ids = [ids.setdefault(item, len(ids)) for item in a]
+    b_ids = [ids.setdefault(item, len(ids)) for item in b]
+    ops = []
+    _diff_range(a_ids, 0, len(a_ids), b_ids, 0, len(b_ids), ops, _Budget(MAX_DIFF_STEPS if max_steps is None else max_steps))
+    return _group_changes(ops)
+
+
+def _group_changes(ops: list) -> list:
+    """Put the deletions of each change before its insertions, so replaced lines can be paired"""
+    grouped = []
+    pending = {DELETE: 0, INSERT: 0}
+    for tag, count in ops:
+        if tag == EQUAL:
+            _push(grouped, DELETE, pending[DELETE])
+            _push(grouped, INSERT, pending[INSERT])
+            pending = {DELETE: 0, INSERT: 0}
+            _push(grouped, EQUAL, count)
+        else:
+            pending[tag] += count
+    _push(grouped, DELETE, pending[DELETE])
+    _push(grouped, INSERT, pending[INSERT])
+    return grouped
+
+
+def word_spans(old: str, new: str):
+    """Changed character spans ``[start, end, ...]`` of the old and the new line, or None to highlight whole lines"""
+    if len(old) > MAX_WORD_DIFF_CHARS or len(new) > MAX_WORD_DIFF_CHARS:
+        return None
+    old_tokens, new_tokens = _TOKEN.findall(old), _TOKEN.findall(new)
+    old_spans, new_spans = [], []
+    old_token = new_token = old_at = new_at = same = 0
+    for tag, count in diff_sequences(old_tokens, new_tokens, max_steps=100_000):
+        if tag != INSERT:
+            width = sum(map(len, old_tokens[old_token:old_token + count]))
+            if tag == DELETE:
+                old_spans += [old_at, old_at + width]
+            old_token += count
+            old_at += width
+        if tag != DELETE:
+            width = sum(map(len, new_tokens[new_token:new_token + count]))
+            if tag == INSERT:
+                new_spans += [new_at, new_at + width]
+            else:
+                same += width
+            new_token += count
+            new_at += width
+    if 2 * same < MIN_WORD_DIFF_SIMILARITY * (len(old) + len(new)):
+        return None
+    return old_spans, new_spans
+
+
+def split_lines(text: str) -> list:
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def compute_hunks(before: str, after: str, context: int = CONTEXT_LINES):
+    """Hunks turning ``before`` into ``after``, without any of the text (see the module docstring).
+
+    Each hunk is ``{'old_start', 'new_start', 'ops', 'words'}``: 1-based first
+    lines, ``[tag, count]`` line runs including context, and
+    ``[old_line, new_line, old_spans, new_spans]`` for replaced line pairs that
+    have word-level highlights. Returns None for files over MAX_HUNK_LINES.
+    """
+    old_lines, new_lines = split_lines(before), split_lines(after)
+    if max(len(old_lines), len(new_lines)) > MAX_HUNK_LINES:
+        return None
+    ops = diff_sequences(old_lines, new_lines)
+
+    hunks = []
+    current = None
+    old_at = new_at = 0
+    for index, (tag, count) in enumerate(ops):
+        if tag == EQUAL:
+            if current is not None:
+                if count > 2 * context or index == len(ops) - 1:
+                    _push(current['ops'], EQUAL, min(count, context))
+                    hunks.append(current)
+                    current = None
+                else:
+                    _push(current['ops'], EQUAL, count)
+            old_at += count
+            new_at += count
+            continue
+
+        if current is None:
+            leading = min(context, ops[index - 1][1]) if index and ops[index - 1][0] == EQUAL else 0
+            current = {'old_start': old_at - leading + 1, 'new_start': new_at - leading + 1, 'ops': [], 'words': []}
+            _push(current['ops'], EQUAL, leading)
+        _push(current['ops'], tag, count)
+
+        if tag == DELETE and index + 1 < len(ops) and ops[index + 1][0] == INSERT:
+            for pair in range(min(count, ops[index + 1][1])):
+                spans = word_spans(old_lines[old_at + pair], new_lines[new_at + pair])
+                if spans:
+                    current['words'].append([old_at + pair + 1, new_at + pair + 1, *spans])
+
+        if tag == DELETE:
+            old_at += count
+        else:
+            new_at += count
+
+    if current is not None:
+        hunks.append(current)
+    return hunks
+
+
+def render_hunks(before: str, after: str, hunks: list) -> list:
+    """Hunks with their text, as the viewer draws them.
+
+    Every line is ``[tag, old_line, new_line, text, spans]``; line numbers are
+    None on the side a line does not exist, ``spans`` are the changed
+    ``[start, end, ...]`` character ranges or None when the whole line changed.
+    """
+    old_lines, new_lines = split_lines(before), split_lines(after)
+    rendered = []
+    for hunk in hunks:
+        old_spans = {word[0]: word[2] for word in hunk['words']}
+        new_spans = {word[1]: word[3] for word in hunk['words']}
+        old_no, new_no = hunk['old_start'], hunk['new_start']
+        lines = []
+        for tag, count in hunk['ops']:
+            for _ in range(count):
+                if tag == EQUAL:
+                    lines.append([tag, old_no, new_no, new_lines[new_no - 1], None])
+                    old_no += 1
+                    new_no += 1
+                elif tag == DELETE:
+                    lines.append([tag, old_no, None, old_lines[old_no - 1], old_spans.get(old_no)])
+                    old_no += 1
+                else:
+                    lines.append([tag, None, new_no, new_lines[new_no - 1], new_spans.get(new_no)])
+                    new_no += 1
+
+        old_count, new_count = old_no - hunk['old_start'], new_no - hunk['new_start']
+        rendered.append({
+            'header': f"@@ -{hunk['old_start'] - (0 if old_count else 1)},{old_count} "
+                      f"+{hunk['new_start'] - (0 if new_count else 1)},{new_count} @@",
+            'lines': lines
+        })
+    return rendered
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+
+from database import DatabaseOperations
+from . import leases
+from .code_task_v2 import _submit_task, get_docker_pool, get_quota_manager, local_queue_depth, local_scheduler
+from .priorities import PRIORITY_CLASSES, WeightedTurns, effective_priority
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between polls of the task queue while it is empty or this worker is full
+POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', '1.0'))
+
+# Tasks a worker takes on beyond its free host slots, so a freed slot is refilled without waiting for a poll
+PREFETCH = int(os.getenv('WORKER_PREFETCH', '2'))
+
+# Queue entries looked at per poll and priority class beyond the ones wanted, so tasks of
+# users and projects at their quota do not hold back everyone else's
+SCAN_AHEAD = int(os.getenv('WORKER_QUEUE_SCAN', '50'))
+
+
+def _enqueued_at(entry: dict) -> float:
+    value = entry.get('enqueued_at')
+    return leases._parse_timestamp(value).timestamp() if value else time.time()
+
+
+class QueueConsumer:
+    """Moves tasks from the shared task queue, filled by API processes in ``queue`` mode, into this worker.
+
+    A worker only takes as many tasks as it has free host slots plus ``prefetch``,
+    so queued work spreads over all workers instead of piling up in the first one.
+    Taking an entry deletes it from the queue, which only one worker can do; the
+    worker then claims the task's lease like an inline executor would. Priority
+    classes take turns by weight, with aging, as in the scheduler; entries whose
+    user or project is at a quota are left for later.
+    """
+
+    def __init__(self, poll_interval: float = None, prefetch: int = None):
+        self.poll_interval = poll_interval or POLL_INTERVAL
+        self.prefetch = PREFETCH if prefetch is None else prefetch
+        self.taken = 0
+        self._held = {}  # Entries held back by a quota at the last poll, so each is reported once
+        self._turns = WeightedTurns()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling in the background (idempotent)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._poll_loop, name='queue-consumer', daemon=True)
+        self._thread.start()
+        logger.info(f"📥 Consuming the task queue (prefetch: {self.prefetch}, poll interval: {self.poll_interval}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 5)
+
+    def wanted(self) -> int:
+        """How many more tasks this worker can take on right now"""
+        free_slots = sum(max(0, host['capacity'] - host['active']) for host in get_docker_pool().snapshot() if host['healthy'])
+        return max(0, free_slots + self.prefetch - local_queue_depth())
+
+    def poll(self) -> int:
+        """Take up to ``wanted()`` tasks from the queue and start them; returns how many were started"""
+        wanted = self.wanted()
+        if not wanted:
+            return 0
+
+        # Oldest entries of each class, by the class they compete in after aging
+        now = time.time()
+        waiting = {name: [] for name in PRIORITY_CLASSES}
+        for priority in PRIORITY_CLASSES:
+            for entry in DatabaseOperations.get_task_queue(limit=wanted + SCAN_AHEAD, priority=priority):
+                entry = self._held.get(entry['task_id'], entry)
+                entry['queued_at'] = _enqueued_at(entry)
+                waiting[effective_priority(priority, now - entry['queued_at'])].append(entry)
+        for entries in waiting.values():
+            entries.sort(key=lambda entry: entry['queued_at'])
+
+        started = 0
+        taken = []
+        held = {}
+        while started < wanted:
+            eligible = [name for name in PRIORITY_CLASSES if waiting[name]]
+            if not eligible:
+                break
+            turn = self._turns.choose(eligible)
+            entry = waiting[turn].pop(0)
+            if not get_quota_manager().admits(entry, ahead=taken):
+                held[entry['task_id']] = entry
+                continue
+            task_id = entry['task_id']
+            # Claim before taking the entry: a failed claim leaves it queued for the next poll
+            try:
+                claimed = leases.claim(task_id)
+            except Exception as e:
+                logger.warning(f"⚠️  Could not claim queued task {task_id}, leaving it queued: {e}")
+                continue
+            if not claimed:
+                logger.warning(f"⚠️  Queued task {task_id} is already owned by another executor - skipping")
+                continue
+            try:
+                queued = DatabaseOperations.take_queued_task(task_id)
+            except Exception:
+                queued = None
+            if queued is None:
+                # Cancelled while we claimed it, or the delete failed and the entry stays queued
+                leases.release(task_id)
+                continue
+            logger.info(f"📥 Took task {task_id} from the queue")
+            user = DatabaseOperations.get_user_by_id(queued['user_id'])
+            github_token = user.get('github_token') if user else None
+            if not github_token:
+                logger.warning(f"💀 Failing queued task {task_id}: its owner has no stored GitHub token")
+                DatabaseOperations.update_task(task_id, queued['user_id'], {
+                    'status': 'failed',
+                    'error': 'No stored GitHub token is available to run the task'
+                })
+                continue
+            _submit_task(
+                task_id,
+                queued['user_id'],
+                github_token,
+                repo_url=queued.get('repo_url'),
+                project_id=queued.get('project_id'),
+                trace_context=queued.get('trace_context') or None,
+                priority=queued.get('priority'),
+                queued_at=entry['queued_at']
+            )
+            self._turns.commit(turn, eligible)
+            taken.append(entry)
+            started += 1
+        self._held = held
+        self.taken += started
+        return started
+
+    def hand_back(self) -> int:
+        """Return tasks still waiting for a host slot to the queue, e.g. when the worker shuts down"""
+        jobs = local_scheduler().drain()
+        for job in jobs:
+            try:
+                # Give up ownership first: a worker taking the entry must be able to claim the task
+                DatabaseOperations.unclaim_task(job['task_id'], leases.executor_id())
+                DatabaseOperations.enqueue_task(
+                    job['task_id'],
+                    job['user_id'],
+                    repo_url=job.get('repo_url'),
+                    project_id=job.get('project_id'),
+                    trace_context=job.get('trace_context'),
+                    priority=job.get('priority')
+                )
+            except Exception as e:
+                logger.error(f"❌ Failed to hand task {job['task_id']} back to the queue: {e}")
+        if jobs:
+            logger.info(f"↩️  Handed {len(jobs)} waiting task(s) back to the queue")
+        return len(jobs)
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            try:
+                started = self.poll()
+            except Exception as e:
+                logger.warning(f"⚠️  Failed to poll the task queue: {e}")
+                started = 0
+            if not started:
+                self._stop.wait(self.poll_interval)
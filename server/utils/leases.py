@@ -0,0 +1,105 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from database import DatabaseOperations
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long a task stays owned by its executor without a renewal. Leases are renewed
+# every third of this, so another process takes over a dead executor's tasks after
+# at most TASK_LEASE_SECONDS.
+LEASE_SECONDS = float(os.getenv('TASK_LEASE_SECONDS', '60'))
+
+_lock = threading.Lock()
+_executor = {'pid': None, 'id': None, 'renewer': None}
+
+
+def executor_id() -> str:
+    """Identity of this process as an executor; a forked child (e.g. a gunicorn worker) gets its own"""
+    with _lock:
+        if _executor['pid'] != os.getpid():
+            _executor.update(pid=os.getpid(), id=f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}", renewer=None)
+        return _executor['id']
+
+
+def lease_expiry(seconds: float = None) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS if seconds is None else seconds)).isoformat()
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def lease_expired(task: dict, now: datetime = None) -> bool:
+    """Whether a pending or running task has no live owner and may be claimed.
+
+    A task without a lease (created before leases existed, or whose submission
+    failed half-way) counts as expired once it is older than one lease period,
+    so a task that was just created is left to the process submitting it.
+    """
+    now = now or datetime.now(timezone.utc)
+    if task.get('lease_expires_at'):
+        return _parse_timestamp(task['lease_expires_at']) <= now
+    if not task.get('created_at'):
+        return True
+    return _parse_timestamp(task['created_at']) <= now - timedelta(seconds=LEASE_SECONDS)
+
+
+def claim(task_id: int, previous_lease: str = None) -> bool:
+    """Make this process the task's owner if its lease is still ``previous_lease``.
+
+    The check and the write are one conditional update, so when several
+    executors race for the same task exactly one of them wins.
+    """
+    claimed = DatabaseOperations.claim_task(task_id, executor_id(), lease_expiry(), previous_lease)
+    if claimed:
+        _start_renewing()
+    return claimed
+
+
+def owns(task: dict) -> bool:
+    """Whether this process still owns ``task`` (rows without an owner belong to whoever runs them)"""
+    return not task.get('executor_id') or task['executor_id'] == executor_id()
+
+
+def release(task_id: int):
+    """Give up one task so the next recovery pass, in any process, tries it again"""
+    DatabaseOperations.renew_task_leases(executor_id(), lease_expiry(0), task_id=task_id)
+
+
+def release_leases():
+    """Expire the leases of this process's unfinished tasks so other executors take them over right away"""
+    if _executor['pid'] != os.getpid() or _executor['renewer'] is None:
+        return  # Never claimed a task
+    try:
+        released = DatabaseOperations.renew_task_leases(executor_id(), lease_expiry(0))
+        if released:
+            logger.info(f"🔓 Released {released} task lease(s) held by executor {executor_id()}")
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to release task leases: {e}")
+
+
+def _start_renewing():
+    current = executor_id()
+    with _lock:
+        if _executor['renewer'] is not None:
+            return
+        _executor['renewer'] = threading.Thread(target=_renew_loop, args=(current,), name='lease-renewer', daemon=True)
+        _executor['renewer'].start()
+
+
+def _renew_loop(current: str):
+    while executor_id() == current:
+        time.sleep(LEASE_SECONDS / 3)
+        try:
+            DatabaseOperations.renew_task_leases(current, lease_expiry())
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to renew task leases: {e}")
@@ -0,0 +1,168 @@
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Echoed by the task runner (task-runner.sh) right before it extracts results. Its presence means
+# file contents in the FILE CHANGES section are prefixed with CONTENT_PREFIX, so no
+# line of a file can be mistaken for a marker. Format 3 prints a SNAPSHOT line per
+# file and only its old content; format 2 (containers started by an older server)
+# printed the full old and new contents.
+OUTPUT_FORMAT_MARKER = '=== OUTPUT FORMAT: 3 ==='
+PREVIOUS_FORMAT_MARKER = '=== OUTPUT FORMAT: 2 ==='
+CONTENT_PREFIX = '|'
+
+COMMIT_HASH_PREFIX = 'COMMIT_HASH='
+PATCH = ('=== PATCH START ===', '=== PATCH END ===')
+GIT_DIFF = ('=== GIT DIFF START ===', '=== GIT DIFF END ===')
+CHANGED_FILES = ('=== CHANGED FILES START ===', '=== CHANGED FILES END ===')
+FILE_CHANGES = ('=== FILE CHANGES START ===', '=== FILE CHANGES END ===')
+BEFORE = ('=== BEFORE START ===', '=== BEFORE END ===')
+AFTER = ('=== AFTER START ===', '=== AFTER END ===')
+FILE_HEADER = 'FILE: '
+
+# "SNAPSHOT: <change> <old blob> <new blob> <old size> <new size> <binary>", from git diff --raw
+SNAPSHOT_HEADER = 'SNAPSHOT: '
+CHANGE_STATUSES = {'A': 'added', 'C': 'added', 'D': 'deleted', 'M': 'modified', 'R': 'renamed', 'T': 'modified'}
+NULL_BLOB = '0' * 40
+
+
+def _find_line(text: str, line: str, start: int = 0, end: int = None) -> int:
+    """Index of the first line in ``text[start:end]`` beginning with ``line``, or -1"""
+    end = len(text) if end is None else end
+    if text.startswith(line, start) and (start == 0 or text[start - 1] == '\n'):
+        return start
+    index = text.find('\n' + line, start, end)
+    return index + 1 if index >= 0 else -1
+
+
+def _section(text: str, markers: tuple, start: int = 0, end: int = None):
+    """Body between a START and END marker line as ``(body, position after END)``.
+
+    Returns ``(None, start)`` when the section is absent; a missing END marker
+    (truncated output) ends the section at ``end``.
+    """
+    end = len(text) if end is None else end
+    opening = _find_line(text, markers[0], start, end)
+    if opening < 0:
+        return None, start
+    body_start = opening + len(markers[0]) + 1
+    if body_start > end:
+        return '', end
+    closing = _find_line(text, markers[1], body_start, end)
+    if closing < 0:
+        return text[body_start:end].rstrip('\n'), end
+    return text[body_start:max(body_start, closing - 1)], closing + len(markers[1])
+
+
+def _unprefix(block: str) -> str:
+    if not block.startswith(CONTENT_PREFIX):
+        return block  # FILE_NOT_EXISTS / FILE_DELETED sentinels, or empty files
+    return block[len(CONTENT_PREFIX):].replace('\n' + CONTENT_PREFIX, '\n')
+
+
+def _parse_file_changes(section: str, prefixed: bool) -> list:
+    file_changes = []
+    position = 0
+    while True:
+        header = _find_line(section, FILE_HEADER, position)
+        if header < 0:
+            break
+        name_end = section.find('\n', header)
+        if name_end < 0:
+            name_end = len(section)
+        filename = section[header + len(FILE_HEADER):name_end]
+
+        # Blocks belong to this file only up to the next header
+        next_header = _find_line(section, FILE_HEADER, name_end)
+        limit = next_header if next_header >= 0 and prefixed else len(section)
+        if section.startswith(SNAPSHOT_HEADER, name_end + 1):
+            change, position = _parse_snapshot(section, filename, name_end + 1, limit)
+            file_changes.append(change)
+            position = max(position, name_end)
+            continue
+        before, position = _section(section, BEFORE, name_end, limit)
+        after, position = _section(section, AFTER, position, limit)
+        if prefixed:
+            before, after = _unprefix(before or ''), _unprefix(after or '')
+        file_changes.append({'filename': filename, 'before': before or '', 'after': after or ''})
+        position = max(position, name_end)
+    return file_changes
+
+
+def _parse_snapshot(section: str, filename: str, start: int, limit: int) -> tuple:
+    """File change from a SNAPSHOT line and the optional BEFORE block after it"""
+    line_end = section.find('\n', start, limit)
+    line_end = limit if line_end < 0 else line_end
+    fields = section[start + len(SNAPSHOT_HEADER):line_end].split(' ')
+    fields += [''] * (6 - len(fields))
+    base_size = int(fields[3]) if fields[3].isdigit() else 0
+    change = {
+        'filename': filename,
+        'status': CHANGE_STATUSES.get(fields[0], 'modified'),
+        'base_blob': None if fields[1] in ('', NULL_BLOB) else fields[1],
+        'blob': None if fields[2] in ('', NULL_BLOB) else fields[2],
+        'base_size': base_size,
+        'size': int(fields[4]) if fields[4].isdigit() else 0,
+        'binary': fields[5] == '1',
+        'before': None
+    }
+    before, position = _section(section, BEFORE, line_end, limit)
+    if before is not None:
+        before = _unprefix(before)
+        # The block loses the file's final newline; its size tells whether there was one
+        if len(before.encode()) + 1 == base_size:
+            before += '\n'
+        change['before'] = before
+    return change, max(position, line_end)
+
+
+def _commit_hash(text: str, start: int, end: int):
+    """Value of the last COMMIT_HASH= line in ``text[start:end]``"""
+    index = text.rfind('\n' + COMMIT_HASH_PREFIX, start, end)
+    if index < 0:
+        if text.startswith(COMMIT_HASH_PREFIX, start) and (start == 0 or text[start - 1] == '\n'):
+            index = start - 1
+        else:
+            return None
+    value_start = index + 1 + len(COMMIT_HASH_PREFIX)
+    value_end = text.find('\n', value_start)
+    return text[value_start:value_end if value_end >= 0 else len(text)]
+
+
+def parse_container_output(logs: str) -> dict:
+    """Extract commit hash, patch, diff, changed files and file snapshots from task container output.
+
+    Sections are located with ``str.find`` on whole marker lines instead of a
+    per-line state machine, so large outputs are sliced rather than rebuilt line
+    by line. Output from task scripts without OUTPUT_FORMAT_MARKER (containers
+    started by an older server) is still understood.
+    """
+    anchor = max(logs.rfind('\n' + OUTPUT_FORMAT_MARKER + '\n'), logs.rfind('\n' + PREVIOUS_FORMAT_MARKER + '\n'))
+    prefixed = anchor >= 0
+    position = anchor + 1 if prefixed else 0
+
+    sections_start = _find_line(logs, PATCH[0], position)
+    git_patch, position = _section(logs, PATCH, position)
+    git_diff, position = _section(logs, GIT_DIFF, position)
+    changed_files, position = _section(logs, CHANGED_FILES, position)
+    file_changes, position = _section(logs, FILE_CHANGES, position)
+
+    # The script prints COMMIT_HASH= before the sections, or after them when nothing changed
+    search_start = anchor + 1 if prefixed else 0
+    commit_hash = _commit_hash(logs, position, len(logs)) if file_changes is not None else None
+    if commit_hash is None:
+        commit_hash = _commit_hash(logs, search_start, sections_start if sections_start >= 0 else len(logs))
+
+    git_diff = git_diff or ''
+    results = {
+        'commit_hash': commit_hash,
+        'git_diff': git_diff,
+        'git_patch': git_patch or '',
+        'changed_files': [line.strip() for line in (changed_files or '').split('\n') if line.strip()],
+        'file_changes': _parse_file_changes(file_changes, prefixed) if file_changes else [],
+        'diff_lines': git_diff.count('\n') + 1 if git_diff else 0
+    }
+    logger.info(f"📦 Parsed container output: {len(results['git_patch'])} patch bytes, {results['diff_lines']} diff lines, {len(results['file_changes'])} files")
+    return results
@@ -0,0 +1,76 @@
+import os
+import time
+
+# Priority classes, highest first; tasks without one are interactive (submitted from the UI)
+PRIORITY_CLASSES = ('interactive', 'batch')
+DEFAULT_PRIORITY = 'interactive'
+
+# Share of dispatches each class gets while several have tasks waiting, overridable with
+# PRIORITY_WEIGHT_<CLASS>: with 4 and 1, four of every five dispatches go to interactive tasks
+DEFAULT_PRIORITY_WEIGHTS = {'interactive': 4, 'batch': 1}
+PRIORITY_WEIGHTS = {
+    name: float(os.getenv(f'PRIORITY_WEIGHT_{name.upper()}', str(weight)))
+    for name, weight in DEFAULT_PRIORITY_WEIGHTS.items()
+}
+
+# A waiting task moves up one class for every PRIORITY_AGING_SECONDS it has waited (0 disables aging)
+PRIORITY_AGING_SECONDS = float(os.getenv('PRIORITY_AGING_SECONDS', '300'))
+
+
+def normalize_priority(value) -> str:
+    """A submitted priority class, or ValueError if it is not one of PRIORITY_CLASSES"""
+    if value is None:
+        return DEFAULT_PRIORITY
+    if value not in PRIORITY_CLASSES:
+        raise ValueError(f"priority must be one of: {', '.join(PRIORITY_CLASSES)}")
+    return value
+
+
+def effective_priority(priority: str, waited: float, aging_seconds: float = PRIORITY_AGING_SECONDS) -> str:
+    """The class a task competes in after waiting ``waited`` seconds"""
+    index = PRIORITY_CLASSES.index(priority if priority in PRIORITY_CLASSES else DEFAULT_PRIORITY)
+    if aging_seconds > 0:
+        index -= int(max(0.0, waited) // aging_seconds)
+    return PRIORITY_CLASSES[max(0, index)]
+
+
+class WeightedTurns:
+    """Smooth weighted round robin over the priority classes that have work.
+
+    ``choose`` names the class whose turn it is without using it up; ``commit``
+    records the dispatch, so a class whose task could not be placed keeps its turn.
+    """
+
+    def __init__(self, weights: dict = None):
+        self.weights = weights or PRIORITY_WEIGHTS
+        self.credit = {name: 0.0 for name in PRIORITY_CLASSES}
+
+    def choose(self, eligible) -> str:
+        return max(eligible, key=lambda name: (self.credit[name] + self.weights[name], -PRIORITY_CLASSES.index(name)))
+
+    def commit(self, chosen: str, eligible):
+        for name in eligible:
+            self.credit[name] += self.weights[name]
+        self.credit[chosen] -= sum(self.weights[name] for name in eligible)
+
+
+def next_job(jobs, turns: WeightedTurns, quotas=None):
+    """The job to dispatch next from ``jobs`` (in submission order) and the classes that had one ready.
+
+    That is the oldest job, among those its owner's quotas let start now, of the
+    class whose turn it is; aged jobs compete in the class they have reached,
+    which is stored in ``job['dispatch_class']``.
+    """
+    now = time.time()
+    heads = {}
+    for job in jobs:
+        current = effective_priority(job['priority'], now - job['queued_at'])
+        if current in heads or (quotas is not None and not quotas.admits(job)):
+            continue
+        job['dispatch_class'] = current
+        heads[current] = job
+        if len(heads) == len(turns.credit):
+            break
+    if not heads:
+        return None, ()
+    return heads[turns.choose(heads)], tuple(heads)
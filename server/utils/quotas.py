@@ -0,0 +1,385 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import QUOTA_REJECTIONS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Token-bucket quotas and their refill period in seconds: a bucket holds up to the
+# quota's limit and refills at limit / period, so after a quiet period the whole
+# limit is available at once
+BUCKET_PERIODS = {
+    'tasks_per_hour': 3600,
+    'container_minutes_per_day': 86400,
+    'agent_tokens_per_day': 86400,
+}
+QUOTA_NAMES = ('concurrent_tasks',) + tuple(BUCKET_PERIODS)
+
+# Limits per user and per project, overridable with QUOTA_<SCOPE>_<QUOTA>; 0 disables one
+DEFAULT_QUOTA_LIMITS = {
+    'user': {
+        'concurrent_tasks': 3,
+        'tasks_per_hour': 30,
+        'container_minutes_per_day': 600,
+        'agent_tokens_per_day': 5_000_000,
+    },
+    'project': {name: 0 for name in QUOTA_NAMES},
+}
+
+# Off unless enabled, so upgrading does not start refusing or holding back tasks
+QUOTAS_ENABLED = os.getenv('QUOTAS_ENABLED', 'false').lower() == 'true'
+
+# Seconds between syncs of the counters with the database (and the other processes)
+QUOTA_SYNC_SECONDS = float(os.getenv('QUOTA_SYNC_SECONDS', '10'))
+
+# Agent tokens charged to agent_tokens_per_day; cache reads cost a tenth of input and are left out
+CHARGED_TOKEN_KINDS = ('input', 'output', 'cache_creation')
+
+# Finished tasks whose owner is remembered, for agent usage reported after the slot was freed
+RECENT_TASKS = 1000
+
+
+def quota_limits() -> dict:
+    """Quota limits by scope and quota name, from the environment"""
+    return {
+        scope: {
+            name: float(os.getenv(f'QUOTA_{scope.upper()}_{name.upper()}', str(default)))
+            for name, default in defaults.items()
+        }
+        for scope, defaults in DEFAULT_QUOTA_LIMITS.items()
+    }
+
+
+class QuotaExceeded(Exception):
+    """A task was refused because ``scope`` (user or project) is out of ``quota``"""
+
+    def __init__(self, quota: str, scope: str, limit: float, retry_after: int):
+        super().__init__(f"{scope.capitalize()} quota '{quota}' ({limit:g}) exceeded, retry in {retry_after}s")
+        self.quota = quota
+        self.scope = scope
+        self.limit = limit
+        self.retry_after = retry_after
+
+    def to_dict(self) -> dict:
+        return {'quota': self.quota, 'scope': self.scope, 'limit': self.limit, 'retry_after': self.retry_after}
+
+
+class TokenBucket:
+    """Up to ``capacity`` tokens, refilled at ``rate`` per second.
+
+    Usage measured after the fact (container minutes, agent tokens) is charged in
+    full, so the level may go negative; the bucket is usable again once it has
+    refilled to one token.
+    """
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.refreshed_at = now
+        self.pending = 0.0  # Consumed in this process since the last sync
+
+    def refill(self, now: float):
+        if now > self.refreshed_at:
+            self.level = min(self.capacity, self.level + (now - self.refreshed_at) * self.rate)
+            self.refreshed_at = now
+
+    def consume(self, amount: float, now: float):
+        self.refill(now)
+        self.level -= amount
+        self.pending += amount
+
+    def retry_after(self, now: float, needed: float = 1.0) -> int:
+        """Whole seconds until the bucket holds ``needed`` tokens (0 if it does now)"""
+        self.refill(now)
+        deficit = needed - self.level
+        if deficit <= 1e-9:
+            return 0
+        return math.ceil(deficit / self.rate)
+
+
+class QuotaManager:
+    """Per-user and per-project quotas on concurrent tasks, tasks per hour, container
+    minutes per day and agent tokens per day.
+
+    Submission (``check_submission``) takes a token from the tasks-per-hour buckets
+    and refuses users and projects with an empty bucket; dispatch (``admits``) holds
+    back tasks whose owner is at its concurrency limit or out of container minutes
+    or agent tokens. Counters live in memory: every ``sync_interval`` seconds the
+    buckets are merged with the ``quota_buckets`` table (``store``) and the running
+    tasks of all processes are re-read, so limits hold across processes up to one
+    sync interval of drift.
+    """
+
+    def __init__(self, store=None, limits: dict = None, sync_interval: float = QUOTA_SYNC_SECONDS, enabled: bool = QUOTAS_ENABLED):
+        self.store = store
+        self.limits = limits or quota_limits()
+        self.sync_interval = sync_interval
+        self.enabled = enabled
+        self._buckets = {}  # 'user:<id>:<quota>' -> TokenBucket
+        self._running = {}  # task id -> owner scopes, running in any process (as of the last sync, plus this process)
+        self._counts = {}  # (scope, id) -> running tasks
+        self._started = {}  # task id -> {'scopes', 'started_at'}, dispatched by this process
+        self._recent = OrderedDict()  # task id -> owner scopes, finished here
+        self._finished_since_sync = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start syncing with the database in the background (idempotent)"""
+        if self._thread is not None or self.store is None:
+            return
+        with self._lock:
+            if self._thread is not None or self.store is None:
+                return
+            self._thread = threading.Thread(target=self._sync_loop, name='quota-sync', daemon=True)
+            self._thread.start()
+        logger.info(f"🎫 Quotas enabled (sync every {self.sync_interval}s)")
+
+    def _scopes(self, user_id: str, project_id=None) -> list:
+        scopes = [('user', str(user_id))]
+        if project_id is not None:
+            scopes.append(('project', str(project_id)))
+        return scopes
+
+    def _bucket(self, scope: str, scope_id: str, quota: str, now: float):
+        """The scope's bucket for ``quota``, or None when the quota is disabled"""
+        limit = self.limits[scope][quota]
+        if limit <= 0:
+            return None
+        key = f'{scope}:{scope_id}:{quota}'
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != limit:
+            bucket = self._buckets[key] = TokenBucket(limit, limit / BUCKET_PERIODS[quota], now)
+        return bucket
+
+    def _exhausted(self, scopes: list, quotas, now: float):
+        """The quota that keeps the scopes waiting longest, as (quota, scope, limit, retry_after), or None"""
+        worst = None
+        for scope, scope_id in scopes:
+            for quota in quotas:
+                bucket = self._bucket(scope, scope_id, quota, now)
+                wait = bucket.retry_after(now) if bucket else 0
+                if wait and (worst is None or wait > worst[3]):
+                    worst = (quota, scope, bucket.capacity, wait)
+        return worst
+
+    def check_submission(self, user_id: str, project_id=None):
+        """Account for a new task, or raise ``QuotaExceeded`` with the seconds until it would be accepted"""
+        if not self.enabled:
+            return
+        self.start()
+        scopes = self._scopes(user_id, project_id)
+        now = time.time()
+        with self._lock:
+            worst = self._exhausted(scopes, BUCKET_PERIODS, now)
+            if worst is None:
+                for scope, scope_id in scopes:
+                    bucket = self._bucket(scope, scope_id, 'tasks_per_hour', now)
+                    if bucket:
+                        bucket.consume(1, now)
+                return
+        QUOTA_REJECTIONS.labels(worst[0], worst[1], 'submission').inc()
+        raise QuotaExceeded(*worst)
+
+    def refund_submission(self, user_id: str, project_id=None):
+        """Give back the task token of a submission that did not create a task"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            for scope, scope_id in self._scopes(user_id, project_id):
+                bucket = self._bucket(scope, scope_id, 'tasks_per_hour', now)
+                if bucket:
+                    bucket.consume(-1, now)
+
+    def admits(self, job: dict, ahead: list = ()) -> bool:
+        """Whether a queued task (``user_id``, ``project_id``) may start now.
+
+        ``ahead`` are tasks about to start that are not dispatched yet; they count
+        as running. The first refusal of a job is logged and counted.
+        """
+        if not self.enabled:
+            return True
+        self.start()
+        scopes = self._scopes(job['user_id'], job.get('project_id'))
+        now = time.time()
+        with self._lock:
+            full = self._at_concurrency_limit(scopes, ahead)
+            refused = ('concurrent_tasks', full['scope']) if full else None
+            if refused is None:
+                worst = self._exhausted(scopes, ('container_minutes_per_day', 'agent_tokens_per_day'), now)
+                refused = worst[:2] if worst else None
+        if refused and not job.get('quota_deferred'):
+            job['quota_deferred'] = refused[0]
+            QUOTA_REJECTIONS.labels(refused[0], refused[1], 'dispatch').inc()
+            logger.info(f"⏸️  Holding task {job.get('task_id')} back: {refused[1]} is at its '{refused[0]}' quota")
+        return refused is None
+
+    def _at_concurrency_limit(self, scopes: list, ahead: list = ()):
+        """The first scope running as many tasks as its ``concurrent_tasks`` limit allows, or None"""
+        for scope, scope_id in scopes:
+            limit = self.limits[scope]['concurrent_tasks']
+            if limit <= 0:
+                continue
+            running = self._counts.get((scope, scope_id), 0)
+            running += sum(1 for other in ahead if (scope, scope_id) in self._scopes(other['user_id'], other.get('project_id')))
+            if running >= limit:
+                return {'quota': 'concurrent_tasks', 'scope': scope, 'limit': limit, 'running': running}
+        return None
+
+    def concurrency_wait(self, user_id: str, project_id=None):
+        """Why a task submitted now would wait for a running one to finish first, or None.
+
+        The concurrency limit is enforced at dispatch, so a submission is accepted
+        and queued; this tells the caller it will not start right away.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._at_concurrency_limit(self._scopes(user_id, project_id))
+
+    def started(self, job: dict):
+        """A task was dispatched by this process: it runs until its host slot is released"""
+        if not self.enabled:
+            return
+        scopes = self._scopes(job['user_id'], job.get('project_id'))
+        with self._lock:
+            self._started[job['task_id']] = {'scopes': scopes, 'started_at': time.monotonic()}
+            self._add_running(job['task_id'], scopes)
+
+    def finished(self, task_id):
+        """A task's host slot was released: charge the container minutes it held the slot"""
+        with self._lock:
+            entry = self._started.pop(task_id, None)
+            if entry is None:
+                return
+            self._remove_running(task_id)
+            self._finished_since_sync.add(task_id)
+            self._recent[task_id] = entry['scopes']
+            while len(self._recent) > RECENT_TASKS:
+                self._recent.popitem(last=False)
+            minutes = (time.monotonic() - entry['started_at']) / 60
+            self._charge(entry['scopes'], 'container_minutes_per_day', minutes)
+
+    def record_agent_usage(self, task_id, agent: dict):
+        """Charge the tokens of a finished agent run (``execution_metadata['agent']``) to its owner"""
+        if not self.enabled or not agent:
+            return
+        tokens = sum(agent.get('tokens', {}).get(kind, 0) for kind in CHARGED_TOKEN_KINDS)
+        with self._lock:
+            entry = self._started.get(task_id)
+            scopes = entry['scopes'] if entry else self._recent.get(task_id)
+            if scopes and tokens:
+                self._charge(scopes, 'agent_tokens_per_day', tokens)
+
+    def _charge(self, scopes: list, quota: str, amount: float):
+        now = time.time()
+        for scope, scope_id in scopes:
+            bucket = self._bucket(scope, scope_id, quota, now)
+            if bucket:
+                bucket.consume(amount, now)
+
+    def _add_running(self, task_id, scopes: list):
+        if task_id in self._running:
+            return
+        self._running[task_id] = scopes
+        for scope in scopes:
+            self._counts[scope] = self._counts.get(scope, 0) + 1
+
+    def _remove_running(self, task_id):
+        for scope in self._running.pop(task_id, ()):
+            self._counts[scope] -= 1
+            if not self._counts[scope]:
+                del self._counts[scope]
+
+    def usage(self, user_id: str, project_id=None) -> dict:
+        """Limits, running tasks and what is left of each bucket, by scope"""
+        now = time.time()
+        report = {}
+        with self._lock:
+            for scope, scope_id in self._scopes(user_id, project_id):
+                limits = self.limits[scope]
+                quotas = {'concurrent_tasks': {'limit': limits['concurrent_tasks'] or None, 'running': self._counts.get((scope, scope_id), 0)}}
+                for quota in BUCKET_PERIODS:
+                    bucket = self._bucket(scope, scope_id, quota, now)
+                    quotas[quota] = {
+                        'limit': limits[quota] or None,
+                        'remaining': round(max(0.0, bucket.level), 1) if bucket else None,
+                        'retry_after': bucket.retry_after(now) if bucket else 0
+                    }
+                report[scope] = quotas
+        return report
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f"⚠️  Quota sync failed: {e}")
+
+    def sync(self):
+        """Merge the buckets with the database and re-read the tasks running in every process"""
+        self._sync_running()
+        self._sync_buckets()
+
+    def _sync_running(self):
+        with self._lock:
+            self._finished_since_sync = set()
+        rows = self.store.get_running_tasks()
+        with self._lock:
+            running = {
+                row['id']: self._scopes(row['user_id'], row.get('project_id'))
+                for row in rows if row['id'] not in self._finished_since_sync
+            }
+            self._running, self._counts = {}, {}
+            for task_id, scopes in running.items():
+                self._add_running(task_id, scopes)
+            for task_id, entry in self._started.items():
+                self._add_running(task_id, entry['scopes'])
+
+    def _sync_buckets(self):
+        """Write this process's consumption into the shared rows and adopt their levels.
+
+        A row is replaced only if its version is unchanged since it was read; on a
+        conflict the consumption stays pending until the next sync.
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+        if not buckets:
+            return
+        rows = {row['key']: row for row in self.store.get_quota_buckets(list(buckets))}
+        with self._lock:
+            taken = {}
+            for key, bucket in buckets.items():
+                taken[key], bucket.pending = bucket.pending, 0.0
+        now = time.time()
+        for key, bucket in buckets.items():
+            row = rows.get(key)
+            if row is None and not taken[key]:
+                continue
+            level = bucket.capacity
+            if row is not None:
+                level = min(bucket.capacity, row['level'] + max(0.0, now - row['refreshed_at']) * bucket.rate)
+            level -= taken[key]
+            try:
+                saved = not taken[key] or self.store.save_quota_bucket(key, level, now, row['version'] if row else None)
+            except Exception as e:
+                logger.warning(f"⚠️  Could not save quota bucket {key}: {e}")
+                saved = False
+            with self._lock:
+                if not saved:
+                    bucket.pending += taken[key]
+                    continue
+                bucket.level = level - bucket.pending
+                bucket.refreshed_at = now
+                if not bucket.pending and bucket.level >= bucket.capacity and self._buckets.get(key) is bucket:
+                    # A full bucket is what a new one would be
+                    del self._buckets[key]
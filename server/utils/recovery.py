@@ -0,0 +1,188 @@
+import functools
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import docker
+
+from database import DatabaseOperations
+from . import leases
+from .code_task_v2 import (
+    _handle_container_exit,
+    _submit_task,
+    get_docker_pool,
+)
+from .resources import DEFAULT_CPUS, DEFAULT_MEMORY_BYTES, ResourceSampler
+from .watchdog import Watchdog, parse_docker_timestamp, watchdog_limits
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between recovery passes; a pass takes over tasks whose executor's lease ran out
+RECOVERY_INTERVAL = float(os.getenv('TASK_RECOVERY_INTERVAL', str(leases.LEASE_SECONDS)))
+
+_recovery_thread = None
+
+
+def start_task_recovery():
+    """Run recovery passes in the background, the first one right away (idempotent per process)"""
+    global _recovery_thread
+    if _recovery_thread is not None and _recovery_thread.is_alive():
+        return
+    _recovery_thread = threading.Thread(target=_recovery_loop, name='task-recovery', daemon=True)
+    _recovery_thread.start()
+
+
+def _recovery_loop():
+    while True:
+        recover_tasks()
+        time.sleep(RECOVERY_INTERVAL)
+
+
+def recover_tasks() -> dict:
+    """Take over ``pending`` or ``running`` tasks whose executor is gone.
+
+    A task qualifies once its lease has expired: the process that owned it
+    exited (a restart, a recycled or crashed worker) without handing it on.
+    Each task is claimed before it is touched, so of several processes
+    recovering at once only one acts on it. Containers that are still alive
+    (or exited unobserved) are reattached to the completion monitor so their
+    results are collected, tasks whose container never started are queued
+    again, and tasks whose container is gone are failed.
+    """
+    summary = {'reattached': 0, 'requeued': 0, 'failed': 0, 'skipped': 0}
+    try:
+        tasks = DatabaseOperations.get_tasks_by_status(['pending', 'running'])
+    except Exception as e:
+        logger.warning(f"⚠️  Task recovery skipped - could not load unfinished tasks: {e}")
+        return summary
+
+    now = datetime.now(timezone.utc)
+    queued = None
+    for task in tasks:
+        if not leases.lease_expired(task, now):
+            continue
+        if not task.get('lease_expires_at'):
+            # Never claimed: may simply be waiting in the task queue for a worker
+            queued = _queued_task_ids() if queued is None else queued
+            if task['id'] in queued:
+                continue
+        try:
+            if not leases.claim(task['id'], task.get('lease_expires_at')):
+                continue  # Another process got there first
+            outcome = _recover_task(task)
+        except Exception as e:
+            logger.error(f"❌ Failed to recover task {task['id']}: {e}")
+            outcome = 'skipped'
+        summary[outcome] += 1
+
+    if any(summary.values()):
+        logger.info(f"🩺 Task recovery finished: {summary}")
+    return summary
+
+
+def _queued_task_ids() -> set:
+    try:
+        return {entry['task_id'] for entry in DatabaseOperations.get_task_queue()}
+    except Exception as e:
+        logger.warning(f"⚠️  Could not read the task queue: {e}")
+        return set()
+
+
+def _recover_task(task: dict) -> str:
+    if task['status'] == 'pending' or not task.get('container_id'):
+        return _requeue(task, "never started")
+
+    try:
+        host = get_docker_pool().get(task.get('docker_host'))
+    except ValueError:
+        return _fail(task, f"Docker host '{task.get('docker_host')}' is no longer configured")
+
+    try:
+        container = host.client.containers.get(task['container_id'])
+    except docker.errors.NotFound:
+        return _fail(task, "Task container was lost while the server restarted")
+    except Exception as e:
+        # The host may only be down for a moment - leave the task for the next pass
+        logger.warning(f"⚠️  Cannot reach Docker host '{host.name}' for task {task['id']}: {e}")
+        leases.release(task['id'])
+        return 'skipped'
+
+    if host.monitor.is_watching(container.id):
+        return 'skipped'
+
+    if container.status == 'created':
+        # Created but never started - start over with a fresh container
+        container.remove(force=True)
+        return _requeue(task, "container never started")
+
+    _reattach(task, host, container)
+    return 'reattached'
+
+
+def _reattach(task: dict, host, container):
+    """Hand a container that outlived its executor to this process's completion monitor"""
+    task_id, user_id = task['id'], task['user_id']
+    host_config = container.attrs.get('HostConfig') or {}
+    resources = {
+        'memory_bytes': host_config.get('Memory') or DEFAULT_MEMORY_BYTES,
+        'cpus': (host_config.get('NanoCpus') or 0) / 1e9 or DEFAULT_CPUS,
+        'cpuset': host_config.get('CpusetCpus') or None,
+        'source': 'recovered',
+    }
+    get_docker_pool().claim(host.name, task_id, resources)
+
+    project = DatabaseOperations.get_project_by_id(task['project_id'], user_id) if task.get('project_id') else None
+    started_at = container.attrs.get('State', {}).get('StartedAt')
+    watchdog = Watchdog(
+        watchdog_limits(project.get('settings') if project else None),
+        started_at=parse_docker_timestamp(started_at) if started_at else None
+    )
+
+    sampler = ResourceSampler(container)
+    logger.info(f"🔌 Reattaching task {task_id} to container {container.id[:12]} on '{host.name}' (status: {container.status})")
+    host.monitor.watch(
+        container,
+        functools.partial(
+            _handle_container_exit,
+            task_id,
+            user_id,
+            task.get('agent', 'claude').upper(),
+            host.name,
+            task['repo_url'],
+            {'strategy': 'recovered', 'warm': False, 'host': host.name},
+            resources,
+            sampler
+        ),
+        watchdog=watchdog,
+        sampler=sampler
+    )
+
+
+def _requeue(task: dict, reason: str) -> str:
+    user = DatabaseOperations.get_user_by_id(task['user_id'])
+    github_token = user.get('github_token') if user else None
+    if not github_token:
+        return _fail(task, "Task was interrupted by a server restart and no stored GitHub token is available to restart it")
+
+    logger.info(f"🔁 Re-queueing task {task['id']} ({reason})")
+    DatabaseOperations.update_task(task['id'], task['user_id'], {
+        'status': 'pending',
+        'container_id': None,
+        'docker_host': None
+    })
+    _submit_task(task['id'], task['user_id'], github_token, repo_url=task['repo_url'], project_id=task.get('project_id'), priority=task.get('priority'))
+    return 'requeued'
+
+
+def _fail(task: dict, reason: str) -> str:
+    logger.warning(f"💀 Failing task {task['id']}: {reason}")
+    DatabaseOperations.update_task(task['id'], task['user_id'], {
+        'status': 'failed',
+        'error': reason,
+        'execution_metadata': dict(task.get('execution_metadata') or {}, exit_reason='lost')
+    })
+    return 'failed'
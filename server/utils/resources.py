@@ -0,0 +1,184 @@
+import logging
+import math
+import os
+import threading
+import time
+
+import docker
+
+from .stats import percentile
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MIB = 1024 ** 2
+
+# Limits used until a project has enough history
+DEFAULT_MEMORY_BYTES = docker.utils.parse_bytes(os.getenv('RESOURCE_DEFAULT_MEMORY', '2g'))
+DEFAULT_CPUS = float(os.getenv('RESOURCE_DEFAULT_CPUS', '1.0'))
+
+# Bounds for profile-derived limits
+MIN_MEMORY_BYTES = docker.utils.parse_bytes(os.getenv('RESOURCE_MIN_MEMORY', '512m'))
+MAX_MEMORY_BYTES = docker.utils.parse_bytes(os.getenv('RESOURCE_MAX_MEMORY', '8g'))
+MIN_CPUS = float(os.getenv('RESOURCE_MIN_CPUS', '0.5'))
+MAX_CPUS = float(os.getenv('RESOURCE_MAX_CPUS', '4.0'))
+
+# Limit = p95 of observed peaks * headroom; an OOM kill multiplies the old limit by the growth factor
+RESOURCE_HEADROOM = float(os.getenv('RESOURCE_HEADROOM', '1.5'))
+RESOURCE_OOM_GROWTH = float(os.getenv('RESOURCE_OOM_GROWTH', '2.0'))
+RESOURCE_PROFILE_MIN_SAMPLES = int(os.getenv('RESOURCE_PROFILE_MIN_SAMPLES', '3'))
+RESOURCE_PROFILE_HISTORY = int(os.getenv('RESOURCE_PROFILE_HISTORY', '20'))
+RESOURCE_PROFILE_TTL = float(os.getenv('RESOURCE_PROFILE_TTL', '300'))
+
+
+def format_bytes(value: int) -> str:
+    """Human readable size in Docker's notation, e.g. 1536m or 2g"""
+    if value and value % (1024 * MIB) == 0:
+        return f'{value // (1024 * MIB)}g'
+    return f'{math.ceil((value or 0) / MIB)}m'
+
+
+def parse_cpuset(spec: str) -> list:
+    """Parse a cpuset list such as ``0-3,8,10-11`` into sorted CPU ids"""
+    cpus = set()
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def build_resource_profile(history: list) -> dict:
+    """Derive memory and CPU limits from recent ``execution_metadata`` of a project's tasks.
+
+    Uses the 95th percentile of observed peaks plus headroom, rounded up to 64 MiB
+    and half a CPU. A recent OOM kill raises the memory floor above the limit it hit.
+    """
+    usage = [
+        metadata['resources'] for metadata in history
+        if (metadata or {}).get('resources', {}).get('peak_memory_bytes')
+    ]
+    oom_limits = [
+        metadata.get('resources', {}).get('limits', {}).get('memory_bytes') or DEFAULT_MEMORY_BYTES
+        for metadata in history
+        if (metadata or {}).get('exit_reason') == 'oom_killed'
+    ]
+
+    if len(usage) >= RESOURCE_PROFILE_MIN_SAMPLES:
+        memory = percentile([entry['peak_memory_bytes'] for entry in usage], 0.95) * RESOURCE_HEADROOM
+        cpus = percentile([entry.get('peak_cpus', 0) for entry in usage], 0.95) * RESOURCE_HEADROOM
+        source = 'profile'
+    else:
+        memory, cpus, source = DEFAULT_MEMORY_BYTES, DEFAULT_CPUS, 'default'
+
+    if oom_limits:
+        memory = max(memory, max(oom_limits) * RESOURCE_OOM_GROWTH)
+
+    memory = min(max(memory, MIN_MEMORY_BYTES), MAX_MEMORY_BYTES)
+    cpus = min(max(cpus, MIN_CPUS), MAX_CPUS)
+    return {
+        'memory_bytes': int(math.ceil(memory / (64 * MIB)) * 64 * MIB),
+        'cpus': math.ceil(cpus * 2) / 2,
+        'source': source,
+        'samples': len(usage),
+    }
+
+
+class ResourceProfiles:
+    """Per-project resource limits derived from task history, cached for ``RESOURCE_PROFILE_TTL``.
+
+    ``history_loader(project_id, repo_url, limit)`` returns recent ``execution_metadata``
+    dicts; tasks without a project are profiled by repository.
+    """
+
+    def __init__(self, history_loader, ttl: float = RESOURCE_PROFILE_TTL):
+        self.history_loader = history_loader
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def profile_key(project_id: int = None, repo_url: str = None) -> str:
+        return f'project:{project_id}' if project_id else f'repo:{repo_url or ""}'
+
+    def limits_for(self, project_id: int = None, repo_url: str = None) -> dict:
+        """Resource limits for the next task of a project; a fresh dict the caller may modify"""
+        key = self.profile_key(project_id, repo_url)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is None or time.time() - cached[0] > self.ttl:
+            try:
+                history = self.history_loader(project_id, repo_url, RESOURCE_PROFILE_HISTORY)
+                profile = build_resource_profile(history)
+            except Exception as e:
+                logger.warning(f"⚠️  Could not load resource history for {key}: {e}")
+                profile = build_resource_profile([])
+            with self._lock:
+                self._cache[key] = (time.time(), profile)
+            logger.info(f"📐 Resource profile for {key}: {format_bytes(profile['memory_bytes'])} / {profile['cpus']} CPUs ({profile['source']}, {profile['samples']} samples)")
+        else:
+            profile = cached[1]
+        return dict(profile, profile_key=key)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._cache.pop(key, None)
+
+
+class ResourceSampler:
+    """Keep peak memory/CPU usage of one container from periodic stats snapshots.
+
+    The completion monitor calls ``sample()`` on its sweep tick, so no thread is
+    parked on a stats stream per container; the async engine, which has no
+    container object, passes its own snapshots to ``record()``. ``summary()`` is
+    what gets stored under ``execution_metadata['resources']``.
+    """
+
+    def __init__(self, container=None):
+        self.container = container
+        self.peak_memory_bytes = 0
+        self.peak_cpus = 0.0
+        self._cpu_total = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Take one ``stats(stream=False)`` snapshot of the container"""
+        try:
+            self.record(self.container.stats(stream=False))
+        except Exception as e:
+            logger.warning(f"⚠️  Could not sample resources of container {self.container.id[:12]}: {e}")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'peak_memory_bytes': self.peak_memory_bytes,
+                'peak_cpus': round(self.peak_cpus, 3),
+                'avg_cpus': round(self._cpu_total / self.samples, 3) if self.samples else 0.0,
+                'samples': self.samples,
+            }
+
+    def record(self, stats: dict):
+        memory_stats = stats.get('memory_stats') or {}
+        # Page cache is reclaimable, so it does not count towards the working set
+        cache = (memory_stats.get('stats') or {}).get('inactive_file') or (memory_stats.get('stats') or {}).get('cache') or 0
+        memory = max(0, (memory_stats.get('usage') or 0) - cache)
+
+        cpu_stats = stats.get('cpu_stats') or {}
+        precpu_stats = stats.get('precpu_stats') or {}
+        cpu_delta = (cpu_stats.get('cpu_usage') or {}).get('total_usage', 0) - (precpu_stats.get('cpu_usage') or {}).get('total_usage', 0)
+        system_delta = (cpu_stats.get('system_cpu_usage') or 0) - (precpu_stats.get('system_cpu_usage') or 0)
+        online_cpus = cpu_stats.get('online_cpus') or len((cpu_stats.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+        cpus = cpu_delta / system_delta * online_cpus if cpu_delta > 0 and system_delta > 0 else 0.0
+
+        with self._lock:
+            self.peak_memory_bytes = max(self.peak_memory_bytes, memory)
+            self.peak_cpus = max(self.peak_cpus, cpus)
+            self._cpu_total += cpus
+            self.samples += 1
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import QUEUE_WAIT
+from .priorities import DEFAULT_PRIORITY, WeightedTurns, next_job
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class TaskScheduler:
+    """Queue of submitted tasks by priority class, dispatched as Docker host capacity frees up.
+
+    ``runner(job, host)`` is called on a small worker pool once a slot has been
+    reserved on ``host``; it owns the slot from then on and must release it via
+    the host pool when the task is finished (or fails to start).
+
+    Each class is FIFO. While several classes have tasks waiting, dispatches
+    alternate between them by weight (``utils/priorities.py``), and a waiting task
+    moves up a class every ``PRIORITY_AGING_SECONDS`` so batch work keeps moving.
+    With ``quotas`` (a ``QuotaManager``) jobs of users or projects at a limit are
+    passed over without holding up the rest.
+    """
+
+    def __init__(self, pool, runner, max_workers: int = None, quotas=None):
+        self.pool = pool
+        self.runner = runner
+        self.quotas = quotas
+        self._queue = deque()  # Every class, in submission order
+        self._turns = WeightedTurns()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('SCHEDULER_WORKERS', '8')),
+            thread_name_prefix='task-dispatch'
+        )
+        self._thread = None
+        self.pool.add_release_listener(self.notify)
+
+    def start(self):
+        """Start the dispatcher thread (idempotent)"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._dispatch_loop, name='task-scheduler', daemon=True)
+            self._thread.start()
+        self.pool.start_health_checks()
+        logger.info("🗓️  Task scheduler started")
+
+    def submit(self, task_id: int, user_id: str, github_token: str, repo_url: str = None, resources: dict = None, trace_context: dict = None,
+               project_id: int = None, priority: str = DEFAULT_PRIORITY, queued_at: float = None) -> dict:
+        """Queue a task for execution; ``repo_url`` enables repo-affinity placement,
+        ``resources`` (memory/CPU limits) resource-aware admission, ``project_id``
+        per-project quotas and ``trace_context`` lets the run continue the
+        submitting request's trace. ``queued_at`` (epoch seconds) is when the task
+        started waiting, if earlier than now (e.g. in the shared task queue)."""
+        self.start()
+        job = {
+            'task_id': task_id,
+            'user_id': user_id,
+            'project_id': project_id,
+            'priority': priority or DEFAULT_PRIORITY,
+            'github_token': github_token,
+            'repo_url': repo_url,
+            'resources': resources,
+            'trace_context': trace_context,
+            'queued_at': queued_at or time.time(),
+        }
+        with self._cond:
+            self._queue.append(job)
+            depth = len(self._queue)
+            self._cond.notify()
+        logger.info(f"📋 Queued {job['priority']} task {task_id} (queue depth: {depth})")
+        return job
+
+    def notify(self):
+        """Wake the dispatcher, e.g. after a host slot was released"""
+        with self._cond:
+            self._cond.notify()
+
+    def cancel(self, task_id: int) -> bool:
+        """Drop a task that is still waiting in the queue; False if it was already dispatched"""
+        with self._cond:
+            for job in self._queue:
+                if job['task_id'] == task_id:
+                    self._queue.remove(job)
+                    logger.info(f"🛑 Removed task {task_id} from the queue")
+                    return True
+        return False
+
+    def drain(self) -> list:
+        """Remove and return every job still waiting for a host, e.g. to hand them to another process"""
+        with self._cond:
+            jobs = list(self._queue)
+            self._queue.clear()
+        return jobs
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job, eligible = self._next_job()
+                if job is None:
+                    # Every queued task's owner is at a quota - wait for a release or for budgets to refill
+                    self._cond.wait(timeout=1.0)
+                    continue
+                host = self.pool.acquire(job)
+                if host is None:
+                    # Every host is full, unhealthy or short on memory/CPU - wait for a release or health change
+                    self._cond.wait(timeout=1.0)
+                    continue
+                self._queue.remove(job)
+                self._turns.commit(job['dispatch_class'], eligible)
+                if self.quotas is not None:
+                    self.quotas.started(job)
+
+            wait_time = time.time() - job['queued_at']
+            QUEUE_WAIT.labels(job['priority']).observe(wait_time)
+            aged = f" (aged to {job['dispatch_class']})" if job['dispatch_class'] != job['priority'] else ''
+            logger.info(f"🚚 Dispatching {job['priority']} task {job['task_id']}{aged} to host '{host.name}' after {wait_time:.2f}s in queue")
+            self._executor.submit(self._run, job, host)
+
+    def _next_job(self):
+        """The job to dispatch next and the classes that had one ready (called with the lock held)"""
+        return next_job(self._queue, self._turns, self.quotas)
+
+    def _run(self, job: dict, host):
+        try:
+            self.runner(job, host)
+        except Exception as e:
+            logger.error(f"❌ Runner failed for task {job['task_id']}: {e}")
+            self.pool.release(host.name, job['task_id'])
@@ -0,0 +1,167 @@
+"""File snapshots stored as a base blob plus the task's diff.
+
+A changed file is recorded by the git blob ids of its old and new versions.
+Old versions are kept once per blob id in the ``file_blobs`` table, so a file
+that many tasks touch is stored once, and the new version is rebuilt on
+demand by applying the file's section of the task diff to the old one. Blob
+ids double as checksums: a rebuilt file whose id does not match is discarded.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from database import DatabaseOperations
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Files larger than this (before or after the change) are summarized, not captured
+SNAPSHOT_MAX_BYTES = int(os.getenv('FILE_SNAPSHOT_MAX_BYTES', str(1024 * 1024)))
+
+# Memory for loaded and rebuilt file versions, shared by all tasks (least recently used are evicted first)
+SNAPSHOT_CACHE_BYTES = int(os.getenv('SNAPSHOT_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@')
+
+
+def blob_sha(text: str) -> str:
+    """Git blob id of ``text`` (what ``git hash-object`` prints for it)"""
+    data = text.encode()
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def _lines(text: str) -> list:
+    """Lines of ``text`` with their newlines, without splitting on anything but \\n"""
+    parts = text.split('\n')
+    lines = [part + '\n' for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def apply_patch(before: str, section: str) -> str:
+    """Apply one file's section of a unified git diff to its old content.
+
+    Raises ValueError when a context or removed line does not match ``before``.
+    """
+    source = _lines(before)
+    result = []
+    position = 0
+    previous = None  # tag of the last hunk line; None before the first hunk
+    for line in section.split('\n'):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            start, count = int(header.group(1)), header.group(2)
+            # A hunk that only adds lines names the line it follows, not the first line it covers
+            start = start if count == '0' else start - 1
+            if start < position:
+                raise ValueError(f"Hunk at line {start + 1} overlaps the previous one")
+            result.extend(source[position:start])
+            position = start
+            previous = '@'
+        elif previous is None:
+            continue  # extended header lines
+        elif line.startswith((' ', '-')):
+            if position >= len(source) or source[position].rstrip('\n') != line[1:]:
+                raise ValueError(f"Line {position + 1} does not match the diff")
+            if line[0] == ' ':
+                result.append(source[position])
+            position += 1
+            previous = line[0]
+        elif line.startswith('+'):
+            result.append(line[1:] + '\n')
+            previous = '+'
+        elif line.startswith('\\') and previous in (' ', '+'):
+            # "\ No newline at end of file" applies to the line before it
+            result[-1] = result[-1][:-1] if result[-1].endswith('\n') else result[-1]
+    result.extend(source[position:])
+    return ''.join(result)
+
+
+class SnapshotCache:
+    """File versions by blob id, bounded by their total size"""
+
+    def __init__(self, max_bytes: int = SNAPSHOT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # blob id -> text
+        self._lock = threading.Lock()
+
+    def get(self, sha: str):
+        with self._lock:
+            text = self._entries.get(sha)
+            if text is not None:
+                self._entries.move_to_end(sha)
+            return text
+
+    def put(self, sha: str, text: str):
+        if len(text) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(sha, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[sha] = text
+            self.size += len(text)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+snapshot_cache = SnapshotCache()
+
+
+def store_blobs(blobs: dict) -> bool:
+    """Persist old file versions by blob id; False when they could not be saved"""
+    if not blobs:
+        return True
+    for sha, text in blobs.items():
+        snapshot_cache.put(sha, text)
+    try:
+        DatabaseOperations.save_file_blobs(blobs)
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Could not store {len(blobs)} file blobs: {e}")
+        return False
+
+
+def load_blob(sha: str):
+    """Content of blob ``sha``, from memory or the ``file_blobs`` table; None when unknown"""
+    if not sha:
+        return ''
+    text = snapshot_cache.get(sha)
+    if text is None:
+        try:
+            text = DatabaseOperations.get_file_blobs([sha]).get(sha)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load file blob {sha[:12]}: {e}")
+            return None
+        if text is not None:
+            snapshot_cache.put(sha, text)
+    return text
+
+
+def rebuild(base_blob: str, blob: str, section: str):
+    """New version ``blob`` of a file from its old version and diff section; None when it cannot be rebuilt"""
+    if not blob:
+        return ''
+    text = snapshot_cache.get(blob)
+    if text is not None:
+        return text
+    before = load_blob(base_blob)
+    if before is None:
+        return None
+    try:
+        text = apply_patch(before, section)
+    except ValueError as e:
+        logger.warning(f"⚠️ Could not rebuild blob {blob[:12]}: {e}")
+        return None
+    if blob_sha(text) != blob:
+        logger.warning(f"⚠️ Rebuilt file does not match blob {blob[:12]}; showing its diff only")
+        return None
+    snapshot_cache.put(blob, text)
+    return text
@@ -0,0 +1,8 @@
+import math
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of ``values`` (``fraction`` between 0 and 1)"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
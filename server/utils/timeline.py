@@ -0,0 +1,78 @@
+import logging
+
+from .stats import percentile
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Emitted by the task runner (task-runner.sh) when a phase ends: "=== TIMING: <phase> <start_ms> <end_ms> ==="
+# Its ``timing_mark <phase>`` closes the open phase and opens the next one; an EXIT trap closes
+# the last phase, so a failing task still reports where it spent its time.
+TIMING_MARKER = '=== TIMING: '
+
+
+def parse_timeline(logs: str) -> list:
+    """Timing records in container output as ``[{phase, offset_seconds, duration_seconds}]``"""
+    records = []
+    # Jump between markers instead of splitting what may be a very large log into lines
+    position = logs.find(TIMING_MARKER)
+    while position >= 0:
+        line_end = logs.find('\n', position)
+        if line_end < 0:
+            line_end = len(logs)
+        at_line_start = position == 0 or logs[position - 1] == '\n'
+        line = logs[position:line_end].strip()
+        position = logs.find(TIMING_MARKER, line_end)
+        if not at_line_start:
+            continue
+        try:
+            phase, started_ms, ended_ms = line[len(TIMING_MARKER):].strip(' =').split()
+            records.append((phase, int(started_ms), int(ended_ms)))
+        except ValueError:
+            logger.warning(f"⚠️  Ignoring malformed timing record: {line[:200]}")
+
+    if not records:
+        return []
+    origin = records[0][1]
+    return [
+        {
+            'phase': phase,
+            'offset_seconds': round((started_ms - origin) / 1000, 3),
+            'duration_seconds': round(max(0, ended_ms - started_ms) / 1000, 3)
+        }
+        for phase, started_ms, ended_ms in records
+    ]
+
+
+def timeline_durations(timeline: list) -> dict:
+    """Seconds per phase of one task's timeline"""
+    durations = {}
+    for record in timeline:
+        durations[record['phase']] = durations.get(record['phase'], 0) + record['duration_seconds']
+    return durations
+
+
+def summarize_timelines(timelines: list) -> dict:
+    """Aggregate the timelines of many tasks into per-phase statistics.
+
+    Phases are listed in the order they run; ``share`` is the phase's fraction of
+    the summed time of all phases, i.e. where the project's tasks spend their time.
+    """
+    per_phase = {}
+    for timeline in timelines:
+        for phase, seconds in timeline_durations(timeline).items():
+            per_phase.setdefault(phase, []).append(seconds)
+
+    total = sum(sum(values) for values in per_phase.values())
+    phases = {}
+    for phase, values in per_phase.items():
+        phases[phase] = {
+            'count': len(values),
+            'mean_seconds': round(sum(values) / len(values), 3),
+            'p50_seconds': percentile(values, 0.5),
+            'p95_seconds': percentile(values, 0.95),
+            'max_seconds': max(values),
+            'share': round(sum(values) / total, 3) if total else 0.0
+        }
+    return {'tasks': len(timelines), 'phases': phases}
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Echoed by the task runner (task-runner.sh) when it enters a phase, e.g. "=== PHASE: agent ==="
+PHASE_MARKER = '=== PHASE: '
+
+# Default limits in seconds; a project overrides them in settings['watchdog'] (0 disables one)
+DEFAULT_WATCHDOG_LIMITS = {
+    'total_seconds': int(os.getenv('WATCHDOG_TOTAL_SECONDS', '1800')),
+    'inactivity_seconds': int(os.getenv('WATCHDOG_INACTIVITY_SECONDS', '300')),
+    'clone_seconds': int(os.getenv('WATCHDOG_CLONE_SECONDS', '600')),
+    'agent_seconds': int(os.getenv('WATCHDOG_AGENT_SECONDS', '1500')),
+    'extraction_seconds': int(os.getenv('WATCHDOG_EXTRACTION_SECONDS', '300')),
+}
+
+
+def watchdog_limits(project_settings: dict = None) -> dict:
+    """Default limits overlaid with a project's ``settings['watchdog']``"""
+    limits = dict(DEFAULT_WATCHDOG_LIMITS)
+    overrides = (project_settings or {}).get('watchdog') or {}
+    for key, value in overrides.items():
+        if key in limits:
+            try:
+                limits[key] = int(value)
+            except (TypeError, ValueError):
+                logger.warning(f"⚠️  Ignoring invalid watchdog limit {key}={value!r}")
+    return limits
+
+
+def parse_docker_timestamp(value: str) -> float:
+    """Docker's RFC3339Nano timestamp (logs, container state) as epoch seconds"""
+    value = value.rstrip('Z')
+    if '.' in value:
+        head, fraction = value.split('.', 1)
+        value = f'{head}.{fraction[:6]}'
+    return datetime.fromisoformat(value + '+00:00').timestamp()
+
+
+def describe_deadline(fired: dict) -> str:
+    """Human readable reason for a fired deadline"""
+    phase = f" during the {fired['phase']} phase" if fired.get('phase') else ''
+    if fired['deadline'] == 'inactivity':
+        return f"produced no output for {fired['limit_seconds']}s{phase}"
+    if fired['deadline'].startswith('phase:'):
+        return f"exceeded the {fired['limit_seconds']}s limit for the {fired['phase']} phase"
+    return f"timed out after {fired['limit_seconds']}s{phase}"
+
+
+class Watchdog:
+    """Hierarchical deadlines for one task container.
+
+    The whole run is bounded by ``total_seconds``, each phase by its own
+    ``<phase>_seconds`` counted from its marker, and the container is
+    considered stalled after ``inactivity_seconds`` without any output.
+    Output is fed in by ``observe()`` with timestamped log chunks; the monitor's
+    sweep and completion threads may call in concurrently.
+    """
+
+    def __init__(self, limits: dict, started_at: float = None):
+        self.limits = limits
+        self.started_at = started_at or time.time()
+        self.last_output_at = self.started_at
+        self.phase = None
+        self.phase_started_at = self.started_at
+        self.log_cursor = None  # Daemon timestamp of the last log line seen
+        self._last_line = None
+        self.phase_marks = []  # (phase, timestamp of its marker line)
+        self.last_line_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def follows_output(self) -> bool:
+        """Whether deadlines depend on the container's output"""
+        return any(self.limits.get(key) for key in self.limits if key != 'total_seconds')
+
+    def observe(self, chunk: str, now: float = None):
+        """Record a chunk of ``docker logs --timestamps`` output"""
+        now = now or time.time()
+        with self._lock:
+            self._observe(chunk, now)
+
+    def _observe(self, chunk: str, now: float):
+        for line in chunk.splitlines():
+            timestamp, _, text = line.partition(' ')
+            try:
+                line_time = parse_docker_timestamp(timestamp)
+            except ValueError:
+                line_time, text = None, line
+            if line_time is not None:
+                # `docker logs --since` is inclusive, so the last line seen comes back again
+                if self.log_cursor is not None and (line_time < self.log_cursor or (line_time == self.log_cursor and line == self._last_line)):
+                    continue
+                self.log_cursor = line_time
+                self._last_line = line
+            self.last_output_at = now
+            self.last_line_at = line_time or now
+            text = text.strip()
+            if text.startswith(PHASE_MARKER):
+                phase = text[len(PHASE_MARKER):].strip(' =')
+                if phase != self.phase:
+                    self.phase_marks.append((phase, self.last_line_at))
+                    logger.info(f"⏱️  Container entered phase '{phase}' after {now - self.started_at:.0f}s")
+                    self.phase = phase
+                    self.phase_started_at = now
+
+    def phase_durations(self) -> dict:
+        """Seconds spent in each phase seen so far, measured between marker lines (daemon clock)"""
+        durations = {}
+        with self._lock:
+            for index, (phase, started_at) in enumerate(self.phase_marks):
+                ended_at = self.phase_marks[index + 1][1] if index + 1 < len(self.phase_marks) else self.last_line_at
+                durations[phase] = round(max(0.0, ended_at - started_at), 3)
+        return durations
+
+    def expired(self, now: float = None):
+        """The first deadline that has passed, as a dict for ``execution_metadata['watchdog']``, or None"""
+        now = now or time.time()
+        with self._lock:
+            return self._expired(now)
+
+    def _expired(self, now: float):
+        checks = [
+            ('total', self.limits.get('total_seconds'), now - self.started_at),
+            (f'phase:{self.phase}', self.limits.get(f'{self.phase}_seconds') if self.phase else None, now - self.phase_started_at),
+            ('inactivity', self.limits.get('inactivity_seconds'), now - self.last_output_at),
+        ]
+        for deadline, limit, elapsed in checks:
+            if limit and elapsed > limit:
+                return {
+                    'deadline': deadline,
+                    'phase': self.phase,
+                    'limit_seconds': limit,
+                    'elapsed_seconds': round(elapsed, 1),
+                    'runtime_seconds': round(now - self.started_at, 1),
+                }
+        return None
@@ -0,0 +1,56 @@
+"""Task worker: runs queued tasks and serves no API.
+
+    python worker.py
+
+API processes started with EXECUTION_MODE=queue only enqueue tasks; any number
+of workers take them from the shared queue and run them (see utils/intake.py).
+Each worker serves /ping, /health and /metrics on WORKER_PORT for health checks.
+"""
+import logging
+import os
+import signal
+import sys
+
+from dotenv import load_dotenv
+from flask import Flask
+from werkzeug.serving import make_server
+
+load_dotenv()
+
+from health import health_bp
+from utils.intake import QueueConsumer
+from utils.leases import release_leases
+from utils.recovery import start_task_recovery
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+app.config['PROCESS_ROLE'] = 'worker'
+app.register_blueprint(health_bp)
+
+consumer = QueueConsumer()
+
+
+def shutdown(signum, frame):
+    # Tasks still waiting for a slot go back to the queue; running containers are
+    # taken over by another worker's recovery once the leases are released
+    logger.info("🛑 Worker stopping")
+    consumer.stop()
+    consumer.hand_back()
+    release_leases()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    if os.getenv('RECOVER_TASKS_ON_STARTUP', 'true').lower() == 'true':
+        start_task_recovery()
+    consumer.start()
+
+    port = int(os.getenv('WORKER_PORT', '5001'))
+    logger.info(f"👷 Worker ready, health checks on port {port}")
+    make_server('0.0.0.0', port, app, threaded=True).serve_forever()
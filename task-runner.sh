@@ -0,0 +1,210 @@
+#!/bin/bash
+# Task runner baked into the claude-code-automation image (Dockerfile.claude-automation).
+#
+# The server starts every task container with this script as its command and passes the task
+# in the environment:
+#   TASK_RUNNER_VERSION      runner version the server expects; a different one fails the task
+#   TASK_REPO_URL            https://github.com/<owner>/<repo>(.git)
+#   TASK_GITHUB_TOKEN        token used to clone (optional)
+#   TASK_BRANCH              branch to clone
+#   TASK_PROMPT              prompt for Claude Code
+#   TASK_CLAUDE_CREDENTIALS  contents of ~/.claude/.credentials.json (optional)
+#   TASK_REPO_CACHE          1 to clone through the repository mirror mounted at /cache
+#   TASK_SNAPSHOT_MAX_BYTES  files larger than this are summarized instead of printed
+#   TASK_RUNNER_DEBUG        1 to print the environment and run Claude Code with --debug
+#
+# Its output is read by the server: phase and timing markers (utils/watchdog.py,
+# utils/timeline.py), agent events (utils/agent_stream.py) and the result sections
+# (utils/output_parser.py) must stay in sync with it.
+# Bump RUNNER_VERSION (and TASK_RUNNER_VERSION in utils/code_task_v2.py) when that contract changes.
+
+RUNNER_VERSION=2
+NULL_BLOB=0000000000000000000000000000000000000000
+SNAPSHOT_MAX_BYTES=${TASK_SNAPSHOT_MAX_BYTES:-1048576}
+
+# Claude Code command resolved when the image was built
+CLAUDE_CLI=claude
+[ -f /etc/task-runner.conf ] && . /etc/task-runner.conf
+
+# Epoch milliseconds from bash's own clock ($EPOCHREALTIME, microseconds after a locale-dependent
+# separator); busybox and other minimal ``date`` builds have no sub-second %N
+now_ms() {
+    local micros=${EPOCHREALTIME//[!0-9]/}
+    echo $(( micros / 1000 ))
+}
+
+# ``timing_mark <phase>`` closes the open phase (printing its record) and opens the next one;
+# the EXIT trap closes the last phase, so a failing task still reports where it spent its time
+TIMING_PHASE=""
+TIMING_STARTED=0
+timing_mark() {
+    local now=$(now_ms)
+    if [ -n "$TIMING_PHASE" ]; then
+        echo "=== TIMING: $TIMING_PHASE $TIMING_STARTED $now ==="
+    fi
+    TIMING_PHASE="$1"
+    TIMING_STARTED=$now
+}
+trap 'timing_mark ""' EXIT
+
+timing_mark env
+if [ -n "$TASK_RUNNER_VERSION" ] && [ "$TASK_RUNNER_VERSION" != "$RUNNER_VERSION" ]; then
+    echo "ERROR: the server expects task runner version $TASK_RUNNER_VERSION but this image has version $RUNNER_VERSION; rebuild claude-code-automation:latest"
+    exit 64
+fi
+
+if [ "$TASK_RUNNER_DEBUG" = 1 ]; then
+    echo "Task runner $RUNNER_VERSION, Claude Code: $CLAUDE_CLI ($($CLAUDE_CLI --version 2>&1 </dev/null))"
+    # One line per variable (%q escapes newlines), secrets by length only
+    for name in $(compgen -e | sort); do
+        value="${!name}"
+        case "$name" in
+            ANTHROPIC_API_KEY|TASK_GITHUB_TOKEN|TASK_CLAUDE_CREDENTIALS) echo "$name=(${#value} characters)" ;;
+            *) printf '%s=%q\n' "$name" "$value" ;;
+        esac
+    done
+fi
+
+set -e
+echo "=== PHASE: clone ==="
+timing_mark clone
+echo "Setting up repository..."
+
+CLONE_URL="$TASK_REPO_URL"
+if [ -n "$TASK_GITHUB_TOKEN" ]; then
+    CLONE_URL="${TASK_REPO_URL/https:\/\/github.com\//https://$TASK_GITHUB_TOKEN@github.com/}"
+fi
+
+# Refresh this host's mirror of the repository (one updater at a time) and clone through it
+CLONE_REFERENCE=()
+if [ "$TASK_REPO_CACHE" = 1 ]; then
+    CLONE_REFERENCE=(--reference-if-able /cache/repo.git)
+    find /cache -maxdepth 1 -name .lock -mmin +30 -exec rmdir {} \; 2>/dev/null || true
+    if mkdir /cache/.lock 2>/dev/null; then
+        if [ -d /cache/repo.git ]; then
+            echo "♻️  Refreshing repository cache..."
+            git -C /cache/repo.git fetch --prune "$CLONE_URL" '+refs/heads/*:refs/heads/*' || echo "⚠️  Repository cache refresh failed"
+        else
+            echo "📥 Populating repository cache..."
+            rm -rf /cache/repo.git.tmp
+            if git clone --mirror "$CLONE_URL" /cache/repo.git.tmp; then
+                git -C /cache/repo.git.tmp remote set-url origin "$TASK_REPO_URL"
+                mv /cache/repo.git.tmp /cache/repo.git
+            else
+                rm -rf /cache/repo.git.tmp
+                echo "⚠️  Repository cache population failed"
+            fi
+        fi
+        rmdir /cache/.lock
+    fi
+fi
+
+git clone "${CLONE_REFERENCE[@]}" -b "$TASK_BRANCH" "$CLONE_URL" /workspace/repo
+cd /workspace/repo
+git config user.email "claude-code@automation.com"
+git config user.name "Claude Code Automation"
+
+echo "=== PHASE: agent ==="
+timing_mark credentials
+if [ -n "$TASK_CLAUDE_CREDENTIALS" ]; then
+    mkdir -p ~/.claude
+    printf '%s\n' "$TASK_CLAUDE_CREDENTIALS" > ~/.claude/.credentials.json
+    echo "✅ Claude credentials configured"
+fi
+
+# Claude Code reports its run as one JSON event per line (stream-json); each event is
+# prefixed with the time it arrived (now_ms, the clock of the phase marks), for the server's turn, tool and token accounting
+# (utils/agent_stream.py). Anything else it prints (errors, --debug output) passes through.
+agent_events() {
+    local line
+    while IFS= read -r line; do
+        case "$line" in
+            '{'*) echo "=== AGENT EVENT: $(now_ms) $line" ;;
+            *) echo "$line" ;;
+        esac
+    done
+}
+
+timing_mark agent
+echo "Starting Claude Code..."
+CLAUDE_FLAGS=(--print --output-format stream-json --verbose --allowedTools "Edit,Bash")
+[ "$TASK_RUNNER_DEBUG" = 1 ] && CLAUDE_FLAGS+=(--debug)
+set +e
+printf '%s\n' "$TASK_PROMPT" | $CLAUDE_CLI "${CLAUDE_FLAGS[@]}" 2>&1 | agent_events
+CLAUDE_EXIT_CODE=${PIPESTATUS[1]}
+set -e
+echo "Claude Code finished with exit code: $CLAUDE_EXIT_CODE"
+if [ $CLAUDE_EXIT_CODE -ne 0 ]; then
+    echo "ERROR: Claude Code failed with exit code $CLAUDE_EXIT_CODE"
+    exit $CLAUDE_EXIT_CODE
+fi
+
+echo "=== PHASE: extraction ==="
+timing_mark commit
+echo "=== OUTPUT FORMAT: 3 ==="
+
+git add -A
+if git diff --cached --quiet; then
+    echo "ℹ️  No changes made by Claude - this is a valid outcome"
+    echo "=== PATCH START ==="
+    echo "No changes were made"
+    echo "=== PATCH END ==="
+    echo "=== GIT DIFF START ==="
+    echo "No changes were made"
+    echo "=== GIT DIFF END ==="
+    echo "=== CHANGED FILES START ==="
+    echo "No files were changed"
+    echo "=== CHANGED FILES END ==="
+    echo "=== FILE CHANGES START ==="
+    echo "No file changes to display"
+    echo "=== FILE CHANGES END ==="
+    echo "COMMIT_HASH="
+    exit 0
+fi
+
+git commit -q -m "Claude: ${TASK_PROMPT:0:100}"
+echo "COMMIT_HASH=$(git rev-parse HEAD)"
+
+# Patch for the pull request, diff for display and the list of changed files
+timing_mark format_patch
+echo "=== PATCH START ==="
+git format-patch HEAD~1 --stdout
+echo "=== PATCH END ==="
+
+timing_mark diff
+echo "=== GIT DIFF START ==="
+git diff HEAD~1 HEAD
+echo "=== GIT DIFF END ==="
+
+echo "=== CHANGED FILES START ==="
+git diff --name-only HEAD~1 HEAD
+echo "=== CHANGED FILES END ==="
+
+# Blob ids and sizes of each changed file, plus its old content when the server needs it
+# to rebuild the new one (new versions are rebuilt from the diff, never printed)
+timing_mark file_changes
+echo "=== FILE CHANGES START ==="
+git diff --raw --no-abbrev HEAD~1 HEAD | while IFS=$'\t' read -r meta path new_path; do
+    set -- $meta
+    base_blob=$3
+    blob=$4
+    change=$(echo "$5" | cut -c1)
+    file=${new_path:-$path}
+    base_size=0
+    size=0
+    binary=0
+    [ "$base_blob" != "$NULL_BLOB" ] && base_size=$(git cat-file -s "$base_blob")
+    [ "$blob" != "$NULL_BLOB" ] && size=$(git cat-file -s "$blob")
+    case "$(git diff --numstat HEAD~1 HEAD -- "$file" | head -n 1)" in -*) binary=1 ;; esac
+    echo "FILE: $file"
+    echo "SNAPSHOT: $change $base_blob $blob $base_size $size $binary"
+    if [ "$base_blob" != "$NULL_BLOB" ] && [ "$binary" = 0 ] && [ "$base_size" -le "$SNAPSHOT_MAX_BYTES" ] && [ "$size" -le "$SNAPSHOT_MAX_BYTES" ]; then
+        echo "=== BEFORE START ==="
+        # Every line is prefixed with "|" so file contents can never be taken for a marker
+        git cat-file blob "$base_blob" | awk '{print "|" $0}'
+        echo "=== BEFORE END ==="
+    fi
+    echo "=== FILE END ==="
+done
+echo "=== FILE CHANGES END ==="
+echo "Container work completed successfully"